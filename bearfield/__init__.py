@@ -2,6 +2,7 @@ from __future__ import absolute_import
 from .connection import Connection, configure
 from .document import Document
 from .errors import (
+    BulkError,
     ConfigError,
     DocumentError,
     EncodingError,
@@ -10,11 +11,14 @@ from .errors import (
     ValidationError,
 )
 from .field import Field
-from .query import Q, Query
+from .identity import IdentityMap, identity_map
+from .query import Param, Q, Query
 from .reference import Reference
+from .session import Session, session
 from bson import ObjectId
 
 __all__ = [
+    'BulkError',
     'ConfigError',
     'Connection',
     'Document',
@@ -22,11 +26,16 @@ __all__ = [
     'EncodingError',
     'Error',
     'Field',
+    'IdentityMap',
     'ObjectId',
     'OperationError',
+    'Param',
     'Q',
     'Query',
     'Reference',
+    'Session',
     'ValidationError',
     'configure',
+    'identity_map',
+    'session',
 ]
@@ -0,0 +1,338 @@
+"""
+Asyncio support for documents, cursors, and references. Requires Python 3.6 or later and Motor.
+PyMongo's own AsyncMongoClient is not supported as it requires PyMongo 4.10 or later while the
+blocking methods require PyMongo 3. The async methods use the same encoders and decoders as the
+blocking methods and share their connection configuration.
+"""
+from . import identity
+from .cache import decode_result, encode_result
+from .chunking import find_chunked_field, merge, split_criteria
+from .errors import ConfigError, OperationError
+from .query import make_query
+from .utils import chunks, get_projection
+from itertools import islice
+from pymongo import ReturnDocument
+from pymongo.errors import AutoReconnect
+import asyncio
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:  # pragma: no cover
+    AsyncIOMotorClient = None
+
+
+def create_client(uri, **options):
+    """Return a new Motor client. Raise ConfigError if Motor is not installed."""
+    if AsyncIOMotorClient is None:
+        raise ConfigError("motor is required for asyncio support")
+    return AsyncIOMotorClient(uri, **options)
+
+
+async def autoreconnect(connection, func, *args, **kwargs):
+    """
+    Await func with the provided args. Retry when the driver raises AutoReconnect using the
+    connection's retries and backoff. Unlike Connection.autoreconnect this sleeps without blocking
+    the event loop.
+    """
+    tries = 0
+    while True:
+        try:
+            return await func(*args, **kwargs)
+        except AutoReconnect:
+            if tries >= connection.retries:
+                raise
+        await asyncio.sleep(tries * connection.backoff)
+        tries += 1
+
+
+async def fetch_cached(cache, key, load, codec_options):
+    """
+    Return the result cached for key in a QueryCache decoded using codec_options. If the result is
+    not cached or has expired it is loaded by awaiting load(). Stale results are reloaded on a
+    separate task.
+    """
+    found = cache.lookup(key)
+    if found is not None:
+        value, stale = found
+        if stale and cache.start_refresh(key):
+            asyncio.ensure_future(refresh_cached(cache, key, load))
+        return decode_result(value, codec_options)
+    return decode_result(await load_cached(cache, key, load), codec_options)
+
+
+async def load_cached(cache, key, load):
+    """Await load() and store its result for key in a QueryCache. Return the encoded result."""
+    generation = cache.get_generation(key)
+    value = encode_result(await load())
+    cache.store(key, generation, value)
+    return value
+
+
+async def refresh_cached(cache, key, load):
+    """Reload the result for key in a QueryCache which has been marked as reloading."""
+    try:
+        await load_cached(cache, key, load)
+    finally:
+        cache.finish_refresh(key)
+
+
+class AsyncDocument(object):
+    """Asyncio methods for Document."""
+    __slots__ = ()
+
+    @classmethod
+    async def afind_one(cls, query=None, fields=None, connection=None, raw=None, sort=None,
+                        **options):
+        """
+        Query the database for a single document. Return the document or None if not found.
+        Arguments are the same as Document.find_one(). Each asyncio task has its own active
+        identity map.
+        """
+        proxy = cls._meta.get_collection(connection)
+        fields = cls._meta.get_partial(fields)
+        options.pop('manipulate', None)
+        criteria = make_query(query).encode(cls, raw)
+        mapped = not fields and connection is None and not options and \
+            identity.current() is not None
+        if mapped:
+            _id = identity.get_id(criteria)
+            doc = identity.get(cls, _id) if _id is not None else None
+            if doc is not None:
+                return doc
+        if not raw:
+            sort = cls._meta.sort_encoder.encode(sort)
+        collection = proxy.async_collection
+        raw = await autoreconnect(proxy._connection, collection.find_one, criteria,
+                                  projection=get_projection(fields), sort=sort, **options)
+        doc = cls._decode(raw, fields, copy=False)
+        if mapped and doc is not None:
+            identity.add(doc)
+        return doc
+
+    @classmethod
+    async def acount(cls, connection=None):
+        """Count the number of objects in this collection."""
+        proxy = cls._meta.get_collection(connection)
+        return await autoreconnect(proxy._connection, proxy.async_collection.count_documents, {})
+
+    async def asave(self, connection=None, **options):
+        """
+        Save the document to the database. Insert the document if its _id field is None and
+        replace the stored document otherwise. Additional args are passed to the driver's
+        insert_one() or replace_one(). Return self for assignment.
+        """
+        if self._meta.disable_save:
+            msg = "saves to {} are disabled".format(self.__class__.__name__)
+            raise OperationError(msg)
+
+        if self._partial:
+            raise OperationError("unable to save partial document")
+
+        proxy = self._meta.get_collection(connection)
+        collection = proxy.async_collection
+        raw = self._encode()
+        self._validate(raw, self._partial)
+        if raw.get('_id') is None:
+            res = await autoreconnect(proxy._connection, collection.insert_one, raw, **options)
+            raw['_id'] = res.inserted_id
+        else:
+            await autoreconnect(proxy._connection, collection.replace_one, {'_id': raw['_id']},
+                                raw, upsert=True, **options)
+        self._reset(raw)
+        self._remember(connection)
+        return self
+
+    async def ainsert(self, connection=None, **options):
+        """
+        Insert the document. This ignores the state of the _id field and forces an insert.
+        Additional args are passed to the driver's insert_one(). Return self for assignment.
+        """
+        if self._meta.disable_insert:
+            msg = "inserts to {} are disabled".format(self.__class__.__name__)
+            raise OperationError(msg)
+
+        proxy = self._meta.get_collection(connection)
+        raw = self._encode()
+        self._validate(raw, self._partial)
+        res = await autoreconnect(proxy._connection, proxy.async_collection.insert_one, raw,
+                                  **options)
+        raw['_id'] = res.inserted_id
+        self._reset(raw)
+        self._remember(connection)
+        return self
+
+    async def aupdate(self, update=None, connection=None, raw=None, sort=None, fetch=None,
+                      **options):
+        """
+        Update the document in the database. Arguments and return value are the same as
+        Document.update().
+        """
+        if self._meta.disable_update:
+            msg = "updates to {} are disabled".format(self.__class__.__name__)
+            raise OperationError(msg)
+
+        if not self._id:
+            raise OperationError("unable to update document without an _id")
+
+        proxy = self._meta.get_collection(connection)
+        collection = proxy.async_collection
+        acknowledged = collection.write_concern.acknowledged
+        if fetch is None:
+            fetch = self._meta.update_fetch
+
+        if not raw:
+            sort = self._meta.sort_encoder.encode(sort)
+
+        update = self._update_statement(update, raw)
+        if not update:
+            return False
+        for name in ('multi', 'new', 'fields'):
+            options.pop(name, None)
+        if fetch and acknowledged:
+            res = await autoreconnect(
+                proxy._connection, collection.find_one_and_update, {'_id': self._id}, update,
+                projection=get_projection(self._partial), sort=sort,
+                return_document=ReturnDocument.AFTER, **options)
+            self._reset(res)
+        else:
+            await autoreconnect(proxy._connection, collection.update_one, {'_id': self._id},
+                                update, **options)
+            partial = self._partial
+            names = self._apply(update)
+            if names and acknowledged:
+                res = await autoreconnect(proxy._connection, collection.find_one,
+                                          {'_id': self._id}, projection=list(names))
+                self._reset(res or {})
+                self._partial = partial
+        self._remember(connection)
+        return True
+
+    async def aremove(self, connection=None, **options):
+        """
+        Remove the document from the database. Additional args are passed to the driver's
+        delete_one(). Return True if the document was removed or False if there was nothing to
+        remove.
+        """
+        if self._meta.disable_remove:
+            msg = "removal of {} is disabled".format(self.__class__.__name__)
+            raise OperationError(msg)
+
+        if not self._id:
+            return False
+        identity.discard(self.__class__, self._id)
+        proxy = self._meta.get_collection(connection)
+        res = await autoreconnect(proxy._connection, proxy.async_collection.delete_one,
+                                  {'_id': self._id}, **options)
+        self._invalidate()
+        return res.deleted_count > 0
+
+
+class AsyncCursor(object):
+    """Asyncio iteration for Cursor."""
+    __slots__ = ()
+
+    def __aiter__(self):
+        """Return an asynchronous iterator over the documents."""
+        return self._aiter()
+
+    async def _aiter(self):
+        """
+        Yield documents read from the asyncio driver one batch at a time. Results are read from the
+        document's replica or query cache and references are joined as they are for the blocking
+        cursor. Raise OperationError if references are prefetched as prefetching is not supported
+        by asyncio cursors. Use join() instead.
+        """
+        if self.prefetches:
+            raise OperationError("asyncio cursors do not support prefetch, use join instead")
+        criteria = self._criteria
+        fields = self.fields
+        results = self._find_replica(criteria)
+        if results is None:
+            key = self._cache_key(criteria)
+            if key is not None:
+                codec_options = self.collection.async_collection.codec_options
+                results = await fetch_cached(self.cache, key, lambda: self._aresults(criteria),
+                                             codec_options)
+        if results is not None:
+            for raw in results:
+                yield self._decode(raw, fields)
+            return
+        async for batch in self._araw_batches(criteria):
+            for raw in batch:
+                yield self._decode(raw, fields)
+
+    async def _aresults(self, criteria):
+        """Return a list of the raw results of the criteria read with the asyncio driver."""
+        results = []
+        async for batch in self._araw_batches(criteria):
+            results.extend(batch)
+        return results
+
+    async def _araw_batches(self, criteria):
+        """
+        Yield lists of raw results of the criteria read with the asyncio driver. Cursors with
+        joins use the same aggregation as the blocking cursor. A query with an $in list longer than
+        the document's 'in_chunk_size' meta option is run as one query per chunk of the list and
+        the results of all chunks are read before they are merged.
+        """
+        collection = self.collection.async_collection
+        size = self.options.get('batch_size') or 100
+        if self.joins:
+            cursor = collection.aggregate(self._pipeline(), **self._aggregate_options())
+        else:
+            name = find_chunked_field(criteria, self.document._meta.in_chunk_size)
+            if name is not None:
+                for batch in chunks(await self._afind_chunked(collection, criteria, name), size):
+                    yield batch
+                return
+            cursor = collection.find(criteria, projection=get_projection(self.fields),
+                                     **self.options)
+        while True:
+            batch = await autoreconnect(self.connection, cursor.to_list, size)
+            if not batch:
+                return
+            yield batch
+
+    async def _afind_chunked(self, collection, criteria, name):
+        """
+        Return a list of the distinct raw results of the criteria with the $in on name split into
+        chunks. Results are merged and skip and limit applied as they are by ChunkedCursor.
+        """
+        options = dict(self.options)
+        sort = options.pop('sort', None)
+        skip = options.pop('skip', 0) or 0
+        limit = options.pop('limit', 0) or 0
+        if limit:
+            options['limit'] = skip + limit
+        projection = get_projection(self.fields)
+        results = []
+        for query in split_criteria(criteria, name, self.document._meta.in_chunk_size):
+            cursor = collection.find(query, projection=projection, sort=sort, **options)
+            results.append(await autoreconnect(self.connection, cursor.to_list, None))
+        stop = skip + limit if limit else None
+        return list(islice(merge(results, sort), skip, stop))
+
+    async def ato_list(self, length=None):
+        """Return a list of up to length documents or all of the documents if length is None."""
+        documents = []
+        async for document in self:
+            documents.append(document)
+            if length is not None and len(documents) >= length:
+                break
+        return documents
+
+
+class AsyncReferenceFinder(object):
+    """Asyncio methods for ReferenceFinder."""
+    __slots__ = ()
+
+    async def afind_one(self, fields=None, connection=None, **options):
+        """
+        Return the result of a find_one using the reference. Options are the same as
+        Document.find_one() without query.
+        """
+        found, doc = self.prefetched(fields, connection, options)
+        if found:
+            return doc
+        cls = self.reference.doctype
+        return await cls.afind_one(self.query, fields, connection, **options)
@@ -0,0 +1,260 @@
+"""Caches for query results."""
+from __future__ import absolute_import
+from .errors import ConfigError
+from .optimizer import freeze
+from bson import BSON
+from collections import OrderedDict
+import threading
+import time
+
+
+class MemoryBackend(object):
+    """
+    Store cache entries in process memory. The least recently used entries are dropped once
+    max_entries entries are stored. Other backends, such as a store shared between processes,
+    must provide the same get(), set(), and clear() methods. Keys are tuples whose first item is
+    the namespace of the queried collection. Entries only contain tuples, numbers, and BSON bytes
+    so they may be pickled.
+    """
+
+    def __init__(self, max_entries=10000):
+        """Create a backend which holds up to max_entries entries."""
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return the entry stored for key or None if there isn't one."""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.entries[key] = entry
+            return entry
+
+    def set(self, key, entry):
+        """Store an entry for key."""
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(False)
+
+    def clear(self, namespace=None):
+        """Remove the entries in namespace. Remove all entries if namespace is None."""
+        with self.lock:
+            if namespace is None:
+                self.entries.clear()
+                return
+            for key in [key for key in self.entries if key[0] == namespace]:
+                del self.entries[key]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def get_namespace(collection):
+    """
+    Return the cache namespace of a collection. The namespace contains the URI of the collection's
+    connection and the collection's full name, which includes the database name.
+    """
+    connection = getattr(collection, '_connection', None)
+    uri = connection.uri if connection is not None else None
+    return (uri, collection.full_name)
+
+
+def encode_result(value):
+    """Return a query result, a raw document, list of raw documents, or None, as BSON bytes."""
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return tuple(BSON.encode(raw) for raw in value)
+    return BSON.encode(value)
+
+
+def decode_result(value, codec_options):
+    """Return a query result decoded from the value returned by encode_result()."""
+    if value is None:
+        return None
+    if isinstance(value, tuple):
+        return [BSON(data).decode(codec_options) for data in value]
+    return BSON(value).decode(codec_options)
+
+
+class QueryCache(object):
+    """
+    Cache the results of a document's queries. Results are kept for ttl seconds. When stale_ttl
+    is set a result which is older than ttl but not older than ttl + stale_ttl is returned while
+    the query is run again on a background thread. Results are keyed by the namespace of the
+    queried collection so caches for different collections may share a backend. Any write made by
+    the document class in this process invalidates the results cached for its collection. Results
+    are stored as BSON so each read returns new raw documents.
+    """
+
+    def __init__(self, ttl=60, max_entries=10000, stale_ttl=0, backend=None):
+        """
+        Create a query cache. The backend defaults to a MemoryBackend which holds up to
+        max_entries results.
+        """
+        if ttl is None or ttl <= 0:
+            raise ConfigError("query cache ttl must be greater than zero")
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl or 0
+        self.backend = backend if backend is not None else MemoryBackend(max_entries)
+        self.clock = time.time
+        self.generations = {}
+        self.refreshing = set()
+        self.lock = threading.Lock()
+
+    def key(self, namespace, *args):
+        """
+        Return a cache key for the arguments of a query on the collection with the given namespace
+        or None if they can't be hashed.
+        """
+        try:
+            return (namespace, freeze(args))
+        except TypeError:
+            return None
+
+    def fetch(self, key, load, codec_options):
+        """
+        Return the cached result for key decoded using codec_options. If the result is not cached
+        or has expired it is loaded by calling load(), which returns a raw document, a list of raw
+        documents, or None.
+        """
+        found = self.lookup(key)
+        if found is not None:
+            value, stale = found
+            if stale:
+                self.refresh(key, load)
+            return decode_result(value, codec_options)
+        return decode_result(self.load(key, load), codec_options)
+
+    def lookup(self, key):
+        """
+        Return a (value, stale) tuple for the encoded result cached for key or None if no result
+        is cached or it has expired. Stale is True if the result is older than ttl and should be
+        returned while it is reloaded.
+        """
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        now = self.clock()
+        expires, value = entry
+        if now < expires:
+            return value, False
+        if now < expires + self.stale_ttl:
+            return value, True
+        return None
+
+    def load(self, key, load):
+        """
+        Call load() and store its result for key unless the key's namespace is invalidated by this
+        process meanwhile. Generations only track this process's invalidations and are not stored
+        in the backend. Entries written by other processes sharing the backend remain valid until
+        their namespace is cleared.
+        """
+        generation = self.get_generation(key)
+        value = encode_result(load())
+        self.store(key, generation, value)
+        return value
+
+    def get_generation(self, key):
+        """Return the number of times the namespace of key has been invalidated by this process."""
+        return self.generations.get(key[0], 0)
+
+    def store(self, key, generation, value):
+        """
+        Store an encoded result for key which was loaded at the given generation of its namespace.
+        The result is dropped if the namespace has been invalidated since.
+        """
+        with self.lock:
+            if generation == self.get_generation(key):
+                self.backend.set(key, (self.clock() + self.ttl, value))
+
+    def start_refresh(self, key):
+        """Mark key as reloading. Return False if it is already being reloaded."""
+        with self.lock:
+            if key in self.refreshing:
+                return False
+            self.refreshing.add(key)
+            return True
+
+    def finish_refresh(self, key):
+        """Mark key as no longer reloading."""
+        with self.lock:
+            self.refreshing.discard(key)
+
+    def refresh(self, key, load):
+        """Reload the result for key on a background thread unless it is already reloading."""
+        if not self.start_refresh(key):
+            return
+
+        def run():
+            try:
+                self.load(key, load)
+            finally:
+                self.finish_refresh(key)
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def invalidate(self, namespace):
+        """
+        Drop the results cached for the collection with the given namespace. Results being loaded
+        for it when this is called are not stored.
+        """
+        with self.lock:
+            self.generations[namespace] = self.generations.get(namespace, 0) + 1
+            self.backend.clear(namespace)
+
+
+class CachedCursor(object):
+    """Iterate over a list of cached query results in the same way as a pymongo cursor."""
+
+    def __init__(self, results):
+        """Create a cursor over a list of raw documents."""
+        self.results = results
+        self.position = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.position >= len(self.results):
+            raise StopIteration
+        self.position += 1
+        return self.results[self.position - 1]
+
+    next = __next__  # Python 2 compatibility
+
+    def __getitem__(self, index):
+        """
+        Return a copy of the result at the given index. Indexed results may be read more than once
+        and are decoded without being copied, so each read returns its own dictionary.
+        """
+        try:
+            return self.results[index].copy()
+        except IndexError:
+            raise IndexError("no such item for cursor")
+
+    def batch_size(self, size):
+        """Do nothing as the results are already in memory."""
+        return self
+
+    def close(self):
+        """Drop the remaining results."""
+        self.position = len(self.results)
+
+
+def get_cache(cache):
+    """
+    Return a QueryCache from the 'cache' meta option. The option may be a QueryCache or a
+    dictionary of QueryCache arguments. Return None if no cache is configured.
+    """
+    if cache is None or isinstance(cache, QueryCache):
+        return cache
+    try:
+        return QueryCache(**cache)
+    except TypeError:
+        raise ConfigError("invalid query cache option {}".format(repr(cache)))
@@ -0,0 +1,228 @@
+"""Split queries with very large $in lists into several smaller queries."""
+from __future__ import absolute_import
+from .utils import chunks
+from bson import ObjectId
+from bson.regex import Regex
+from collections import OrderedDict
+from datetime import datetime
+from heapq import merge as heap_merge
+from itertools import chain, islice
+import re
+import six
+
+# rank of each type in MongoDB's sort order
+type_ranks = [
+    (bool, 8),
+    (six.integer_types + (float,), 2),
+    (six.string_types, 3),
+    (dict, 4),
+    ((list, tuple), 5),
+    (bytes, 6),
+    (ObjectId, 7),
+    (datetime, 9),
+    ((Regex, type(re.compile(''))), 11),
+]
+
+
+def find_chunked_field(criteria, size):
+    """
+    Return the name of the field in criteria with the largest $in list of more than size values.
+    Only fields at the top level of the criteria are considered. Return None if there is no such
+    field or if size is not set.
+    """
+    if not size or not criteria:
+        return None
+    found = None
+    found_size = size
+    for name, value in six.iteritems(criteria):
+        if name[:1] == '$' or not isinstance(value, dict):
+            continue
+        values = value.get('$in')
+        if isinstance(values, list) and len(values) > found_size:
+            found = name
+            found_size = len(values)
+    return found
+
+
+def split_criteria(criteria, name, size):
+    """Return a list of criteria which each match up to size values of the $in on name."""
+    queries = []
+    for values in chunks(criteria[name]['$in'], size):
+        query = OrderedDict(criteria)
+        query[name] = OrderedDict(criteria[name])
+        query[name]['$in'] = values
+        queries.append(query)
+    return queries
+
+
+def get_sort_value(raw, name):
+    """Return the value of a dotted field name in a raw document or None if there isn't one."""
+    for part in name.split('.'):
+        if not hasattr(raw, 'get'):
+            return None
+        raw = raw.get(part)
+    return raw
+
+
+def get_rank(value):
+    """Return the rank of a value's type in MongoDB's sort order."""
+    if value is None:
+        return 1
+    for types, rank in type_ranks:
+        if isinstance(value, types):
+            return rank
+    return 10
+
+
+def get_sort_key(value, direction):
+    """
+    Return a comparable key for a value. Arrays are sorted by their smallest element when
+    ascending and their largest element when descending, as MongoDB does.
+    """
+    if isinstance(value, list):
+        if not value:
+            return (0, None)
+        keys = [get_sort_key(item, direction) for item in value]
+        try:
+            return min(keys) if direction > 0 else max(keys)
+        except TypeError:
+            return keys[0]
+    return (get_rank(value), value)
+
+
+class SortKey(object):
+    """A key used to merge raw documents which are sorted by a sort spec."""
+    __slots__ = ('keys', 'directions')
+
+    def __init__(self, raw, sort):
+        """Create the sort key of a raw document for a list of (name, direction) pairs."""
+        self.keys = [get_sort_key(get_sort_value(raw, name), direction)
+                     for name, direction in sort]
+        self.directions = [direction for _, direction in sort]
+
+    def __lt__(self, other):
+        for a, b, direction in zip(self.keys, other.keys, self.directions):
+            try:
+                if a == b:
+                    continue
+                return a < b if direction > 0 else b < a
+            except TypeError:
+                continue
+        return False
+
+
+def unique(docs):
+    """Yield raw documents skipping those with an _id which has already been seen."""
+    seen = set()
+    for doc in docs:
+        _id = doc.get('_id')
+        if _id is not None:
+            try:
+                if _id in seen:
+                    continue
+                seen.add(_id)
+            except TypeError:
+                pass
+        yield doc
+
+
+def keyed(docs, sort):
+    """Yield (key, document) pairs for raw documents sorted by (name, direction) pairs."""
+    for doc in docs:
+        yield SortKey(doc, sort), doc
+
+
+def merge(results, sort=None):
+    """
+    Return an iterator over the distinct raw documents of several iterables of results. Results
+    are merged in sort order if sort is set and returned one iterable after the other otherwise.
+    """
+    if sort and not isinstance(sort, six.integer_types):
+        sort = list(sort.items()) if isinstance(sort, dict) else sort
+        docs = heap_merge(*[keyed(docs, sort) for docs in results])
+        docs = (doc for _, doc in docs)
+    else:
+        docs = chain.from_iterable(results)
+    return unique(docs)
+
+
+class ChunkedCursor(object):
+    """
+    Iterate over the results of a query with a large $in list by running one query for each chunk
+    of the list. Results are merged in sort order if the query is sorted and returned one chunk
+    after the other otherwise. Documents matched by more than one chunk, which happens when the
+    field holds an array, are only returned once. Skip and limit apply to the merged results.
+    """
+
+    def __init__(self, collection, criteria, name, size, projection=None, **options):
+        """
+        Create a cursor for the criteria with its $in on name split into chunks of size values.
+        Additional args are passed to the collection's find().
+        """
+        self.sort = options.pop('sort', None)
+        self.skip = options.pop('skip', 0) or 0
+        self.limit = options.pop('limit', 0) or 0
+        self.collection = collection
+        self.projection = projection
+        self.options = options
+        self.criteria = split_criteria(criteria, name, size)
+        self.cursors = self._find(self.skip + self.limit if self.limit else 0)
+        self._iterator = None
+
+    def _find(self, limit):
+        """Return a new cursor for each chunk which returns at most limit documents if set."""
+        options = dict(self.options)
+        if limit:
+            options['limit'] = limit
+        return [self.collection.find(query, projection=self.projection, sort=self.sort, **options)
+                for query in self.criteria]
+
+    def _merge(self, cursors):
+        """Return an iterator over the distinct documents of the cursors in sort order."""
+        return merge(cursors, self.sort)
+
+    def _iterate(self):
+        """Return an iterator over the merged results."""
+        stop = self.skip + self.limit if self.limit else None
+        return islice(self._merge(self.cursors), self.skip, stop)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._iterator is None:
+            self._iterator = self._iterate()
+        return next(self._iterator)
+
+    next = __next__  # Python 2 compatibility
+
+    def __getitem__(self, index):
+        """
+        Return the document at the given index of the merged results. New cursors are created for
+        the chunks so the position of the cursor is not changed.
+        """
+        if index < 0 or (self.limit and index >= self.limit):
+            raise IndexError("no such item for cursor")
+        index += self.skip
+        for doc in islice(self._merge(self._find(index + 1)), index, None):
+            return doc
+        raise IndexError("no such item for cursor")
+
+    def batch_size(self, size):
+        """Set the batch size of each chunk's cursor."""
+        for cursor in self.cursors:
+            cursor.batch_size(size)
+        return self
+
+    def count(self):
+        """
+        Return the number of documents matched by all of the chunks. Each chunk is counted by the
+        server. Documents matched by more than one chunk, which happens when the field holds an
+        array, are counted once per chunk. Skip and limit are ignored.
+        """
+        return sum(self.collection.count_documents(query) for query in self.criteria)
+
+    def close(self):
+        """Close each chunk's cursor."""
+        for cursor in self.cursors:
+            cursor.close()
@@ -0,0 +1,139 @@
+"""Columnar extraction of query results into NumPy arrays."""
+from __future__ import absolute_import
+from .errors import ConfigError, OperationError
+from .types import BuiltinType, DateTimeType, DateType
+from collections import OrderedDict
+import six
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+# dtypes used for fields of builtin types, everything else is stored as objects
+builtin_dtypes = {
+    bool: 'bool',
+    float: 'float64',
+}
+for integer_type in six.integer_types:
+    builtin_dtypes[integer_type] = 'int64'
+
+datetime_dtype = 'datetime64[ms]'
+
+
+def require_numpy():
+    """Raise ConfigError if NumPy is not installed."""
+    if numpy is None:
+        raise ConfigError("numpy is required for columnar results")
+
+
+def get_dtype(field):
+    """Return the dtype used to store the raw values of a field."""
+    if not getattr(field, 'strict', False):
+        return object
+    typ = field.typ
+    if isinstance(typ, (DateType, DateTimeType)):
+        return datetime_dtype
+    if isinstance(typ, BuiltinType):
+        return builtin_dtypes.get(typ.builtin, object)
+    return object
+
+
+def get_value(raw, path):
+    """Return the value at a dotted path in a raw document or None if there isn't one."""
+    for name in path:
+        if not hasattr(raw, 'get'):
+            return None
+        raw = raw.get(name)
+    return raw
+
+
+def to_naive(value):
+    """Return a datetime without timezone information. Aware values are converted to UTC."""
+    offset = value.utcoffset()
+    if offset is None:
+        return value
+    return (value - offset).replace(tzinfo=None)
+
+
+class Column(object):
+    """
+    A column of values which is grown as values are appended. Storage is allocated in chunks which
+    double in size so appending is amortized constant time. Missing values are masked.
+    """
+
+    def __init__(self, name, dtype, capacity=1024, lossy=False):
+        """
+        Create an empty column with the given dtype and initial capacity. Fractional values may
+        only be truncated to fit an integer dtype if lossy is True.
+        """
+        self.name = name
+        self.dtype = numpy.dtype(dtype)
+        self.size = 0
+        self.data = self.allocate(max(capacity, 1))
+        self.mask = numpy.zeros(len(self.data), dtype=bool)
+        self.datetime = self.dtype.kind == 'M'
+        self.exact = self.dtype.kind in 'iu' and not lossy
+
+    def allocate(self, capacity):
+        """Return an empty data array with room for capacity values."""
+        if self.dtype.kind == 'O':
+            return numpy.empty(capacity, dtype=self.dtype)
+        return numpy.zeros(capacity, dtype=self.dtype)
+
+    def grow(self):
+        """Double the capacity of the column."""
+        capacity = len(self.data) * 2
+        data = self.allocate(capacity)
+        data[:self.size] = self.data[:self.size]
+        mask = numpy.zeros(capacity, dtype=bool)
+        mask[:self.size] = self.mask[:self.size]
+        self.data = data
+        self.mask = mask
+
+    def append(self, value):
+        """Append a raw value to the column. None is stored as a masked value."""
+        if self.size == len(self.data):
+            self.grow()
+        if value is None:
+            self.mask[self.size] = True
+        else:
+            if self.datetime:
+                value = to_naive(value)
+            elif self.exact and isinstance(value, float) and not value.is_integer():
+                msg = "unable to store value in {} column without truncating it".format(self.dtype)
+                raise OperationError(msg, None, self.name, value)
+            try:
+                self.data[self.size] = value
+            except (TypeError, ValueError, AttributeError, OverflowError):
+                msg = "unable to store value in {} column".format(self.dtype)
+                raise OperationError(msg, None, self.name, value)
+        self.size += 1
+
+    def finish(self):
+        """Return the column values as a masked array."""
+        return numpy.ma.MaskedArray(self.data[:self.size].copy(), self.mask[:self.size].copy())
+
+
+def build_columns(document, rows, fields, dtypes=None, capacity=1024, lossy=False):
+    """
+    Return an ordered dictionary of masked arrays containing the values of the named fields from
+    an iterable of raw documents. Field names may use dot syntax to reach into subdocuments. The
+    dtype of each column is chosen using the document's field types unless overridden by dtypes,
+    a dictionary mapping field names to dtypes. Raw values are stored without being decoded. Raise
+    OperationError if a value can't be stored in its column. Fractional values in integer columns
+    are truncated if lossy is True and raise OperationError otherwise.
+    """
+    require_numpy()
+    dtypes = dtypes or {}
+    columns = []
+    for name in fields:
+        dtype = dtypes.get(name)
+        if dtype is None:
+            dtype = get_dtype(document._meta.get_field(name))
+        columns.append((name.split('.'), Column(name, dtype, capacity, lossy)))
+
+    for raw in rows:
+        for path, column in columns:
+            column.append(get_value(raw, path))
+    return OrderedDict((column.name, column.finish()) for _, column in columns)
@@ -45,6 +45,8 @@ class Connection(object):
         self.options = options
         self._client = None
         self._database = None
+        self._async_client = None
+        self._async_database = None
 
     @property
     def client(self):
@@ -60,6 +62,21 @@ class Connection(object):
             self._database = self.client.get_default_database()
         return self._database
 
+    @property
+    def async_client(self):
+        """Return the asyncio client used by this connection."""
+        if self._async_client is None:
+            from .aio import create_client
+            self._async_client = create_client(self.uri, **self.options)
+        return self._async_client
+
+    @property
+    def async_database(self):
+        """Return the asyncio database used by this connection."""
+        if self._async_database is None:
+            self._async_database = self.async_client.get_default_database()
+        return self._async_database
+
     def __getitem__(self, name):
         """Return a collection from the connection's database."""
         if not name:
@@ -81,9 +98,13 @@ class Connection(object):
         return reconnect
 
     def close(self):
-        """Close the connection."""
+        """Close the connection's blocking and asyncio clients."""
         if self._client:
             self._client.close()
+        if self._async_client is not None:
+            self._async_client.close()
+        self._async_client = None
+        self._async_database = None
 
 
 class CollectionProxy(object):
@@ -101,6 +122,30 @@ class CollectionProxy(object):
             value = self._connection.autoreconnect(value)
         return value
 
+    def __eq__(self, other):
+        """Return True if both proxies refer to the same collection."""
+        if isinstance(other, CollectionProxy):
+            return self._collection == other._collection
+        return NotImplemented
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._collection)
+
+    @property
+    def async_collection(self):
+        """Return the asyncio collection with the same name and options as the collection."""
+        collection = self._collection
+        return self._connection.async_database[collection.name].with_options(
+            codec_options=collection.codec_options, read_preference=collection.read_preference,
+            write_concern=collection.write_concern, read_concern=collection.read_concern)
+
+    def with_options(self, **options):
+        """Return a proxy for a copy of the collection with different options."""
+        return CollectionProxy(self._connection, self._collection.with_options(**options))
+
 
 def get(name):
     """Return a named connection or None if not found."""
@@ -1,9 +1,29 @@
 """Cursors for iterating over documents."""
+from . import identity
+from .cache import CachedCursor, get_namespace
+from .chunking import ChunkedCursor, find_chunked_field, split_criteria
+from .errors import OperationError
 from .query import Query
+from .replica import UnsupportedQuery
 from .utils import get_projection
+from bson import ObjectId
+from collections import OrderedDict
+import six
+import sys
 
+if sys.version_info >= (3, 6):
+    from .aio import AsyncCursor
+else:  # pragma: no cover
+    AsyncCursor = object
 
-class Cursor(object):
+# number of documents read at a time by cursors which prefetch references
+prefetch_batch_size = 100
+
+# prefix of the fields which hold the documents joined to a result by $lookup
+join_prefix = '_joined_'
+
+
+class Cursor(AsyncCursor):
     """
     Cursors are used to iterate over multiple documents or to further refine the results of a
     find().
@@ -21,6 +41,10 @@ class Cursor(object):
         self.raw = raw
         self.options = options
         self.options.pop('manipulate', None)
+        self.prefetches = []
+        self.joins = []
+        self.cache = None
+        self.replica = None
 
     def _make_query(self, query):
         """Return a query for an object of dubious origin."""
@@ -40,49 +64,399 @@ class Cursor(object):
         """Return the connection for the cursor."""
         return self.collection._connection
 
+    def _set_joined(self, doc, joined):
+        """Store the documents joined to a document for its references."""
+        for name, (fields, values) in six.iteritems(joined):
+            value = getattr(doc, name).value
+            if not isinstance(value, ObjectId) or values is None:
+                continue
+            doctype = self.document._meta.fields[name].doctype
+            partial = doctype._meta.get_partial(fields)
+            ref = doctype._decode(values[0], partial, copy=False) if values else None
+            if doc._refs is None:
+                doc._refs = {}
+            doc._refs[name] = (value, partial, ref)
+
     @property
     def pymongo(self):
-        """Return the pymongo cursor which underlies this object."""
+        """
+        Return the pymongo cursor which underlies this object. A query with an $in list longer
+        than the document's 'in_chunk_size' meta option is run as one query per chunk of the list
+        and a ChunkedCursor which merges their results is returned instead. Results of cursors
+        with a query cache are read from the cache and returned by a CachedCursor. Queries on
+        documents with a replica are evaluated against the replica when possible.
+        """
         if not getattr(self, '_pymongo_cursor', None):
-            self._pymongo_cursor = self.collection.find(
-                self._criteria, projection=get_projection(self.fields), **self.options)
+            criteria = self._criteria
+            results = self._find_replica(criteria)
+            if results is not None:
+                self._pymongo_cursor = CachedCursor(results)
+                return self._pymongo_cursor
+            key = self._cache_key(criteria)
+            if key is not None:
+                results = self.cache.fetch(key, lambda: list(self._find(criteria)),
+                                           self.collection.codec_options)
+                self._pymongo_cursor = CachedCursor(results)
+            else:
+                self._pymongo_cursor = self._find(criteria)
         return self._pymongo_cursor
 
+    def _cache_key(self, criteria):
+        """
+        Return the query cache key for the criteria or None if the cursor's results are not
+        cached.
+        """
+        if self.cache is None or self.joins:
+            return None
+        return self.cache.key(get_namespace(self.collection), 'find', criteria,
+                              get_projection(self.fields), sorted(self.options.items()))
+
+    def _find_replica(self, criteria):
+        """
+        Return the list of raw documents matching the criteria from the document's replica or None
+        if there is no replica or it can't evaluate the query.
+        """
+        if self.replica is None or self.joins:
+            return None
+        try:
+            return self.replica.find(criteria, get_projection(self.fields), **self.options)
+        except UnsupportedQuery:
+            return None
+
+    def _find(self, criteria):
+        """Return a new pymongo cursor over the results of the criteria."""
+        if self.joins:
+            return self._aggregate()
+        return self._find_chunked(self.collection, criteria, get_projection(self.fields))
+
+    def _find_chunked(self, collection, criteria, projection):
+        """
+        Return a new pymongo cursor over the results of the criteria in the collection. Return a
+        ChunkedCursor if the criteria contain an $in list longer than the 'in_chunk_size' meta
+        option.
+        """
+        size = self.document._meta.in_chunk_size
+        name = find_chunked_field(criteria, size)
+        if name is None:
+            return collection.find(criteria, projection=projection, **self.options)
+        return ChunkedCursor(collection, criteria, name, size, projection=projection,
+                             **self.options)
+
+    def _decode(self, raw, fields):
+        """Return a document decoded from a raw value returned by the pymongo cursor."""
+        if self.joins:
+            joined = self._join(raw)
+            doc = self.document._decode(raw, fields, copy=False)
+            self._set_joined(doc, joined)
+            return doc
+        return self.document._decode(raw, fields, copy=False)
+
     def count(self):
         """Count the number of objects matching this cursor."""
+        if self.replica is not None:
+            try:
+                return self.replica.count(self._criteria)
+            except UnsupportedQuery:
+                pass
+        if self.joins or self.cache is not None:
+            return self._find_chunked(self.collection, self._criteria,
+                                      get_projection(self.fields)).count()
         return self.pymongo.count()
 
     def find(self, query):
         """Refine the cursor's scope with an additional query. Return a new cursor."""
         query = self.query & self._make_query(query)
-        return Cursor(self.document, self.collection, query, self.fields, self.raw, **self.options)
+        cursor = Cursor(self.document, self.collection, query, self.fields, self.raw,
+                        **self.options)
+        cursor.prefetches = list(self.prefetches)
+        cursor.joins = list(self.joins)
+        cursor.cache = self.cache
+        cursor.replica = self.replica
+        return cursor
+
+    def _get_reference(self, name):
+        """Return the named Reference field. Raise OperationError if it is not a Reference."""
+        from .reference import Reference
+        field = self.document._meta.fields.get(name)
+        if not isinstance(field, Reference):
+            raise OperationError("{} is not a reference of {}".format(
+                name, self.document.__name__))
+        return field
+
+    def prefetch(self, name, fields=None):
+        """
+        Retrieve the documents referenced by the named Reference field along with each batch of
+        documents. The ObjectId references of a batch are retrieved with a single query so that
+        calling find_one() on the reference doesn't query the database again. References which
+        store a query are not prefetched. If fields is not None only those fields of the
+        referenced documents are retrieved. Return the cursor. Raise OperationError if the field
+        is not a Reference.
+        """
+        self._get_reference(name)
+        self.prefetches.append((name, fields))
+        return self
+
+    def join(self, name, fields=None):
+        """
+        Retrieve the documents referenced by the named Reference field in the same query using an
+        aggregation with $lookup, so that calling find_one() on the reference doesn't query the
+        database again. The referenced collection must be in the same database. References which
+        store a query are not joined. If fields is not None only those fields of the referenced
+        documents are retrieved. Return the cursor. Raise OperationError if the field is not a
+        Reference.
+        """
+        self._get_reference(name)
+        self.joins.append((name, fields))
+        return self
+
+    def _pipeline(self, skip=None, limit=None):
+        """
+        Return the aggregation pipeline for a cursor with joins. Skip and limit are applied after
+        the cursor's own skip and limit.
+        """
+        options = self.options
+        criteria = self._criteria
+        pipeline = []
+        if criteria:
+            pipeline.append({'$match': criteria})
+        sort = options.get('sort')
+        if sort:
+            pipeline.append({'$sort': OrderedDict(sort)})
+        for stage, value in (('$skip', options.get('skip')), ('$limit', options.get('limit')),
+                             ('$skip', skip), ('$limit', limit)):
+            if value:
+                pipeline.append({stage: value})
+
+        projection = get_projection(self.fields)
+        if projection:
+            projection = OrderedDict((name, 1) for name in sorted(projection))
+        for name, fields in self.joins:
+            doctype = self.document._meta.fields[name].doctype
+            collection = doctype._meta.get_collection().name
+            lookup = OrderedDict([('from', collection)])
+            fields = get_projection(doctype._meta.get_partial(fields))
+            if fields:
+                lookup['let'] = {'ref': '$' + name}
+                lookup['pipeline'] = [
+                    {'$match': {'$expr': {'$eq': ['$_id', '$$ref']}}},
+                    {'$project': OrderedDict((field, 1) for field in sorted(fields))},
+                ]
+            else:
+                lookup['localField'] = name
+                lookup['foreignField'] = '_id'
+            lookup['as'] = join_prefix + name
+            pipeline.append({'$lookup': lookup})
+            if projection:
+                projection[join_prefix + name] = 1
+        if projection:
+            pipeline.append({'$project': projection})
+        return pipeline
+
+    def _aggregate(self, skip=None, limit=None):
+        """Return a pymongo command cursor over the results of the cursor's joins."""
+        return self.collection.aggregate(self._pipeline(skip, limit), **self._aggregate_options())
+
+    def _aggregate_options(self):
+        """Return the cursor's options as aggregate() options."""
+        options = {name: value for name, value in six.iteritems(self.options)
+                   if name not in ('sort', 'skip', 'limit', 'batch_size')}
+        if self.options.get('batch_size'):
+            options['batchSize'] = self.options['batch_size']
+        return options
+
+    def _join(self, raw):
+        """Pop the joined documents from a raw result and return them by field name."""
+        joined = {}
+        for name, fields in self.joins:
+            joined[name] = (fields, raw.pop(join_prefix + name, None))
+        return joined
+
+    def _prefetch(self, docs):
+        """Retrieve the references of each prefetched field for a batch of docs. Return docs."""
+        for name, fields in self.prefetches:
+            doctype = self.document._meta.fields[name].doctype
+            partial = doctype._meta.get_partial(fields)
+            refs = []
+            for doc in docs:
+                value = getattr(doc, name).value
+                if isinstance(value, ObjectId):
+                    refs.append((doc, value))
+            if not refs:
+                continue
+            found = doctype.get_many([value for _, value in refs], fields)
+            for (doc, value), ref in zip(refs, found):
+                if doc._refs is None:
+                    doc._refs = {}
+                doc._refs[name] = (value, partial, ref)
+        return docs
 
     def remove(self):
         """Remove the documents matched by this cursor."""
-        res = self.collection.remove(self._criteria)
-        return res.get('n', 0)
+        identity.clear(self.document)
+        criteria = self._criteria
+        size = self.document._meta.in_chunk_size
+        name = find_chunked_field(criteria, size)
+        try:
+            if name is None:
+                return self.collection.remove(criteria).get('n', 0)
+            return sum(self.collection.remove(chunk).get('n', 0)
+                       for chunk in split_criteria(criteria, name, size))
+        finally:
+            self.document._invalidate()
 
     def __getitem__(self, index):
         """Return the document at the given index."""
-        return self.document._decode(self.pymongo[index], get_projection(self.fields))
+        if self.joins:
+            for raw in self._aggregate(index, 1):
+                return self._decode(raw, self.fields)
+            raise IndexError("no such item for Cursor instance")
+        return self._decode(self.pymongo[index], get_projection(self.fields))
 
     def __iter__(self):
         """Return the cursor iterator."""
         return self
 
     def __len__(self):
-        return self.pymongo.count()
+        return self.count()
 
     def __next__(self):
         """Return the next item in the iterator."""
+        if self.prefetches:
+            if getattr(self, '_prefetched', None) is None:
+                size = self.options.get('batch_size') or prefetch_batch_size
+                self._prefetched = (doc for batch in self.iter_batches(size) for doc in batch)
+            return next(self._prefetched)
+
         def decode_next():
-            return self.document._decode(next(self.pymongo), self.fields)
+            return self._decode(next(self.pymongo), self.fields)
         return self.connection.autoreconnect(decode_next)()
 
     next = __next__  # Python 2 compatibility
 
+    def iter_batches(self, size):
+        """
+        Iterate over the documents in lists of up to size documents. The driver's batch size is
+        set to size so each list is filled from a single server round trip. Reconnection is
+        handled once per batch rather than once per document. A batch interrupted by a reconnect
+        resumes where it left off. References added with prefetch() are retrieved for each batch.
+        """
+        cursor = self.pymongo
+        cursor.batch_size(size)
+        fields = self.fields
+        batches = self._batches(cursor, size, lambda raw: self._decode(raw, fields))
+        if self.prefetches:
+            return (self._prefetch(batch) for batch in batches)
+        return batches
+
+    def to_columns(self, fields, dtypes=None, batch_size=1000, lossy=False):
+        """
+        Return an ordered dictionary mapping each of the named fields to a NumPy masked array of
+        their values. Values are read from the raw query results without creating documents.
+        Integer, float, and boolean fields use the matching dtypes, date and datetime fields use
+        datetime64, and all other fields are stored as objects. Missing values are masked. The
+        dtypes may be a dictionary which overrides the dtype of named fields. Fractional values in
+        integer columns are truncated if lossy is True. Otherwise OperationError is raised, as it
+        is for values which can't be stored in their column. Queries with a large $in list are
+        split into chunks as they are when iterating. Results are always read from the database,
+        not from the document's replica or query cache. Raise ConfigError if NumPy is not
+        installed.
+        """
+        from .columns import build_columns, require_numpy
+        require_numpy()
+        projection = list({name.split('.')[0] for name in fields})
+        cursor = self._find_chunked(self.collection, self._criteria, projection)
+        cursor.batch_size(batch_size)
+        rows = (raw for batch in self._batches(cursor, batch_size, None) for raw in batch)
+        return build_columns(self.document, rows, fields, dtypes, batch_size, lossy)
+
+    def parallel(self, workers, callback=None, key='_id', batch_size=1000):
+        """
+        Scan the documents matched by the cursor using a pool of worker threads. The matched
+        documents are split into ranges of key using split points sampled from the collection and
+        each range is read by its own cursor. The key defaults to _id but may be any indexed field,
+        such as a shard key. If callback is None return an iterator over the documents of all
+        ranges in no particular order. Otherwise call callback with each range's cursor on a worker
+        thread and return the list of results. The cursor may not have a limit or skip.
+        """
+        from .scan import get_ranges, get_split_points, merge, run
+        if self.options.get('limit') or self.options.get('skip'):
+            raise OperationError("unable to scan a cursor with a limit or skip in parallel")
+        criteria = self._criteria
+        points = get_split_points(self.collection, criteria, key, workers)
+        cursors = []
+        for query in get_ranges(key, points):
+            if criteria and query:
+                query = {'$and': [criteria, query]}
+            elif criteria:
+                query = criteria
+            cursors.append(Cursor(self.document, self.collection, query, self.fields, True,
+                                  **self.options))
+        if callback is None:
+            return merge(cursors, batch_size)
+        return run(cursors, callback)
+
+    def map_reduce(self, mapper, reducer=None, initial=None, workers=None, max_pending=None,
+                   batch_size=1000):
+        """
+        Map and optionally reduce the documents on a pool of worker processes. Raw batches of BSON
+        are read from the server in this process and sent to the workers, which decode them into
+        documents and call mapper with each one. If reducer is None return an iterator over the
+        mapped values. Otherwise each worker reduces the mapped values of its batch using reducer
+        starting from initial and the batch results are reduced again in this process, so the
+        reducer must be associative and initial must be its identity. If initial is None reduction
+        starts from the first value and the cursor must not be empty. Return the reduced value.
+        The document class, mapper, and reducer must be picklable, which means they must be
+        defined at module level. Workers defaults to the number of CPUs and at most max_pending
+        batches, twice the number of workers by default, are queued at once. Requires pymongo
+        3.6 or later.
+
+        Results read from the document's replica or query cache, and results of queries which are
+        split into chunks because of a large $in list, are read as documents and encoded again in
+        batches of up to batch_size documents before they are sent to the workers. Raise
+        OperationError if the cursor has joins or prefetches references.
+        """
+        from .mapreduce import encode_batch, iter_results, reduce_values
+        if self.joins or self.prefetches:
+            raise OperationError("unable to map a cursor with joins or prefetches")
+        criteria = self._criteria
+        size = self.document._meta.in_chunk_size
+        if self.replica is None and self.cache is None and \
+                find_chunked_field(criteria, size) is None:
+            cursor = self.collection.find_raw_batches(
+                criteria, projection=get_projection(self.fields), **self.options)
+            batches = (batch[0] for batch in self._batches(cursor, 1))
+        else:
+            cursor = self.pymongo
+            cursor.batch_size(batch_size)
+            batches = (encode_batch(batch) for batch in self._batches(cursor, batch_size))
+        results = iter_results(batches, self.document, self.fields, self.collection.codec_options,
+                               mapper, reducer, initial, workers, max_pending)
+        if reducer is None:
+            return (value for values in results for value in values)
+        return reduce_values(reducer, results, initial)
+
+    def _batches(self, cursor, size, decode=None):
+        """
+        Yield lists of up to size values from a pymongo cursor, passing each through decode if it
+        is provided. Reconnection is handled once per batch.
+        """
+        def fill(batch):
+            for raw in cursor:
+                batch.append(decode(raw) if decode else raw)
+                if len(batch) >= size:
+                    break
+
+        fill = self.connection.autoreconnect(fill)
+        while True:
+            batch = []
+            fill(batch)
+            if not batch:
+                return
+            yield batch
+
     def close(self):
         """Explicitly close the cursor."""
         if getattr(self, '_pymongo_cursor', None):
             self._pymongo_cursor.close()
             self._pymongo_cursor = None
+        self._prefetched = None
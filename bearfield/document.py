@@ -1,15 +1,27 @@
 """Document and subdocument classes."""
 from __future__ import absolute_import
+from . import identity
+from .cache import get_namespace
 from .cursor import Cursor
-from .encoders import SortEncoder, UpdateEncoder
-from .errors import OperationError, ValidationError
+from .errors import BulkError, DocumentError, OperationError, ValidationError
 from .meta import DocumentBuilder
-from .query import Query
-from .utils import get_projection
+from .query import PreparedQuery, make_query
+from .replica import UnsupportedQuery
+from .tracking import diff_value, is_modified, is_path_key, join_path
+from .utils import apply_update, chunks, get_projection
+from collections import OrderedDict
+from pymongo import InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
 import six
+import sys
 
+if sys.version_info >= (3, 6):
+    from .aio import AsyncDocument
+else:  # pragma: no cover
+    AsyncDocument = object
 
-class Document(six.with_metaclass(DocumentBuilder, object)):
+
+class Document(six.with_metaclass(DocumentBuilder, AsyncDocument)):
     """
     A document or subdocument. Document properties are defined in an optional Meta subclass. In
     order for a document to be saved to a database it must associate itself with a named connection
@@ -23,28 +35,42 @@ class Document(six.with_metaclass(DocumentBuilder, object)):
 
     A document may be provided as the type to a Field. This will cause that field to be treated as
     a subdocument.
+
+    Setting the 'compact' meta attribute to True stores field values in per-class slots and tracks
+    dirty fields in a bitmap. Compact documents have no instance dictionary so attributes other
+    than fields may not be set on them. Subclasses of compact documents are also compact.
     """
+    __slots__ = ('_raw', '_partial', '_refs', '_defaults')
 
     def __new__(cls, *args, **kwargs):
         """Create new instance of Document."""
         doc = object.__new__(cls)
         doc._raw = {}
-        doc._attrs = {}
-        doc._dirty = set()
+        if not cls._meta.compact:
+            doc._attrs = {}
+            doc._dirty = set()
         doc._partial = None
+        doc._refs = None
+        doc._defaults = None
         return doc
 
     @classmethod
-    def _decode(cls, raw, fields=None):
+    def _decode(cls, raw, fields=None, copy=True):
         """
         Return a document decoded from a MongoDB record. If fields is not None then a partial
-        document will be created with those field values.
+        document will be created with those field values. If copy is False the document takes
+        ownership of the raw dictionary instead of copying it. The caller must not use or modify
+        the dictionary afterwards. If copy is None the dictionary is shared with the caller and
+        only copied if default values must be added to it.
         """
         if raw is None:
             return None
         doc = cls.__new__(cls)
-        doc._raw = raw.copy()
-        doc._partial = cls._meta.get_partial(fields)
+        partial = cls._meta.get_partial(fields)
+        if copy is None:
+            copy = not partial and not all(name in raw for name in cls._meta.defaults)
+        doc._raw = raw.copy() if copy else raw
+        doc._partial = partial
         doc.__init__()
         return doc
 
@@ -70,6 +96,25 @@ class Document(six.with_metaclass(DocumentBuilder, object)):
             required = ', '.join(sorted(required))
             raise ValidationError("{} is missing required fields: {}".format(doc, required))
 
+    @classmethod
+    def _diff(cls, path, old, new, update):
+        """
+        Add the operations needed to change the stored subdocument old at path into the encoded
+        subdocument new to the update document. Only changed fields are updated.
+        """
+        if not all(is_path_key(name) for name in old):
+            return diff_value(path, old, new, update)
+        fields = cls._meta.fields
+        for name, value in six.iteritems(new):
+            field = fields.get(name)
+            if field is None:
+                diff_value(join_path(path, name), old.get(name), value, update)
+            else:
+                field.diff(cls, name, join_path(path, name), old.get(name), value, update)
+        for name in old:
+            if name not in new:
+                diff_value(join_path(path, name), old[name], None, update)
+
     @classmethod
     def create_indexes(cls, connection=None, indexes=None, **kwargs):
         """
@@ -94,24 +139,120 @@ class Document(six.with_metaclass(DocumentBuilder, object)):
         collection = cls._meta.get_collection(connection)
         fields = cls._meta.get_partial(fields)
         if not raw:
-            sort = SortEncoder(cls).encode(sort)
-        return Cursor(cls, collection, query, fields, raw, sort=sort, **options)
+            sort = cls._meta.sort_encoder.encode(sort)
+        cursor = Cursor(cls, collection, query, fields, raw, sort=sort, **options)
+        if connection is None:
+            cursor.cache = cls._meta.cache
+            cursor.replica = cls._meta.replica
+        return cursor
+
+    @classmethod
+    def prepare(cls, query):
+        """
+        Return a PreparedQuery for the query which may contain Param placeholders. Field types and
+        the query's constant values are resolved once. Pass the result of its bind() method to
+        find() and the other query methods:
+
+            by_type = Bear.prepare({'type': Param('type'), 'height': {'$gt': Param('height')}})
+            bears = Bear.find(by_type.bind(type='grizzly', height=9))
+        """
+        return PreparedQuery(cls, query)
+
+    @classmethod
+    def scan(cls, query=None, workers=4, callback=None, fields=None, connection=None, raw=None,
+             key='_id', **options):
+        """
+        Scan the documents matching query in parallel using a pool of worker threads. The matched
+        documents are split into ranges of key, which should be indexed. If callback is None return
+        an iterator over the documents in no particular order. Otherwise callback is called with a
+        cursor for each range and the list of results is returned. See Cursor.parallel for
+        details. Additional args are passed to find().
+        """
+        cursor = cls.find(query, fields, connection, raw, **options)
+        return cursor.parallel(workers, callback, key)
 
     @classmethod
     def find_one(cls, query=None, fields=None, connection=None, raw=None, sort=None, **options):
         """
         Query the database for a single document. Return the document or None if not found.
         Additional args are passed to pymongo's find(). If fields is not None only return the field
-        values in that list.
+        values in that list. Documents found by _id are returned from the active identity map, if
+        there is one, when fields, connection, and additional args are not provided. Results are
+        read from the document's replica or query cache, if it has one, unless a connection is
+        provided.
         """
         collection = cls._meta.get_collection(connection)
         fields = cls._meta.get_partial(fields)
         options.pop('manipulate', None)
-        criteria = Query(query).encode(cls, raw)
+        criteria = make_query(query).encode(cls, raw)
+        mapped = not fields and connection is None and not options and \
+            identity.current() is not None
+        if mapped:
+            _id = identity.get_id(criteria)
+            doc = identity.get(cls, _id) if _id is not None else None
+            if doc is not None:
+                return doc
         if not raw:
-            sort = SortEncoder(cls).encode(sort)
-        return cls._decode(collection.find_one(criteria, projection=get_projection(fields),
-                                               sort=sort, **options), fields)
+            sort = cls._meta.sort_encoder.encode(sort)
+        projection = get_projection(fields)
+
+        def load():
+            return collection.find_one(criteria, projection=projection, sort=sort, **options)
+
+        cache = cls._meta.cache
+        replica = cls._meta.replica
+        key = None
+        found = None
+        if replica is not None and connection is None:
+            try:
+                found = replica.find(criteria, projection, sort=sort, limit=1, **options)
+            except UnsupportedQuery:
+                pass
+        if cache is not None and connection is None:
+            key = cache.key(get_namespace(collection), 'find_one', criteria, projection, sort,
+                            sorted(options.items()))
+        if found is not None:
+            raw = found[0] if found else None
+        elif key is not None:
+            raw = cache.fetch(key, load, collection.codec_options)
+        else:
+            raw = load()
+        doc = cls._decode(raw, fields, copy=False)
+        if mapped and doc is not None:
+            identity.add(doc)
+        return doc
+
+    @classmethod
+    def get_many(cls, ids, fields=None, connection=None, **options):
+        """
+        Return a list of the documents with the given ids in the same order as the ids. The list
+        contains None for each id which is not found. Each distinct id is only retrieved once and
+        large lists of ids are retrieved in chunks. Fields behave the same as in find().
+        Documents in the active identity map are used as in find_one(). Additional args are passed
+        to pymongo's find().
+        """
+        ids = list(ids)
+        if not ids:
+            return []
+        encoded = cls._meta.query_encoder.encode({'_id': {'$in': ids}})['_id']['$in']
+        unique = list(OrderedDict.fromkeys(encoded))
+        mapping = None
+        if not fields and connection is None and not options:
+            mapping = identity.current()
+        found = {}
+        if mapping is not None:
+            for _id in unique:
+                doc = mapping.get(cls, _id)
+                if doc is not None:
+                    found[_id] = doc
+            unique = [_id for _id in unique if _id not in found]
+        if unique:
+            cursor = cls.find({'_id': {'$in': unique}}, fields, connection, True, **options)
+            for doc in cursor:
+                found[doc._id] = doc
+                if mapping is not None:
+                    identity.add(doc)
+        return [found.get(_id) for _id in encoded]
 
     @classmethod
     def find_and_modify(cls, query, update, fields=None, connection=None, raw=None, sort=None,
@@ -128,12 +269,12 @@ class Document(six.with_metaclass(DocumentBuilder, object)):
 
         collection = cls._meta.get_collection(connection)
         fields = cls._meta.get_partial(fields)
-        criteria = Query(query).encode(cls, raw)
+        criteria = make_query(query).encode(cls, raw)
         if new is None:
             new = False
         if not raw:
-            sort = SortEncoder(cls).encode(sort)
-            update = UpdateEncoder(cls).encode(update)
+            sort = cls._meta.sort_encoder.encode(sort)
+            update = cls._meta.update_encoder.encode(update)
         if options.get('upsert'):
             specified_update_fields = {fieldname
                                        for doc in update.keys()
@@ -152,14 +293,148 @@ class Document(six.with_metaclass(DocumentBuilder, object)):
             })
         raw = collection.find_one_and_update(criteria, update, projection=get_projection(fields),
                                              new=new, sort=sort, **options)
-        return cls._decode(raw, fields)
+        doc = cls._decode(raw, fields, copy=False)
+        if doc is not None:
+            identity.discard(cls, doc._id)
+        cls._invalidate()
+        return doc
+
+    @classmethod
+    def _bulk_write(cls, documents, prepare, connection=None, ordered=True, batch_size=None,
+                    **options):
+        """
+        Write documents to the database in batches using bulk_write. The prepare function is
+        called with each document and returns a (request, finish) tuple or None if the document
+        needs no write. The finish function is called once the request has succeeded. Raise a
+        BulkError if any document fails. When ordered is True the first failure stops the
+        operation and the documents before it are still written. The documents after it are not
+        attempted and are listed in the error's unreached attribute. Otherwise every document is
+        attempted and all failures are reported.
+        """
+        collection = cls._meta.get_collection(connection)
+        batch_size = batch_size or cls._meta.bulk_batch_size
+        batches = chunks(documents, batch_size)
+        written = []
+        errors = []
+        unreached = []
+        for batch in batches:
+            requests = []
+            pending = []
+            invalid = None
+            for position, doc in enumerate(batch):
+                try:
+                    prepared = prepare(doc)
+                except (DocumentError, TypeError) as e:
+                    if ordered:
+                        invalid = (doc, e)
+                        unreached = batch[position + 1:]
+                        break
+                    errors.append((doc, e))
+                    continue
+                if prepared:
+                    request, finish = prepared
+                    pending.append((doc, finish, len(requests)))
+                    requests.append(request)
+                else:
+                    pending.append((doc, None, None))
+
+            failed = {}
+            if requests:
+                try:
+                    collection.bulk_write(requests, ordered=ordered, **options)
+                except BulkWriteError as e:
+                    failed = {err['index']: err for err in e.details.get('writeErrors', [])}
+                    if not failed:
+                        raise
+                finally:
+                    cls._invalidate()
+
+            for position, (doc, finish, index) in enumerate(pending):
+                if index in failed:
+                    errors.append((doc, failed[index]))
+                    if ordered:
+                        skipped = [other for other, _, _ in pending[position + 1:]]
+                        if invalid:
+                            skipped.append(invalid[0])
+                            invalid = None
+                        unreached = skipped + unreached
+                        break
+                    continue
+                if finish:
+                    finish()
+                written.append(doc)
+            if invalid:
+                errors.append(invalid)
+            if ordered and errors:
+                break
+
+        if connection is None:
+            for doc in written:
+                identity.add(doc)
+        if errors:
+            for batch in batches:
+                unreached.extend(batch)
+            raise BulkError(errors, unreached=unreached)
+        return written
+
+    @classmethod
+    def insert_many(cls, documents, connection=None, ordered=True, batch_size=None, **options):
+        """
+        Insert an iterable of documents using batched bulk writes. Each document is encoded and
+        validated as in insert() and its _id is set once written. Batches contain at most
+        batch_size documents, which defaults to the 'bulk_batch_size' meta option. Additional
+        args are passed to pymongo's bulk_write(). Return the list of inserted documents. Raise
+        BulkError if any document fails to insert.
+        """
+        if cls._meta.disable_insert:
+            msg = "inserts to {} are disabled".format(cls.__name__)
+            raise OperationError(msg)
+        return cls._bulk_write(documents, cls._insert_request, connection, ordered, batch_size,
+                               **options)
+
+    @classmethod
+    def save_many(cls, documents, connection=None, ordered=True, batch_size=None, **options):
+        """
+        Save an iterable of documents using batched bulk writes. Documents with an _id replace
+        the stored document while the rest are inserted. Options are the same as insert_many().
+        Return the list of saved documents.
+        """
+        if cls._meta.disable_save:
+            msg = "saves to {} are disabled".format(cls.__name__)
+            raise OperationError(msg)
+        return cls._bulk_write(documents, cls._save_request, connection, ordered, batch_size,
+                               **options)
+
+    @classmethod
+    def update_many_docs(cls, documents, connection=None, ordered=True, batch_size=None,
+                         **options):
+        """
+        Update an iterable of documents using batched bulk writes. Each document's dirty fields
+        are written as in update() and merged into the document once written. Documents without
+        changes are skipped. Options are the same as insert_many(). Return the list of updated
+        documents.
+        """
+        if cls._meta.disable_update:
+            msg = "updates to {} are disabled".format(cls.__name__)
+            raise OperationError(msg)
+        return cls._bulk_write(documents, cls._update_request, connection, ordered, batch_size,
+                               **options)
 
     @classmethod
     def count(cls, connection=None):
         """Count the number of objects in this collection."""
+        if connection is None and cls._meta.replica is not None:
+            return cls._meta.replica.count(None)
         collection = cls._meta.get_collection(connection)
         return collection.count()
 
+    @classmethod
+    def reload_replica(cls):
+        """Reload the document's replica from the database. Raise OperationError if it has none."""
+        if cls._meta.replica is None:
+            raise OperationError("{} does not have a replica".format(cls.__name__))
+        cls._meta.replica.load()
+
     def __init__(self, *args, **kwargs):
         """Initialize the document with values."""
         for name, value in six.iteritems(kwargs):
@@ -170,45 +445,170 @@ class Document(six.with_metaclass(DocumentBuilder, object)):
         Return the document as a dictionary suitable for saving. If update is
         True then an update document is returned.
         """
-        def modify(name, field):
-            if getattr(field, 'modifier', None):
-                setattr(self, name, field.modifier(getattr(self, name)))
-
-        raw = {}
         if update:
-            sets = {}
-            unsets = {}
-            for name, field in six.iteritems(self._meta.get_fields(self._partial)):
-                modify(name, field)
-                if name not in self._dirty:
-                    continue
-                value = self._attrs.get(name)
-                if value is None:
-                    unsets[name] = ""
-                else:
-                    sets[name] = field.encode(self.__class__, name, value)
-            if sets:
-                raw['$set'] = sets
-            if unsets:
-                raw['$unset'] = unsets
-        else:
-            for name, field in six.iteritems(self._meta.get_fields(self._partial)):
-                modify(name, field)
-                if name in self._attrs:
-                    value = self._attrs[name]
-                    if value is not None:
-                        value = field.encode(self.__class__, name, value)
-                else:
-                    value = self._raw.get(name)
+            return self._encode_update(self._encode_changes())
+        partial = self._partial
+        attrs = self._attrs
+        stored = self._raw
+        raw = {}
+        for name, encode, modifier in self._meta.encode_plan:
+            if partial and name not in partial:
+                continue
+            if modifier:
+                setattr(self, name, modifier(getattr(self, name)))
+            if name in attrs:
+                value = attrs[name]
                 if value is not None:
-                    raw[name] = value
+                    value = encode(value)
+            else:
+                value = stored.get(name)
+            if value is not None:
+                raw[name] = value
         return raw
 
+    def _encode_changes(self):
+        """
+        Return a dictionary of encoded values for the fields which have been assigned or modified
+        in place. Fields which have been removed have a value of None.
+        """
+        partial = self._partial
+        attrs = self._attrs
+        dirty = self._dirty
+        changes = {}
+        for name, encode, modifier in self._meta.encode_plan:
+            if partial and name not in partial:
+                continue
+            if modifier:
+                setattr(self, name, modifier(getattr(self, name)))
+            value = attrs.get(name)
+            if name not in dirty and (value is None or not is_modified(value)):
+                continue
+            if value is not None:
+                value = encode(value)
+            changes[name] = value
+        return changes
+
+    def _encode_update(self, changes):
+        """
+        Return an update document which changes the stored document to match the encoded values.
+        Values which are the same as those stored are skipped and mutable values are updated using
+        the smallest operations that describe the change. Default values which have not been
+        written to the database are not treated as stored.
+        """
+        cls = self.__class__
+        fields = self._meta.fields
+        stored = self._raw
+        defaults = self._defaults or ()
+        update = {}
+        for name, value in six.iteritems(changes):
+            old = None if name in defaults else stored.get(name)
+            fields[name].diff(cls, name, name, old, value, update)
+        return update
+
+    def _is_modified(self):
+        """Return True if a field has been assigned or a field value has been modified in place."""
+        if self._dirty:
+            return True
+        attrs = self._attrs
+        for name in attrs:
+            if is_modified(attrs[name]):
+                return True
+        return False
+
+    def _insert_request(self):
+        """Return a bulk insert request for the document and a function to call on success."""
+        raw = self._encode()
+        self._validate(raw, self._partial)
+        return InsertOne(raw), lambda: self._reset(raw)
+
+    def _save_request(self):
+        """Return a bulk save request for the document and a function to call on success."""
+        if self._partial:
+            raise OperationError("unable to save partial document")
+        raw = self._encode()
+        self._validate(raw, self._partial)
+        if raw.get('_id') is None:
+            request = InsertOne(raw)
+        else:
+            request = ReplaceOne({'_id': raw['_id']}, raw, upsert=True)
+        return request, lambda: self._reset(raw)
+
+    def _update_request(self):
+        """
+        Return a bulk update request for the document's dirty fields and a function to call on
+        success. Return None if the document has no changes.
+        """
+        if not self._id:
+            raise OperationError("unable to update document without an _id")
+        changes = self._encode_changes()
+        update = self._encode_update(changes)
+        if not update:
+            return None
+        self._validate({'$set': changes}, self._partial, True)
+        return UpdateOne({'_id': self._id}, update), lambda: self._apply(update)
+
+    def _apply(self, update):
+        """
+        Apply an update which has been written to the database to the document. Fields changed by
+        operators which cannot be applied locally are removed from the document and the document
+        is marked partial so that it cannot be saved over the stored values. Return the names of
+        the removed fields.
+        """
+        names = {path.split('.')[0] for paths in update.values() for path in paths}
+        if self._defaults:
+            self._defaults.difference_update(names)
+        if apply_update(self._raw, update):
+            self._reset({})
+            return set()
+        for name in names:
+            self._raw.pop(name, None)
+        self._partial = {'_id'} | (self._partial or set(self._meta.fields))
+        self._partial.difference_update(names)
+        self._reset({})
+        return names
+
+    def _update_statement(self, update=None, raw=None):
+        """
+        Return the encoded update statement used by update(). If update is None the statement
+        updates the document's changed fields. Raise ValidationError if validation fails.
+        """
+        if not update:
+            changes = self._encode_changes()
+            update = self._encode_update(changes)
+            self._validate({'$set': changes}, self._partial, True)
+        else:
+            if not raw:
+                update = self._meta.update_encoder.encode(update)
+            self._validate(update.get('$set', {}), self._partial, True)
+        return update
+
     def _reset(self, raw):
         """Reset internal field storage using the raw document."""
         self._raw.update(raw)
-        self._attrs = {}
-        self._dirty = set()
+        if self._defaults:
+            self._defaults.difference_update(raw)
+        if self._meta.compact:
+            self._attrs.clear()
+            self._dirty.clear()
+        else:
+            self._attrs = {}
+            self._dirty = set()
+
+    @classmethod
+    def _invalidate(cls):
+        """Drop the query results cached for the document's collection after a write."""
+        if cls._meta.cache is not None:
+            collection = cls._meta.get_collection()
+            cls._meta.cache.invalidate(get_namespace(collection))
+
+    def _remember(self, connection=None):
+        """
+        Update the active identity maps with the document and drop cached query results after the
+        document has been written.
+        """
+        if connection is None:
+            identity.add(self)
+        self._invalidate()
 
     def __repr__(self):
         attrs = ['{}={}'.format(name, repr(value)) for name, value in self._encode().items()]
@@ -233,6 +633,7 @@ class Document(six.with_metaclass(DocumentBuilder, object)):
         options.pop('manipulate', None)
         self._id = collection.save(raw, manipulate=True, **options)
         self._reset(raw)
+        self._remember(connection)
         return self
 
     def insert(self, connection=None, **options):
@@ -253,15 +654,21 @@ class Document(six.with_metaclass(DocumentBuilder, object)):
         options.pop('manipulate', None)
         self._id = collection.insert(raw, manipulate=True, **options)
         self._reset(raw)
+        self._remember(connection)
         return self
 
-    def update(self, update=None, connection=None, raw=None, sort=None, **options):
+    def update(self, update=None, connection=None, raw=None, sort=None, fetch=None, **options):
         """
         Update the document in the database using the provided update statement. If update is None
         (the default) an update statement is created to set all of the dirty fields in the
         document. This uses the _id field to find the document to update and will raise an error if
-        no _id is set. Additional args are passed to pymongo's update(). Return True if an update
-        was performed or False if no update was needed.
+        no _id is set. If fetch is True the updated document is read back from the database.
+        Otherwise the update is applied to the document locally which avoids transferring the
+        document. Fetch defaults to the 'update_fetch' meta option and is ignored when the
+        collection's write concern is unacknowledged. In that case fields changed by operators
+        which cannot be applied locally are dropped and the document becomes partial. Additional
+        args are passed to pymongo's update(). Return True if an update was performed or False if
+        no update was needed.
         """
         if self._meta.disable_update:
             msg = "updates to {} are disabled".format(self.__class__.__name__)
@@ -271,24 +678,32 @@ class Document(six.with_metaclass(DocumentBuilder, object)):
             raise OperationError("unable to update document without an _id")
 
         collection = self._meta.get_collection(connection)
+        acknowledged = collection.write_concern.acknowledged
+        if fetch is None:
+            fetch = self._meta.update_fetch
 
         if not raw:
-            sort = SortEncoder(self.__class__).encode(sort)
+            sort = self._meta.sort_encoder.encode(sort)
 
-        if not update:
-            update = self._encode(True)
-        elif not raw:
-            update = UpdateEncoder(self.__class__).encode(update)
-
-        self._validate(update.get('$set', {}), self._partial, True)
+        update = self._update_statement(update, raw)
         if update:
             options.pop('multi', None)
             options.pop('new', None)
             options.pop('fields', None)
-            res = collection.find_and_modify(
-                {'_id': self._id}, update, projection=get_projection(self._partial), multi=False,
-                new=True, sort=sort, **options)
-            self._reset(res)
+            if fetch and acknowledged:
+                res = collection.find_and_modify(
+                    {'_id': self._id}, update, projection=get_projection(self._partial),
+                    multi=False, new=True, sort=sort, **options)
+                self._reset(res)
+            else:
+                collection.update_one({'_id': self._id}, update, **options)
+                partial = self._partial
+                names = self._apply(update)
+                if names and acknowledged:
+                    res = collection.find_one({'_id': self._id}, projection=list(names))
+                    self._reset(res or {})
+                    self._partial = partial
+            self._remember(connection)
             return True
         return False
 
@@ -303,6 +718,8 @@ class Document(six.with_metaclass(DocumentBuilder, object)):
 
         collection = self._meta.get_collection(connection)
         if self._id:
+            identity.discard(self.__class__, self._id)
             res = collection.remove(self._id)
+            self._invalidate()
             return res.get('n', 0) > 0
         return False
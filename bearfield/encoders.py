@@ -1,6 +1,7 @@
 """Additional data encoders."""
 from __future__ import absolute_import
 from .errors import EncodingError
+from .types import identity
 from collections import OrderedDict
 import six
 
@@ -78,18 +79,38 @@ class BaseEncoder(object):
         return encoded
 
 
+def dispatch(cls):
+    """
+    Class decorator which builds the dispatch table of an operator encoder. The table maps each
+    operator in the class's ops to the name of its encode method.
+    """
+    table = {}
+    for op, name in six.iteritems(cls.ops):
+        name = 'encode_' + name
+        if hasattr(cls, name):
+            table[op] = name
+    cls.dispatch = table
+    return cls
+
+
 class OperatorEncoder(BaseEncoder):
-    """Base encoder for specs with operators."""
+    """
+    Base encoder for specs with operators. Each encoder binds the methods in its class's dispatch
+    table when it is created. Encoders hold no other state so one instance for each document class
+    is kept in the document's metadata.
+    """
     ops = {}
+    dispatch = {}
+
+    def __init__(self, document):
+        """Create an encoder for the given document."""
+        self.document = document
+        self.methods = {op: getattr(self, name) for op, name in six.iteritems(self.dispatch)}
+        self.field_encoders = {}
 
     def get_encode_method(self, op):
         """Return the encode method for an operator."""
-        name = self.ops.get(op)
-        if name:
-            name = 'encode_' + name
-            if hasattr(self, name):
-                return getattr(self, name)
-        return self.encode_default
+        return self.methods.get(op, self.encode_default)
 
     def get_field(self, name):
         """Return the field for the given name."""
@@ -126,6 +147,7 @@ class SortEncoder(BaseEncoder):
         raise EncodingError('unable to encode sort value', value=value)
 
 
+@dispatch
 class QueryEncoder(OperatorEncoder):
     """Encode query specs."""
 
@@ -158,10 +180,6 @@ class QueryEncoder(OperatorEncoder):
         '$nearSphere': 'geo',
     }
 
-    def __init__(self, document):
-        """Create a query encoder for a document type."""
-        self.document = document
-
     def is_operator_name(self, name):
         """Return True if the name is an operator name."""
         return str(name)[:1] == '$'
@@ -206,7 +224,7 @@ class QueryEncoder(OperatorEncoder):
         else:
             from .document import Document
             document = Document
-        return QueryEncoder(document).encode(value)
+        return document._meta.query_encoder.encode(value)
 
     def encode_geo(self, name, value):
         """Return a value encoded as a geo query."""
@@ -239,7 +257,7 @@ class QueryEncoder(OperatorEncoder):
                 if self.is_array_field(field):
                     value = field.encode(self.document, name, value)
                 else:
-                    value = [field.encode(self.document, name, v) for v in value]
+                    value = self.encode_values(name, field, value)
             else:
                 if self.is_array_field(field):
                     value = field.typ.encode_element(self.document, name, value)
@@ -249,6 +267,22 @@ class QueryEncoder(OperatorEncoder):
             value = self.encode_default(name, value)
         return value
 
+    def encode_values(self, name, field, values):
+        """
+        Return a list of values each encoded as a value of the field. The field's compiled encoder
+        is cached. Lists of values which already have the field's builtin type, such as lists of
+        ids, are copied without encoding each value.
+        """
+        encoder = self.field_encoders.get(name)
+        if encoder is None:
+            encoder = self.field_encoders[name] = field.compile_encoder(self.document, name)
+        if encoder is identity:
+            return list(values)
+        builtin = getattr(encoder, 'builtin', None)
+        if builtin is not None and all(type(value) is builtin for value in values):
+            return list(values)
+        return [encoder(value) for value in values]
+
     def encode_operator(self, name, value):
         """Return a value encoded as an operator dictionary."""
         if value is None:
@@ -288,7 +322,145 @@ class QueryEncoder(OperatorEncoder):
             encoded[item_name] = item_value
         return encoded
 
+    def compile(self, value):
+        """
+        Return a function which encodes a query value containing Param placeholders. The function
+        takes a dictionary of parameter values and returns the encoded query. Values without
+        parameters are encoded once and field lookups are resolved once so binding parameters only
+        runs the field encoders.
+        """
+        from .query import has_params
+        if not value:
+            return lambda params: None
+        try:
+            value = OrderedDict(value)
+        except (TypeError, ValueError):
+            raise EncodingError("unable to encode query", self.document, '<query>', value)
+
+        plan = []
+        for item_name, item_value in six.iteritems(value):
+            item_name = self.encode_str('<query>', item_name)
+            if not has_params(item_value):
+                item_value = self.encode(OrderedDict([(item_name, item_value)]))[item_name]
+                plan.append((item_name, None, item_value))
+            elif self.is_operator_name(item_name):
+                plan.append((item_name, self.compile_operator(item_name, item_value), None))
+            elif self.is_operator_value(item_value):
+                plan.append((item_name, self.compile_operators(item_name, item_value), None))
+            else:
+                plan.append((item_name, self.compile_value(item_name, item_value), None))
 
+        def encode(params):
+            encoded = OrderedDict()
+            for name, encoder, constant in plan:
+                encoded[name] = constant if encoder is None else encoder(params)
+            return encoded
+        return encode
+
+    def compile_field(self, name):
+        """Return a function which encodes a field value for the named field."""
+        field = self.get_field(name)
+        if not field:
+            return lambda value: self.encode_default(name, value)
+
+        document = self.document
+        encoder = field.compile_encoder(document, name)
+        array_field = self.is_array_field(field)
+
+        def encode(value):
+            if value is None:
+                return None
+            if self.is_compiled_regex(value):
+                return self.encode_default(name, value)
+            if self.is_array_value(value):
+                if array_field:
+                    return encoder(value)
+                return [encoder(item) for item in value]
+            if array_field:
+                return field.typ.encode_element(document, name, value)
+            return encoder(value)
+        return encode
+
+    def compile_value(self, name, value):
+        """
+        Return a function which encodes the value of a field from query parameters. A value which
+        is a Param is encoded using the field's encoder, or as operators if the parameter is bound
+        to a dictionary. Params nested in other values are replaced before encoding.
+        """
+        from .query import Param, bind_params
+        if isinstance(value, Param):
+            encode_field = self.compile_field(name)
+
+            def encode(params):
+                item = value.get(params)
+                if isinstance(item, dict):
+                    return self.encode_operators(name, item)
+                return encode_field(item)
+            return encode
+
+        def encode_nested(params):
+            return self.encode(OrderedDict([(name, bind_params(value, params))]))[name]
+        return encode_nested
+
+    def compile_operator(self, name, value):
+        """Return a function which encodes a logical operator or negation from query parameters."""
+        from .query import bind_params
+        op = self.ops.get(name)
+        if op == 'logical' and self.is_array_value(value):
+            encoders = [self.compile(item) for item in value]
+            return lambda params: [encode(params) for encode in encoders]
+        if op == 'negation':
+            return self.compile(value)
+
+        def encode(params):
+            return self.encode(OrderedDict([(name, bind_params(value, params))]))[name]
+        return encode
+
+    def compile_operators(self, name, value):
+        """Return a function which encodes an operator dictionary from query parameters."""
+        from .query import Param, has_params
+        plan = []
+        for op, op_value in six.iteritems(OrderedDict(value)):
+            op = self.encode_str(name, op)
+            method = self.get_encode_method(op)
+            if not has_params(op_value):
+                if op_value is not None:
+                    op_value = method(name, op_value)
+                plan.append((op, None, op_value))
+            elif isinstance(op_value, Param) and method == self.encode_field:
+                plan.append((op, self.compile_param(op_value, self.compile_field(name)), None))
+            else:
+                plan.append((op, self.compile_nested(name, op_value, method), None))
+
+        def encode(params):
+            encoded = OrderedDict()
+            for op, encoder, constant in plan:
+                encoded[op] = constant if encoder is None else encoder(params)
+            return encoded
+        return encode
+
+    def compile_param(self, param, encoder):
+        """Return a function which encodes a parameter value with encoder."""
+        def encode(params):
+            value = param.get(params)
+            if value is None:
+                return None
+            return encoder(value)
+        return encode
+
+    def compile_nested(self, name, value, method):
+        """Return a function which encodes a value after replacing its parameters."""
+        from .query import bind_params
+
+        def encode(params):
+            bound = bind_params(value, params)
+            if bound is None:
+                return None
+            return method(name, bound)
+        return encode
+
+
+@dispatch
 class UpdateEncoder(OperatorEncoder):
     """Encode update specs."""
 
@@ -311,10 +483,6 @@ class UpdateEncoder(OperatorEncoder):
         '$bit': 'bitwise',
     }
 
-    def __init__(self, document):
-        """Create an encoder for the given document class."""
-        self.document = document
-
     def is_positional(self, name):
         """Return True if the field name has a positional operator attached."""
         return name[-2:] == '.$'
@@ -326,9 +494,8 @@ class UpdateEncoder(OperatorEncoder):
         return name
 
     def get_field(self, name):
-        """Return a named document field."""
-        name = self.get_field_name(name)
-        return super(UpdateEncoder, self).get_field(name)
+        """Return a named document field. A positional operator at the end of name is ignored."""
+        return self.document._meta.get_field(name, True)
 
     def encode_scalar(self, name, value):
         """Encode a scalar update value."""
@@ -387,7 +554,7 @@ class UpdateEncoder(OperatorEncoder):
 
     def encode_sort(self, name, value):
         """Encode a sort spec."""
-        return SortEncoder(self.document).encode(value)
+        return self.document._meta.sort_encoder.encode(value)
 
     def encode_push(self, name, value):
         """Encode a push update value."""
@@ -422,7 +589,7 @@ class UpdateEncoder(OperatorEncoder):
         if isinstance(value, Query):
             return value.encode(self.document)
         else:
-            return QueryEncoder(self.document).encode_field(name, value)
+            return self.document._meta.query_encoder.encode_field(name, value)
 
     def encode_currentdate(self, name, value):
         """Encode a currentdate value."""
@@ -39,6 +39,24 @@ class OperationError(DocumentError):
     message = "operation failed"
 
 
+class BulkError(OperationError):
+    """
+    Raised when a bulk operation fails for one or more documents. The errors attribute is a list
+    of (document, error) tuples where error is the server's error document or the exception raised
+    while preparing the document. The unreached attribute is a list of the documents which were
+    not attempted because an ordered operation stopped at the first failure.
+    """
+    message = "bulk operation failed"
+
+    def __init__(self, errors, message=None, unreached=None):
+        """Create a bulk error for the given (document, error) tuples."""
+        self.errors = errors
+        self.unreached = unreached or []
+        if message is None:
+            message = "{} for {} document(s)".format(self.message, len(errors))
+        super(BulkError, self).__init__(message)
+
+
 class ValidationError(DocumentError):
     """Raised when document or field validation fails."""
     message = "value is invalid"
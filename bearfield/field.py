@@ -1,22 +1,33 @@
 """Field objects."""
 from .errors import EncodingError
-from .types import FieldType
+from .session import track
+from .tracking import diff_value
+from .types import FieldType, identity
+from .utils import is_overridden
 
 
 class BaseField(object):
     """Base field object which all fields inherit from."""
     default = None
 
+    def load(self, obj, name):
+        """Return the document attribute decoded from the raw document."""
+        value = obj._raw.get(name)
+        if value is not None:
+            decode = obj._meta.decoders.get(name)
+            try:
+                if decode is None:
+                    value = self.decode(obj.__class__, name, value)
+                else:
+                    value = decode(value)
+            except EncodingError as e:
+                raise TypeError(e)
+        return value
+
     def getter(self, obj, name):
         """Return a document attribute as this field."""
         if name not in obj._attrs:
-            value = obj._raw.get(name)
-            if value is not None:
-                try:
-                    value = self.decode(obj.__class__, name, value)
-                except EncodingError as e:
-                    raise TypeError(e)
-            obj._attrs[name] = value
+            obj._attrs[name] = self.load(obj, name)
         return obj._attrs[name]
 
     def setter(self, obj, name, value):
@@ -25,6 +36,7 @@ class BaseField(object):
         obj._dirty.add(name)
         if obj._partial:
             obj._partial.add(name)
+        track(obj)
 
     def __call__(field, doc, name):
         """Return the document property used to access the field."""
@@ -38,6 +50,36 @@ class BaseField(object):
 
         return prop
 
+    def compact(field, doc, name, slot, position):
+        """
+        Return the document property used to access the field of a compact document. The value is
+        read from and written to the field's slot and the field's bit in the dirty bitmap directly.
+        Fields which override getter or setter use the property returned by __call__.
+        """
+        if is_overridden(field, BaseField, 'getter') or is_overridden(field, BaseField, 'setter'):
+            return field(doc, name)
+        member = getattr(doc, slot)
+        bit = 1 << position
+
+        @property
+        def prop(self):
+            try:
+                return member.__get__(self, doc)
+            except AttributeError:
+                value = field.load(self, name)
+                member.__set__(self, value)
+                return value
+
+        @prop.setter
+        def prop(self, value):
+            member.__set__(self, value)
+            self._dirty_bits = getattr(self, '_dirty_bits', 0) | bit
+            if self._partial:
+                self._partial.add(name)
+            track(self)
+
+        return prop
+
     def encode(self, cls, name, value):
         """Return the value encoded for storage in the database."""
         return value
@@ -49,6 +91,35 @@ class BaseField(object):
     def validate(self, cls, name, value):
         """Validate the field value. Raise ValidationError on failure."""
 
+    def diff(self, cls, name, path, old, new, update):
+        """
+        Add the operations needed to change the stored value old at path into the encoded value
+        new to the update document.
+        """
+        diff_value(path, old, new, update)
+
+    def compile_encoder(self, cls, name):
+        """
+        Return a function which encodes a single value of this field for the named field of the
+        document class. The function takes the value as its only argument.
+        """
+        encode = self.encode
+
+        def encoder(value):
+            return encode(cls, name, value)
+        return encoder
+
+    def compile_decoder(self, cls, name):
+        """
+        Return a function which decodes a single value of this field for the named field of the
+        document class. The function takes the value as its only argument.
+        """
+        decode = self.decode
+
+        def decoder(value):
+            return decode(cls, name, value)
+        return decoder
+
 
 class Field(BaseField):
     """A field object defines how a document field behaves."""
@@ -94,3 +165,25 @@ class Field(BaseField):
         if self.strict:
             for validator in self.validators:
                 validator(cls, name, value)
+
+    def diff(self, cls, name, path, old, new, update):
+        """Add the operations needed to change the stored value using the field type."""
+        if self.strict:
+            return self.typ.diff(cls, name, path, old, new, update)
+        diff_value(path, old, new, update)
+
+    def compile_encoder(self, cls, name):
+        """Return a function which encodes a single value using the field type's encoder."""
+        if is_overridden(self, Field, 'encode'):
+            return super(Field, self).compile_encoder(cls, name)
+        if not self.strict:
+            return identity
+        return self.typ.compile_encoder(cls, name)
+
+    def compile_decoder(self, cls, name):
+        """Return a function which decodes a single value using the field type's decoder."""
+        if is_overridden(self, Field, 'decode'):
+            return super(Field, self).compile_decoder(cls, name)
+        if not self.strict:
+            return identity
+        return self.typ.compile_decoder(cls, name)
@@ -0,0 +1,157 @@
+"""Identity maps which reuse documents loaded by _id."""
+from __future__ import absolute_import
+from collections import OrderedDict
+import threading
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # pragma: no cover
+    ContextVar = None
+
+if ContextVar is not None:
+    active = ContextVar('bearfield_identity_maps', default=())
+
+    def get_maps():
+        """Return the tuple of identity maps active in the current context."""
+        return active.get()
+
+    def set_maps(maps):
+        """Set the tuple of identity maps active in the current context."""
+        active.set(maps)
+else:  # pragma: no cover
+    state = threading.local()
+
+    def get_maps():
+        """Return the tuple of identity maps active in the current thread."""
+        return getattr(state, 'maps', ())
+
+    def set_maps(maps):
+        """Set the tuple of identity maps active in the current thread."""
+        state.maps = maps
+
+
+def current():
+    """
+    Return the active identity map for the current context or None if there isn't one. Each
+    thread and each asyncio task has its own context.
+    """
+    maps = get_maps()
+    if maps:
+        return maps[-1]
+    return None
+
+
+def get(cls, _id):
+    """Return the document of type cls with the given _id from the active identity map or None."""
+    mapping = current()
+    if mapping is None:
+        return None
+    return mapping.get(cls, _id)
+
+
+def add(document):
+    """Add a document to every active identity map. Partial documents are discarded instead."""
+    for mapping in get_maps():
+        mapping.add(document)
+
+
+def discard(cls, _id):
+    """Remove the document of type cls with the given _id from every active identity map."""
+    for mapping in get_maps():
+        mapping.discard(cls, _id)
+
+
+def clear(cls=None):
+    """Remove the documents of type cls, or all documents, from every active identity map."""
+    for mapping in get_maps():
+        mapping.clear(cls)
+
+
+def get_id(criteria):
+    """Return the _id matched by encoded criteria which only match a single _id or None."""
+    if not criteria or len(criteria) != 1:
+        return None
+    _id = criteria.get('_id')
+    if isinstance(_id, (dict, list, tuple, set)):
+        return None
+    return _id
+
+
+class IdentityMap(object):
+    """
+    Map document _ids to the documents loaded while the map is active. While a map is active
+    find_one() by _id, get_many(), and references return the documents it holds instead of
+    querying the database. Documents which are saved, updated, or removed are kept up to date in
+    the map. The least recently used documents are dropped once the map holds size documents.
+    """
+
+    def __init__(self, size=1000):
+        """Create an identity map which holds up to size documents."""
+        self.size = size
+        self.documents = OrderedDict()
+
+    def __enter__(self):
+        """Activate the identity map for the current context."""
+        set_maps(get_maps() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Deactivate the identity map and drop its documents."""
+        set_maps(tuple(mapping for mapping in get_maps() if mapping is not self))
+        self.clear()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def get(self, cls, _id):
+        """Return the document of type cls with the given _id or None if it isn't in the map."""
+        key = (cls, _id)
+        try:
+            document = self.documents.pop(key)
+        except (KeyError, TypeError):
+            return None
+        self.documents[key] = document
+        return document
+
+    def add(self, document):
+        """
+        Add a document to the map, replacing any other document of the same type and _id. Partial
+        documents and documents without an _id are not added. A partial document discards the
+        full document with its _id instead.
+        """
+        _id = getattr(document, '_id', None)
+        if _id is None:
+            return
+        key = (document.__class__, _id)
+        try:
+            self.documents.pop(key, None)
+        except TypeError:
+            return
+        if document._partial:
+            return
+        self.documents[key] = document
+        while len(self.documents) > self.size:
+            self.documents.popitem(False)
+
+    def discard(self, cls, _id):
+        """Remove the document of type cls with the given _id if it is in the map."""
+        try:
+            self.documents.pop((cls, _id), None)
+        except TypeError:
+            pass
+
+    def clear(self, cls=None):
+        """Remove the documents of type cls from the map. Remove all documents if cls is None."""
+        if cls is None:
+            self.documents.clear()
+            return
+        for key in [key for key in self.documents if key[0] is cls]:
+            del self.documents[key]
+
+
+def identity_map(size=1000):
+    """
+    Return a new identity map for use as a context manager. Documents loaded by _id inside the
+    block are reused instead of being queried again.
+    """
+    return IdentityMap(size)
@@ -0,0 +1,61 @@
+"""Map and reduce raw query results on a pool of processes."""
+from __future__ import absolute_import
+from bson import BSON, decode_all
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from multiprocessing import cpu_count
+
+
+def encode_batch(docs):
+    """Return a list of raw documents encoded as a batch of raw BSON bytes."""
+    return b''.join(BSON.encode(raw) for raw in docs)
+
+
+def decode_batch(document, data, fields, codec_options):
+    """Return the list of documents decoded from a batch of raw BSON bytes."""
+    return [document._decode(raw, fields, copy=False) for raw in decode_all(data, codec_options)]
+
+
+def reduce_values(reducer, values, initial=None):
+    """
+    Return the values reduced using reducer starting from initial. If initial is None reduction
+    starts from the first value and values must not be empty.
+    """
+    if initial is None:
+        return reduce(reducer, values)
+    return reduce(reducer, values, initial)
+
+
+def map_batch(document, data, fields, codec_options, mapper, reducer, initial):
+    """
+    Decode a batch of raw BSON bytes and call mapper with each document. If reducer is None return
+    the list of mapped values. Otherwise return the mapped values reduced with reduce_values().
+    """
+    values = [mapper(doc) for doc in decode_batch(document, data, fields, codec_options)]
+    if reducer is None:
+        return values
+    return reduce_values(reducer, values, initial)
+
+
+def iter_results(batches, document, fields, codec_options, mapper, reducer, initial, workers=None,
+                 max_pending=None):
+    """
+    Yield the result of map_batch for each batch of raw BSON bytes in order. Empty batches are
+    skipped. Batches are processed by a pool of worker processes. At most max_pending batches are
+    submitted to the pool at once, which defaults to twice the number of workers, so raw batches
+    are not read faster than they can be processed.
+    """
+    workers = workers or cpu_count()
+    max_pending = max_pending or workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for data in batches:
+            if not data:
+                continue
+            pending.append(executor.submit(map_batch, document, data, fields, codec_options,
+                                           mapper, reducer, initial))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
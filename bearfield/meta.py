@@ -1,13 +1,22 @@
 """Meta functionality used for document creation."""
 from __future__ import absolute_import
+from .cache import get_cache
 from .connection import Connection, get as get_connection
+from .encoders import QueryEncoder, SortEncoder, UpdateEncoder
 from .errors import OperationError
 from .field import BaseField, Field
+from .replica import get_replica
+from .session import track
+from .storage import compact_attrs, slot_name
 from .utils import to_snake_case
 from bson import ObjectId
+from pymongo.write_concern import WriteConcern
 import pymongo
 import six
 
+# maximum number of cached field views for partial documents
+max_partial_views = 256
+
 
 class DocumentMeta(object):
     """Metadata container for Document classes."""
@@ -21,9 +30,11 @@ class DocumentMeta(object):
         self.bind_init()
 
         fields = {}
+        compact = False
         for base in reversed(cls.__bases__):
             if isinstance(getattr(base, '_meta', None), self.__class__):
                 fields.update(base._meta.fields)
+                compact = compact or base._meta.compact
 
         if attrs:
             for name, attr in attrs.items():
@@ -35,8 +46,16 @@ class DocumentMeta(object):
         if meta:
             self.options.update(vars(meta))
 
+        self.compact = bool(self.options.pop('compact', False)) or compact
         self.connection = self.options.pop('connection', None)
         self.indexes = self.options.pop('indexes', [])
+        self.bulk_batch_size = int(self.options.pop('bulk_batch_size', 1000))
+        self.update_fetch = bool(self.options.pop('update_fetch', True))
+        self.optimize_queries = bool(self.options.pop('optimize_queries', True))
+        self.in_chunk_size = int(self.options.pop('in_chunk_size', 10000) or 0)
+        self.write_concern = get_write_concern(self.options.pop('write_concern', None))
+        self.cache = get_cache(self.options.pop('cache', None))
+        self.replica = get_replica(cls, self.options.pop('replica', None), self.readonly)
         self.collection = self.options.pop('collection', None)
         if not self.collection:
             self.collection = to_snake_case(cls.__name__)
@@ -45,7 +64,19 @@ class DocumentMeta(object):
         if not self.subdocument and '_id' not in self.fields:
             self.fields['_id'] = Field(ObjectId, require=False)
 
+        self.positions = {name: index for index, name in enumerate(self.fields)}
+        if self.compact:
+            self.slots = {name: slot_name(name) for name in self.fields}
+        else:
+            self.slots = {}
+
         self.bind_fields()
+        self.bind_codecs()
+        self.bind_paths()
+
+        self.query_encoder = QueryEncoder(cls)
+        self.update_encoder = UpdateEncoder(cls)
+        self.sort_encoder = SortEncoder(cls)
 
     def bind_init(meta):
         """Bind init hook to the document class."""
@@ -56,13 +87,18 @@ class DocumentMeta(object):
 
         def __init__(self, *args, **kwargs):
             if not self._partial:
+                raw = self._raw
                 for name, default in six.iteritems(meta.defaults):
-                    if name in self._raw:
+                    if name in raw:
                         continue
                     if hasattr(default, '__call__'):
-                        field = self._meta.get_field(name)
-                        default = field.encode(meta.cls, name, default())
-                    self._raw[name] = default
+                        default = meta.encoders[name](default())
+                    raw[name] = default
+                    if self._defaults is None:
+                        self._defaults = set()
+                    self._defaults.add(name)
+            if self._raw.get('_id') is None:
+                track(self)
             return parent(self, *args, **kwargs)
 
         __init__.name = parent.__name__
@@ -74,7 +110,11 @@ class DocumentMeta(object):
         """Bind fields to the document class."""
         defaults = {}
         for name, field in self.fields.items():
-            setattr(self.cls, name, field(self.cls, name))
+            if self.compact:
+                prop = field.compact(self.cls, name, self.slots[name], self.positions[name])
+            else:
+                prop = field(self.cls, name)
+            setattr(self.cls, name, prop)
             default = field.default
             if default is not None:
                 if not hasattr(default, '__call__'):
@@ -84,6 +124,43 @@ class DocumentMeta(object):
 
         self.defaults = defaults
 
+    def bind_codecs(self):
+        """
+        Compile the encoder and decoder functions for each field of the document class. Fields
+        which provide no fast path fall back to their encode and decode methods.
+        """
+        encoders = {}
+        decoders = {}
+        plan = []
+        for name, field in self.fields.items():
+            encoder = field.compile_encoder(self.cls, name)
+            encoders[name] = encoder
+            decoders[name] = field.compile_decoder(self.cls, name)
+            plan.append((name, encoder, getattr(field, 'modifier', None)))
+
+        self.encoders = encoders
+        self.decoders = decoders
+        self.encode_plan = tuple(plan)
+
+    def bind_paths(self):
+        """
+        Index the fields by path. Fields of subdocuments are indexed by their dotted path using the
+        subdocument's own index. Positional paths used by updates, which end in '.$', are indexed
+        separately so they are only found when requested.
+        """
+        from .types import DocumentType
+        paths = {}
+        for name, field in self.fields.items():
+            paths[name] = field
+            typ = getattr(field, 'typ', None)
+            if isinstance(typ, DocumentType):
+                for path, subfield in six.iteritems(typ.document._meta.paths):
+                    paths['{}.{}'.format(name, path)] = subfield
+
+        self.paths = paths
+        self.positional_paths = {path + '.$': field for path, field in six.iteritems(paths)}
+        self.partial_views = {}
+
     def get_connection(self, connection=None):
         """
         Return the connection associated with this document. If connection is provided then it will
@@ -107,7 +184,10 @@ class DocumentMeta(object):
         if self.collection:
             connection = self.get_connection(connection)
             if connection:
-                return connection[self.collection]
+                collection = connection[self.collection]
+                if self.write_concern:
+                    collection = collection.with_options(write_concern=self.write_concern)
+                return collection
         raise OperationError(
             "document {} has no connection, and no default exists".format(self.cls.__name__))
 
@@ -118,28 +198,29 @@ class DocumentMeta(object):
         return None
 
     def get_fields(self, partial):
-        """Return a dictionary containing active fields."""
-        if partial:
-            return {k: self.fields[k] for k in partial if k in self.fields}
-        return self.fields
-
-    def get_field(self, name):
-        """Return the named field. Supports dot syntax to retrieve fields from subdocuments."""
-        from .types import DocumentType
-        names = name.split('.')
-        names.reverse()
-        doc = self.cls
-        field = None
-
-        while len(names):
-            name = names.pop()
-            field = doc._meta.fields.get(name)
-            if not hasattr(field, 'typ') or not isinstance(field.typ, DocumentType):
-                break
-            doc = field.typ.document
-
-        if len(names):
-            return None
+        """
+        Return a dictionary containing active fields. The dictionary for each partial set of fields
+        is cached and must not be modified.
+        """
+        if not partial:
+            return self.fields
+        key = frozenset(partial)
+        fields = self.partial_views.get(key)
+        if fields is None:
+            if len(self.partial_views) >= max_partial_views:
+                self.partial_views.clear()
+            fields = {k: self.fields[k] for k in key if k in self.fields}
+            self.partial_views[key] = fields
+        return fields
+
+    def get_field(self, name, positional=False):
+        """
+        Return the named field. Supports dot syntax to retrieve fields from subdocuments. If
+        positional is True a trailing positional operator ('.$') is ignored.
+        """
+        field = self.paths.get(name)
+        if field is None and positional:
+            field = self.positional_paths.get(name)
         return field
 
     @property
@@ -182,6 +263,48 @@ class DocumentBuilder(type):
     def __new__(meta, name, bases, attrs):
         """Create and attach metadata to the document."""
         Meta = attrs.pop('Meta', {})
+        if getattr(Meta, 'compact', False) or get_compact_base(bases):
+            attrs = meta.compact_attrs(bases, attrs, Meta)
         cls = type.__new__(meta, name, bases, attrs)
         cls._meta = DocumentMeta(cls, attrs, Meta)
         return cls
+
+    @staticmethod
+    def compact_attrs(bases, attrs, Meta):
+        """
+        Return the class attributes for a compact document. Compact documents store field values
+        in slots instead of an attribute dictionary. Fields which already have slots in a compact
+        base class are not given new ones.
+        """
+        names = set()
+        slotted = set()
+        for base in bases:
+            base_meta = getattr(base, '_meta', None)
+            if isinstance(base_meta, DocumentMeta):
+                names.update(base_meta.fields)
+                slotted.update(base_meta.slots)
+        for name, attr in attrs.items():
+            if isinstance(attr, BaseField):
+                names.add(name)
+        if getattr(Meta, 'connection', None):
+            names.add('_id')
+        return compact_attrs(get_compact_base(bases), attrs, sorted(names - slotted))
+
+
+def get_write_concern(write_concern):
+    """
+    Return a WriteConcern from the 'write_concern' meta option. The option may be a WriteConcern
+    or a dictionary of WriteConcern arguments. Return None if no write concern is configured.
+    """
+    if write_concern is None or isinstance(write_concern, WriteConcern):
+        return write_concern
+    return WriteConcern(**write_concern)
+
+
+def get_compact_base(bases):
+    """Return the first compact document class in bases or None if there isn't one."""
+    for base in bases:
+        base_meta = getattr(base, '_meta', None)
+        if isinstance(base_meta, DocumentMeta) and base_meta.compact:
+            return base
+    return None
@@ -0,0 +1,247 @@
+"""Rewrite encoded queries into simpler equivalent queries."""
+from __future__ import absolute_import
+from collections import OrderedDict
+import six
+
+# field operators which may be negated with a field level $not
+negatable_ops = {
+    '$all', '$elemMatch', '$eq', '$exists', '$gt', '$gte', '$in', '$lt', '$lte', '$mod', '$ne',
+    '$nin', '$options', '$regex', '$size', '$type',
+}
+
+# top level operators which the optimizer rewrites
+logical_ops = frozenset(['$and', '$or', '$nor', '$not'])
+
+# field operators which are replaced by their inverse when negated
+inverse_ops = {
+    '$eq': '$ne',
+    '$ne': '$eq',
+    '$in': '$nin',
+    '$nin': '$in',
+}
+
+
+def is_operator_name(name):
+    """Return True if a name is an operator name."""
+    return isinstance(name, six.string_types) and name[:1] == '$'
+
+
+def is_operator_dict(value):
+    """Return True if a value is a non-empty dictionary of operators."""
+    if not isinstance(value, dict) or not value:
+        return False
+    for name in value:
+        if not is_operator_name(name):
+            return False
+    return True
+
+
+def is_scalar(value):
+    """Return True if a value is matched by equality in both a field query and an $in."""
+    return not isinstance(value, (dict, list, tuple, set))
+
+
+def freeze(value):
+    """
+    Return a hashable value which is equal for equal query values. Types are included so that
+    values such as 1 and True, which MongoDB does not consider equal, stay distinct. Raise
+    TypeError if the value cannot be hashed.
+    """
+    if isinstance(value, dict):
+        return (dict, tuple((name, freeze(item)) for name, item in six.iteritems(value)))
+    if isinstance(value, (list, tuple)):
+        return (list, tuple(freeze(item) for item in value))
+    hash(value)
+    return (type(value), value)
+
+
+def is_same(a, b):
+    """Return True if two query values are the same."""
+    try:
+        return freeze(a) == freeze(b)
+    except TypeError:
+        return type(a) is type(b) and a == b
+
+
+def unique(values):
+    """Return a list of the values with duplicates removed. The order of the values is kept."""
+    seen = set()
+    result = []
+    for value in values:
+        try:
+            key = freeze(value)
+        except TypeError:
+            if value not in result:
+                result.append(value)
+            continue
+        if key not in seen:
+            seen.add(key)
+            result.append(value)
+    return result
+
+
+def optimize(criteria):
+    """
+    Return encoded query criteria rewritten into an optimized query which matches the same
+    documents. The criteria are not modified. The following rewrites are made:
+
+    - nested $and and $or operators are flattened into their parent
+    - $and clauses which do not share fields with the query are merged into it
+    - operators on the same field in different $and clauses are merged when they don't overlap
+    - equality clauses on the same field in an $or are rewritten as an $in
+    - duplicate clauses are removed from $and, $or, and $nor
+    - $not is folded into the clause it negates where possible or replaced by $nor
+
+    Criteria without top level logical operators are already optimal and are returned as is.
+    """
+    if not isinstance(criteria, dict) or logical_ops.isdisjoint(criteria):
+        return criteria
+
+    result = OrderedDict()
+    clauses = []
+    for name, value in six.iteritems(criteria):
+        if name == '$and' and isinstance(value, list):
+            clauses.extend(optimize(clause) for clause in value)
+        elif name in ('$or', '$nor') and isinstance(value, list):
+            value = optimize_disjunction(name, value)
+            if name == '$or' and len(value) == 1:
+                clauses.append(value[0])
+            else:
+                clauses.append(OrderedDict([(name, value)]))
+        elif name == '$not' and isinstance(value, dict):
+            clauses.append(negate(optimize(value)))
+        else:
+            clauses.append(OrderedDict([(name, value)]))
+
+    # duplicates are skipped by merge so only clauses which can't be merged need unique()
+    remaining = []
+    pending = clauses
+    pending.reverse()
+    while pending:
+        clause = pending.pop()
+        if len(clause) == 1 and isinstance(clause.get('$and'), list):
+            pending.extend(reversed(clause['$and']))
+        elif not merge(result, clause):
+            remaining.append(clause)
+    if remaining:
+        if '$and' in result:
+            remaining = result.pop('$and') + remaining
+        result['$and'] = unique(remaining) if len(remaining) > 1 else remaining
+    return result
+
+
+def merge(result, clause):
+    """
+    Merge a clause into an $and result. Return False and leave result unchanged if the clause
+    refers to a field or operator which is already in the result and cannot be combined.
+    """
+    combine = set()
+    for name, value in six.iteritems(clause):
+        if name not in result or is_same(result[name], value):
+            continue
+        current = result[name]
+        if is_operator_name(name) or not is_operator_dict(current) or \
+                not is_operator_dict(value) or set(current) & set(value):
+            return False
+        combine.add(name)
+
+    for name, value in six.iteritems(clause):
+        if name in combine:
+            combined = OrderedDict(result[name])
+            combined.update(value)
+            value = combined
+        elif name in result:
+            continue
+        result[name] = value
+    return True
+
+
+def optimize_disjunction(op, clauses):
+    """
+    Return the optimized list of clauses of an $or or $nor. Nested clauses with the same operator
+    are flattened into an $or and equality clauses on the same field are combined into an $in.
+    """
+    optimized = []
+    for clause in clauses:
+        clause = optimize(clause)
+        if op == '$or' and len(clause) == 1 and isinstance(clause.get('$or'), list):
+            optimized.extend(clause['$or'])
+        else:
+            optimized.append(clause)
+    if len(optimized) < 2:
+        return optimized
+    optimized = unique(optimized)
+    if op != '$or':
+        return optimized
+
+    fields = {}
+    counts = {}
+    equalities = [get_equality(clause) for clause in optimized]
+    for name, values in equalities:
+        if name is not None:
+            fields.setdefault(name, []).extend(values)
+            counts[name] = counts.get(name, 0) + 1
+    if all(count == 1 for count in six.itervalues(counts)):
+        return optimized
+
+    result = []
+    added = set()
+    for clause, (name, values) in zip(optimized, equalities):
+        if name is None or counts[name] == 1:
+            result.append(clause)
+        elif name not in added:
+            added.add(name)
+            result.append(OrderedDict([(name, OrderedDict([('$in', unique(fields[name]))]))]))
+    return result
+
+
+def get_equality(clause):
+    """
+    Return the field name and the list of values matched by a clause which only matches a single
+    field by equality or with $in. Return (None, None) for any other clause.
+    """
+    if len(clause) != 1:
+        return None, None
+    name, value = next(six.iteritems(clause))
+    if is_operator_name(name):
+        return None, None
+    if is_scalar(value):
+        return name, [value]
+    if isinstance(value, dict) and list(value) == ['$in'] and isinstance(value['$in'], list):
+        values = value['$in']
+        if all(is_scalar(item) for item in values):
+            return name, values
+    return None, None
+
+
+def negate(clause):
+    """Return an optimized clause which matches the documents not matched by clause."""
+    if len(clause) != 1:
+        return OrderedDict([('$nor', [clause])]) if clause else OrderedDict([('$not', clause)])
+
+    name, value = next(six.iteritems(clause))
+    if name == '$not':
+        return value
+    if name == '$or' and isinstance(value, list):
+        return OrderedDict([('$nor', value)])
+    if name == '$nor' and isinstance(value, list):
+        if len(value) == 1:
+            return value[0]
+        return OrderedDict([('$or', value)])
+    if is_operator_name(name):
+        return OrderedDict([('$nor', [clause])])
+
+    if is_operator_dict(value):
+        ops = list(value)
+        if ops == ['$not']:
+            return OrderedDict([(name, value['$not'])])
+        if ops == ['$ne'] and not is_operator_dict(value['$ne']):
+            return OrderedDict([(name, value['$ne'])])
+        if len(ops) == 1 and ops[0] in inverse_ops:
+            return OrderedDict([(name, OrderedDict([(inverse_ops[ops[0]], value[ops[0]])]))])
+        if negatable_ops.issuperset(ops):
+            return OrderedDict([(name, OrderedDict([('$not', value)]))])
+        return OrderedDict([('$nor', [clause])])
+    if hasattr(value, 'pattern'):
+        return OrderedDict([(name, OrderedDict([('$not', value)]))])
+    return OrderedDict([(name, OrderedDict([('$ne', value)]))])
@@ -1,12 +1,19 @@
 """Query tools."""
 from __future__ import absolute_import
-from .encoders import QueryEncoder
+from .errors import EncodingError
+from .optimizer import optimize as optimize_criteria
 from collections import OrderedDict
 from copy import deepcopy
+import six
 
 
 class Query(object):
-    """A query abstracts a MongoDB query."""
+    """
+    A query abstracts a MongoDB query. Queries are immutable. Combining queries creates a new
+    query which shares the combined queries instead of copying them. The criteria of a combined
+    query are only built when they are first needed, usually when the query is encoded.
+    """
+    _bound = False
 
     def __init__(self, criteria):
         """
@@ -14,49 +21,148 @@ class Query(object):
         that may be converted to an OrderedDict which is the internal query representation. Raises
         a TypeError if criteria does not fit these requirements.
         """
-        if criteria is None:
-            criteria = OrderedDict()
-        elif isinstance(criteria, Query):
+        self._operator = None
+        self._left = None
+        self._right = None
+        if isinstance(criteria, Query):
+            self._bound = criteria._bound
+            if criteria._operator:
+                self._operator = criteria._operator
+                self._left = criteria._left
+                self._right = criteria._right
+                self._criteria = criteria._criteria and criteria._criteria.copy()
+                return
             criteria = criteria.criteria.copy()
+        elif criteria is None:
+            criteria = OrderedDict()
         elif not isinstance(criteria, OrderedDict):
             try:
                 criteria = OrderedDict(criteria)
             except (TypeError, ValueError):
                 raise TypeError("invalid query value {}".format(repr(criteria)))
-        self.criteria = criteria
+        self._criteria = criteria
+
+    @classmethod
+    def _combine(cls, operator, left, right=None):
+        """
+        Return a query which combines left and right with a logical operator or negates left if
+        operator is '$not'.
+        """
+        query = cls.__new__(cls)
+        query._operator = operator
+        query._left = left
+        query._right = right
+        query._criteria = None
+        query._bound = left._bound or (right is not None and right._bound)
+        return query
+
+    @property
+    def criteria(self):
+        """Return the query criteria as an OrderedDict."""
+        if self._criteria is None:
+            if self._operator == '$not':
+                value = self._left.criteria
+            else:
+                value = self._items()
+            self._criteria = OrderedDict([(self._operator, value)])
+        return self._criteria
+
+    def _items(self):
+        """
+        Return the criteria of the queries combined by the operator of this query. Queries on the
+        left side which use the same operator are flattened into a single list.
+        """
+        operator = self._operator
+        items = []
+        query = self
+        while query._operator == operator:
+            items.append(query._right.criteria)
+            query = query._left
+        if query._is_operator(operator):
+            items.extend(reversed(query._criteria[operator]))
+        else:
+            items.append(query.criteria)
+        items.reverse()
+        return items
+
+    def _is_empty(self):
+        """Return True if the query has no criteria."""
+        return self._operator is None and len(self._criteria) == 0
+
+    def _is_operator(self, operator):
+        """Return True if the query only contains the given operator."""
+        if self._operator is not None:
+            return self._operator == operator
+        return len(self._criteria) == 1 and operator in self._criteria
 
     def copy(self):
         """Return a copy of the query."""
-        return Query(deepcopy(self.criteria))
+        if self._bound and self._operator:
+            right = self._right and self._right.copy()
+            return Query._combine(self._operator, self._left.copy(), right)
+        query = Query(deepcopy(self.criteria))
+        query._bound = self._bound
+        return query
 
-    def encode(self, document, raw=None):
-        """Return the encoded query in the context of the given document."""
+    def encode(self, document, raw=None, optimize=None):
+        """
+        Return the encoded query in the context of the given document. If optimize is True the
+        encoded query is rewritten into a simpler query which matches the same documents. Optimize
+        defaults to the document's 'optimize_queries' meta option. Raw queries are never optimized.
+        """
         if raw:
             return self.criteria
-        return QueryEncoder(document).encode(self.criteria)
+        criteria = self._encode_criteria(document)
+        if optimize is None:
+            optimize = document._meta.optimize_queries
+        if optimize and criteria:
+            criteria = optimize_criteria(criteria)
+        return criteria
+
+    def _encode_criteria(self, document):
+        """
+        Return the encoded criteria. Parts of the query which were combined from bound queries are
+        already encoded and are not encoded again.
+        """
+        if not self._bound:
+            return document._meta.query_encoder.encode(self.criteria)
+        operator = self._operator
+        if operator is None:
+            return self._criteria
+        if operator == '$not':
+            return OrderedDict([(operator, self._left._encode_criteria(document))])
+        items = []
+        query = self
+        while query._operator == operator:
+            items.append(query._right._encode_criteria(document))
+            query = query._left
+        criteria = query._encode_criteria(document)
+        if query._is_operator(operator):
+            items.extend(reversed(criteria[operator]))
+        else:
+            items.append(criteria)
+        items.reverse()
+        return OrderedDict([(operator, items)])
 
     def _op(self, op, query):
         """Combine two queries with an operator and return the resulting query."""
-        if len(self.criteria) == 0:
-            return query.copy()
-        if len(query.criteria) == 0:
-            return self.copy()
-        if len(self.criteria) == 1 and op in self.criteria:
-            criteria = deepcopy(self.criteria)
-            criteria[op].append(deepcopy(query.criteria))
-            return Query(criteria)
-        else:
-            criteria = [(op, [deepcopy(self.criteria), deepcopy(query.criteria)])]
-            return Query(criteria)
+        if self._is_empty():
+            return Query(query)
+        if query._is_empty():
+            return Query(self)
+        return Query._combine(op, self, query)
 
     def negate(self):
         """Negate a query."""
-        if len(self.criteria) == 0:
-            return self.copy()
-        if len(self.criteria) == 1 and '$not' in self.criteria:
-            return Query(deepcopy(self.criteria['$not']))
-        else:
-            return Query({'$not': deepcopy(self.criteria)})
+        if self._is_empty():
+            return Query(self)
+        if self._operator == '$not':
+            return Query(self._left)
+        if self._is_operator('$not'):
+            query = Query(self._criteria['$not'])
+            query._bound = self._bound
+            return query
+        return Query._combine('$not', self)
 
     def nor(self, query):
         """Nor this query with another and return the resulting query."""
@@ -81,3 +187,102 @@ class Query(object):
 
 
 Q = Query
+
+
+def make_query(query):
+    """Return the query if it is a Query, otherwise a new Query with query as its criteria."""
+    if isinstance(query, Query):
+        return query
+    return Query(query)
+
+
+class Param(object):
+    """A named placeholder for a value in a prepared query."""
+
+    def __init__(self, name):
+        """Create a placeholder for the named parameter."""
+        self.name = name
+
+    def get(self, params):
+        """Return the value of the parameter. Raise EncodingError if it is missing."""
+        try:
+            return params[self.name]
+        except KeyError:
+            raise EncodingError("missing query parameter", field=self.name)
+
+    def __eq__(self, other):
+        return isinstance(other, Param) and self.name == other.name
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((Param, self.name))
+
+    def __repr__(self):
+        return 'Param({})'.format(repr(self.name))
+
+
+def has_params(value):
+    """Return True if a query value contains a Param."""
+    if isinstance(value, Param):
+        return True
+    if isinstance(value, dict):
+        value = six.itervalues(value)
+    elif not isinstance(value, (list, tuple, set)):
+        return False
+    for item in value:
+        if has_params(item):
+            return True
+    return False
+
+
+def bind_params(value, params):
+    """Return a copy of a query value with each Param replaced by its value in params."""
+    if isinstance(value, Param):
+        return value.get(params)
+    if isinstance(value, dict):
+        return OrderedDict(
+            (name, bind_params(item, params)) for name, item in six.iteritems(value))
+    if isinstance(value, (list, tuple, set)):
+        return value.__class__(bind_params(item, params) for item in value)
+    return value
+
+
+class PreparedQuery(object):
+    """
+    A query with Param placeholders which is encoded for a document in advance. Field lookups and
+    the parts of the query without parameters are encoded once. Binding the parameters only
+    encodes their values.
+    """
+
+    def __init__(self, document, criteria):
+        """Prepare the criteria for the given document type."""
+        self.document = document
+        self.criteria = Query(criteria).criteria
+        self._encode = document._meta.query_encoder.compile(self.criteria)
+
+    def encode(self, **params):
+        """Return the query encoded with the provided parameter values."""
+        return self._encode(params)
+
+    def bind(self, **params):
+        """Return a Query with the provided parameter values which is already encoded."""
+        return BoundQuery(self.encode(**params))
+
+    def __repr__(self):
+        return 'PreparedQuery({}, {})'.format(self.document.__name__, dict(self.criteria))
+
+
+class BoundQuery(Query):
+    """
+    A query returned by PreparedQuery.bind. The criteria are already encoded. Queries combined
+    with a bound query only encode their own criteria.
+    """
+    _bound = True
+
+    def __init__(self, criteria):
+        """Initialize the query with encoded criteria."""
+        super(BoundQuery, self).__init__(None)
+        if criteria is not None:
+            self._criteria = criteria
@@ -7,6 +7,12 @@ from .query import Query
 from bson import ObjectId
 from bson.errors import InvalidId
 import six
+import sys
+
+if sys.version_info >= (3, 6):
+    from .aio import AsyncReferenceFinder
+else:  # pragma: no cover
+    AsyncReferenceFinder = object
 
 
 class Reference(BaseField):
@@ -71,7 +77,7 @@ class Reference(BaseField):
         return value
 
 
-class ReferenceFinder(object):
+class ReferenceFinder(AsyncReferenceFinder):
     """Proxy calls to the reference value."""
 
     def __init__(self, reference, document, name):
@@ -103,6 +109,23 @@ class ReferenceFinder(object):
             value = Query({'_id': value})
         return value
 
+    def prefetched(self, fields=None, connection=None, options=None):
+        """
+        Return a (found, document) tuple for a document retrieved by Cursor.prefetch(). Found is
+        False if the reference was not prefetched, has changed since, or the prefetched document
+        does not have all of the requested fields.
+        """
+        refs = self.document._refs
+        if not refs or self.name not in refs or connection is not None or options:
+            return False, None
+        value, partial, doc = refs[self.name]
+        if value != self.value:
+            return False, None
+        fields = self.reference.doctype._meta.get_partial(fields)
+        if partial is not None and (fields is None or not fields <= partial):
+            return False, None
+        return True, doc
+
     def find(self, fields=None, connection=None, **options):
         """
         Return the results of a find using the reference. Options are the same as Document.find()
@@ -114,7 +137,11 @@ class ReferenceFinder(object):
     def find_one(self, fields=None, connection=None, **options):
         """
         Return the results of a find_one using the reference. Options are the same as
-        Document.find_one() without query.
+        Document.find_one() without query. A document retrieved by Cursor.prefetch() is returned
+        without another query.
         """
+        found, doc = self.prefetched(fields, connection, options)
+        if found:
+            return doc
         cls = self.reference.doctype
         return cls.find_one(self.query, fields, connection, **options)
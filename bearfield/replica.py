@@ -0,0 +1,447 @@
+"""In-memory replicas of read-only collections."""
+from __future__ import absolute_import
+from .chunking import SortKey, get_rank
+from .errors import ConfigError
+from .optimizer import freeze, is_operator_dict
+from bisect import bisect_left, bisect_right
+from bson import ObjectId
+from bson.regex import Regex
+from copy import deepcopy
+from datetime import datetime
+from itertools import islice
+import re
+import six
+import threading
+import time
+
+number_types = six.integer_types + (float,)
+pattern_type = type(re.compile(''))
+
+# flags of the regular expression options supported by $options
+regex_options = {'i': re.IGNORECASE, 'm': re.MULTILINE, 's': re.DOTALL, 'x': re.VERBOSE}
+
+# types of the values held by range indexes
+range_types = number_types + six.string_types + (datetime, ObjectId)
+
+
+class UnsupportedQuery(Exception):
+    """Raised when a query uses an operator which cannot be evaluated locally."""
+
+
+def is_number(value):
+    """Return True if value is a number. Booleans are not numbers."""
+    return isinstance(value, number_types) and not isinstance(value, bool)
+
+
+def get_values(value, parts):
+    """
+    Return the list of values found at a path, given as a list of names, in a raw document.
+    Arrays of subdocuments are traversed as MongoDB does. Return an empty list if the path is
+    missing.
+    """
+    if not parts:
+        return [value]
+    if isinstance(value, dict):
+        if parts[0] in value:
+            return get_values(value[parts[0]], parts[1:])
+        return []
+    if isinstance(value, list):
+        values = []
+        if parts[0].isdigit() and int(parts[0]) < len(value):
+            values.extend(get_values(value[int(parts[0])], parts[1:]))
+        for item in value:
+            if isinstance(item, dict):
+                values.extend(get_values(item, parts))
+        return values
+    return []
+
+
+def expand(values):
+    """Return the values with the elements of each array value added after it."""
+    expanded = []
+    for value in values:
+        expanded.append(value)
+        if isinstance(value, list):
+            expanded.extend(value)
+    return expanded
+
+
+def is_equal(a, b):
+    """Return True if two values are equal as MongoDB compares them."""
+    if is_number(a) and is_number(b):
+        return a == b
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(is_equal(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict) and isinstance(b, dict):
+        return list(a) == list(b) and all(is_equal(a[name], b[name]) for name in a)
+    return type(a) is type(b) and a == b
+
+
+def compare(a, b):
+    """
+    Return -1, 0, or 1 if a is less than, equal to, or greater than b. Return None if the values
+    are of different types and so are not compared by range operators.
+    """
+    if get_rank(a) != get_rank(b):
+        return None
+    try:
+        if a < b:
+            return -1
+        if b < a:
+            return 1
+    except TypeError:
+        return None
+    return 0
+
+
+def is_match(regex, value):
+    """Return True if a compiled or BSON regular expression matches a string value."""
+    if not isinstance(value, six.string_types):
+        return False
+    return compile_regex(regex).search(value) is not None
+
+
+def compile_regex(pattern, options=''):
+    """Return a compiled regular expression from $regex and $options values."""
+    if isinstance(pattern, pattern_type) and not options:
+        return pattern
+    flags = 0
+    if is_regex(pattern):
+        flags = pattern.flags
+        pattern = pattern.pattern
+    for option in options or '':
+        if option not in regex_options:
+            raise UnsupportedQuery("unsupported regular expression option {}".format(option))
+        flags |= regex_options[option]
+    return re.compile(pattern, flags)
+
+
+def is_regex(value):
+    """Return True if the value is a compiled or BSON regular expression."""
+    return isinstance(value, (pattern_type, Regex))
+
+
+def evaluate(criteria, raw):
+    """
+    Return True if the encoded query criteria match the raw document. Raise UnsupportedQuery if
+    the criteria use an operator which is not supported.
+    """
+    for name, condition in six.iteritems(criteria):
+        if name == '$and':
+            matched = all(evaluate(clause, raw) for clause in condition)
+        elif name == '$or':
+            matched = any(evaluate(clause, raw) for clause in condition)
+        elif name == '$nor':
+            matched = not any(evaluate(clause, raw) for clause in condition)
+        elif name[:1] == '$':
+            raise UnsupportedQuery("unsupported query operator {}".format(name))
+        else:
+            matched = match_field(get_values(raw, name.split('.')), condition)
+        if not matched:
+            return False
+    return True
+
+
+def match_field(values, condition):
+    """Return True if the values found for a field match a field condition."""
+    if is_operator_dict(condition):
+        if '$regex' in condition:
+            condition = dict(condition)
+            regex = compile_regex(condition.pop('$regex'), condition.pop('$options', ''))
+            if not match_equal(values, regex):
+                return False
+        return all(match_operator(values, op, value) for op, value in six.iteritems(condition))
+    return match_equal(values, condition)
+
+
+def match_equal(values, value):
+    """Return True if any of the values or their elements is equal to or matched by value."""
+    if value is None:
+        return not values or any(item is None for item in expand(values))
+    if is_regex(value):
+        return any(is_match(value, item) for item in expand(values))
+    return any(is_equal(item, value) for item in expand(values))
+
+
+def match_range(values, value, results):
+    """Return True if any value compares to value with a result in results."""
+    return any(compare(item, value) in results for item in expand(values))
+
+
+def match_operator(values, op, value):
+    """Return True if the values found for a field match a single operator."""
+    if op == '$eq':
+        return match_equal(values, value)
+    if op == '$ne':
+        return not match_equal(values, value)
+    if op == '$gt':
+        return match_range(values, value, (1,))
+    if op == '$gte':
+        return match_range(values, value, (0, 1))
+    if op == '$lt':
+        return match_range(values, value, (-1,))
+    if op == '$lte':
+        return match_range(values, value, (-1, 0))
+    if op == '$in':
+        return any(match_equal(values, item) for item in value)
+    if op == '$nin':
+        return not any(match_equal(values, item) for item in value)
+    if op == '$exists':
+        return bool(values) == bool(value)
+    if op == '$all':
+        return bool(value) and all(match_equal(values, item) for item in value)
+    if op == '$size':
+        return any(isinstance(item, list) and len(item) == value for item in values)
+    if op == '$not':
+        if is_regex(value):
+            return not match_equal(values, value)
+        return not match_field(values, value)
+    if op == '$elemMatch':
+        return any(match_element(item, value) for item in values if isinstance(item, list))
+    if op == '$mod':
+        divisor, remainder = value
+        return any(is_number(item) and int(item) % divisor == remainder
+                   for item in expand(values))
+    raise UnsupportedQuery("unsupported query operator {}".format(op))
+
+
+def match_element(values, condition):
+    """Return True if any element of an array matches an $elemMatch condition."""
+    for item in values:
+        if is_operator_dict(condition):
+            if match_field([item], condition):
+                return True
+        elif isinstance(item, dict) and evaluate(condition, item):
+            return True
+    return False
+
+
+def get_index_key(value):
+    """Return the key of a value in an equality index. Raise TypeError if it can't be hashed."""
+    if is_number(value):
+        return (float, float(value))
+    return freeze(value)
+
+
+class Index(object):
+    """
+    An index of the values of a field in a list of raw documents. Equality lookups use a hash
+    table and range lookups use a sorted list. Documents with values which cannot be indexed are
+    returned by every lookup. Documents with several values for the field, such as arrays, are
+    returned by every range lookup with more than one bound because MongoDB may match each bound
+    against a different element.
+    """
+
+    def __init__(self, name, docs):
+        """Index the named field of a list of raw documents."""
+        parts = name.split('.')
+        self.name = name
+        self.values = {}
+        self.unindexed = set()
+        self.multikey = set()
+        ranges = []
+        for position, raw in enumerate(docs):
+            count = 0
+            for count, value in enumerate(expand(get_values(raw, parts)), 1):
+                if isinstance(value, range_types) and not isinstance(value, bool):
+                    ranges.append(((get_rank(value), value), position))
+                try:
+                    key = get_index_key(value)
+                except TypeError:
+                    self.unindexed.add(position)
+                    continue
+                self.values.setdefault(key, set()).add(position)
+            if count > 1:
+                self.multikey.add(position)
+        try:
+            ranges.sort(key=lambda item: item[0])
+        except TypeError:
+            ranges = None
+        self.keys = [key for key, _ in ranges] if ranges is not None else None
+        self.positions = [position for _, position in ranges] if ranges is not None else None
+
+    def equal(self, value):
+        """Return the positions of the documents which may have a value equal to value."""
+        return self.values.get(get_index_key(value), set()) | self.unindexed
+
+    def range(self, condition):
+        """
+        Return the positions of the documents which may have a value in the range of a condition
+        with $gt, $gte, $lt, and $lte operators. Documents with several values are included when
+        the condition has more than one bound.
+        """
+        rank = get_rank(next(iter(condition.values())))
+        start = bisect_left(self.keys, (rank,))
+        stop = bisect_left(self.keys, (rank + 1,))
+        for op, value in six.iteritems(condition):
+            if op == '$gt':
+                start = max(start, bisect_right(self.keys, (rank, value)))
+            elif op == '$gte':
+                start = max(start, bisect_left(self.keys, (rank, value)))
+            elif op == '$lt':
+                stop = min(stop, bisect_left(self.keys, (rank, value)))
+            elif op == '$lte':
+                stop = min(stop, bisect_right(self.keys, (rank, value)))
+        positions = set(self.positions[start:stop]) | self.unindexed
+        if len(condition) > 1:
+            positions |= self.multikey
+        return positions
+
+    def lookup(self, condition):
+        """
+        Return the positions of the documents which may match a field condition or None if the
+        index can't narrow down the documents.
+        """
+        if is_operator_dict(condition):
+            ops = set(condition)
+            if ops == {'$eq'}:
+                condition = condition['$eq']
+            elif ops == {'$in'}:
+                if any(value is None or is_regex(value) for value in condition['$in']):
+                    return None
+                positions = set()
+                for value in condition['$in']:
+                    positions |= self.equal(value)
+                return positions
+            elif ops and ops <= {'$gt', '$gte', '$lt', '$lte'}:
+                bounds = list(condition.values())
+                if self.keys is None or not all(
+                        isinstance(value, range_types) and not isinstance(value, bool)
+                        for value in bounds):
+                    return None
+                if len({get_rank(value) for value in bounds}) != 1:
+                    return None
+                try:
+                    return self.range(condition)
+                except TypeError:
+                    return None
+            else:
+                return None
+        if condition is None or is_regex(condition) or isinstance(condition, (dict, list)):
+            return None
+        try:
+            return self.equal(condition)
+        except TypeError:
+            return None
+
+
+class Replica(object):
+    """
+    An in-memory copy of a read-only collection. Queries are evaluated locally. The declared
+    indexes are used to narrow down the documents a query is evaluated against. The replica is
+    loaded on first use and reloaded in the background every reload seconds if reload is set.
+    """
+
+    def __init__(self, document, reload=None, indexes=()):
+        """Create a replica of the document's collection."""
+        self.document = document
+        self.reload = reload
+        self.index_names = list(indexes)
+        self.clock = time.time
+        self.state = None
+        self.loaded = None
+        self.reloading = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Load the collection into memory, replacing the current copy."""
+        collection = self.document._meta.get_collection()
+        docs = list(collection.find({}))
+        indexes = {name: Index(name, docs) for name in self.index_names}
+        self.state = (docs, indexes)
+        self.loaded = self.clock()
+
+    def get_state(self):
+        """Return the loaded documents and indexes. Reload them if they're out of date."""
+        state = self.state
+        if state is None:
+            with self.lock:
+                if self.state is None:
+                    self.load()
+                return self.state
+        if self.reload and self.clock() - self.loaded >= self.reload:
+            self.reload_background()
+        return state
+
+    def reload_background(self):
+        """Reload the collection on a background thread unless it is already reloading."""
+        with self.lock:
+            if self.reloading:
+                return
+            self.reloading = True
+
+        def run():
+            try:
+                self.load()
+            finally:
+                self.reloading = False
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def match(self, criteria):
+        """Return the list of raw documents which match the criteria in collection order."""
+        docs, indexes = self.get_state()
+        positions = None
+        for name, condition in six.iteritems(criteria or {}):
+            index = indexes.get(name)
+            if index is None:
+                continue
+            found = index.lookup(condition)
+            if found is not None and (positions is None or len(found) < len(positions)):
+                positions = found
+        if positions is not None:
+            docs = [docs[position] for position in sorted(positions)]
+        if not criteria:
+            return list(docs)
+        return [raw for raw in docs if evaluate(criteria, raw)]
+
+    def find(self, criteria, projection=None, sort=None, skip=0, limit=0, **options):
+        """
+        Return a list of copies of the raw documents matching the query. Raise UnsupportedQuery
+        if the query can't be evaluated locally.
+        """
+        options.pop('batch_size', None)
+        if options:
+            raise UnsupportedQuery("unsupported find options {}".format(', '.join(options)))
+        if projection and any('.' in name for name in projection):
+            raise UnsupportedQuery("unsupported projection of embedded fields")
+        docs = self.match(criteria)
+        if sort:
+            if isinstance(sort, dict):
+                sort = list(sort.items())
+            elif not isinstance(sort, list):
+                raise UnsupportedQuery("unsupported sort {}".format(repr(sort)))
+            docs.sort(key=lambda raw: SortKey(raw, sort))
+        stop = skip + limit if limit else None
+        return [self.copy(raw, projection) for raw in islice(docs, skip or 0, stop)]
+
+    def count(self, criteria):
+        """Return the number of documents matching the query."""
+        return len(self.match(criteria))
+
+    def copy(self, raw, projection):
+        """Return a copy of a raw document with only the fields in projection if provided."""
+        if projection:
+            names = set(projection) | {'_id'}
+            raw = {name: value for name, value in six.iteritems(raw) if name in names}
+        return deepcopy(raw)
+
+
+def get_replica(document, replica, readonly):
+    """
+    Return a Replica for a document from the 'replica' meta option. The option may be True or a
+    dictionary of Replica arguments. Return None if the option is not set. Raise ConfigError if
+    the document is not readonly.
+    """
+    if not replica:
+        return None
+    if not readonly:
+        raise ConfigError("replica of {} requires a readonly document".format(document.__name__))
+    if replica is True:
+        replica = {}
+    try:
+        return Replica(document, **replica)
+    except TypeError:
+        raise ConfigError("invalid replica option {}".format(repr(replica)))
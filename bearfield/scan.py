@@ -0,0 +1,124 @@
+"""Parallel scans over ranges of a collection."""
+from __future__ import absolute_import
+from concurrent.futures import ThreadPoolExecutor
+from six.moves import queue
+import threading
+
+# number of samples taken per partition when choosing split points
+samples_per_partition = 20
+
+
+def get_split_points(collection, criteria, key, count):
+    """
+    Return up to count - 1 sorted values of key which split the documents matching criteria into
+    count ranges of roughly equal size. The values are chosen by sampling the matched documents.
+    Only values with the same type as the first sample are used so that the ranges may be compared
+    by the server.
+    """
+    if count < 2:
+        return []
+    pipeline = []
+    if criteria:
+        pipeline.append({'$match': criteria})
+    pipeline.append({'$sample': {'size': count * samples_per_partition}})
+    pipeline.append({'$project': {key: 1}})
+
+    values = []
+    for raw in collection.aggregate(pipeline):
+        value = raw
+        for name in key.split('.'):
+            value = value.get(name) if hasattr(value, 'get') else None
+        if value is not None:
+            values.append(value)
+    if not values:
+        return []
+
+    typ = type(values[0])
+    try:
+        values = sorted(value for value in values if type(value) is typ)
+    except TypeError:
+        return []
+    points = []
+    for index in range(1, count):
+        value = values[index * len(values) // count]
+        if not points or value != points[-1]:
+            points.append(value)
+    if points and points[0] == values[0]:
+        points.pop(0)
+    return points
+
+
+def get_ranges(key, points):
+    """
+    Return a list of range queries on key which cover every document between them. Each point
+    starts a new range. The last range matches all values which are not less than the last point,
+    including values of other types and missing values, so no document is left out.
+    """
+    if not points:
+        return [{}]
+    ranges = [{key: {'$lt': points[0]}}]
+    for start, end in zip(points, points[1:]):
+        ranges.append({key: {'$gte': start, '$lt': end}})
+    ranges.append({key: {'$not': {'$lt': points[-1]}}})
+    return ranges
+
+
+def run(cursors, callback):
+    """
+    Call callback with each cursor on a pool with one thread per cursor. Return the list of
+    callback results in the order of the cursors. The first exception raised by a callback is
+    raised once all of them have finished.
+    """
+    with ThreadPoolExecutor(max_workers=len(cursors)) as executor:
+        futures = [executor.submit(callback, cursor) for cursor in cursors]
+    return [future.result() for future in futures]
+
+
+def merge(cursors, batch_size):
+    """
+    Iterate over the documents of each cursor, each on its own thread, and yield them as they are
+    received. Batches are passed through a bounded queue so that workers stay at most a few
+    batches ahead of the consumer. Documents are not yielded in any particular order. Exceptions
+    raised by a worker are raised by the iterator.
+    """
+    results = queue.Queue(len(cursors) * 2)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def work(cursor):
+        try:
+            for batch in cursor.iter_batches(batch_size):
+                if not put(batch):
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            cursor.close()
+            put(done)
+
+    executor = ThreadPoolExecutor(max_workers=len(cursors))
+    try:
+        for cursor in cursors:
+            executor.submit(work, cursor)
+        remaining = len(cursors)
+        while remaining:
+            item = results.get()
+            if item is done:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                for document in item:
+                    yield document
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
@@ -0,0 +1,178 @@
+"""Unit of work sessions."""
+from __future__ import absolute_import
+from .errors import BulkError, DocumentError, OperationError
+from collections import OrderedDict
+import threading
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # pragma: no cover
+    ContextVar = None
+
+if ContextVar is not None:
+    active = ContextVar('bearfield_sessions', default=())
+
+    def get_sessions():
+        """Return the tuple of sessions active in the current context."""
+        return active.get()
+
+    def set_sessions(sessions):
+        """Set the tuple of sessions active in the current context."""
+        active.set(sessions)
+else:  # pragma: no cover
+    state = threading.local()
+
+    def get_sessions():
+        """Return the tuple of sessions active in the current thread."""
+        return getattr(state, 'sessions', ())
+
+    def set_sessions(sessions):
+        """Set the tuple of sessions active in the current thread."""
+        state.sessions = sessions
+
+
+def current():
+    """
+    Return the active session for the current context or None if there isn't one. Each thread and
+    each asyncio task has its own context.
+    """
+    sessions = get_sessions()
+    if sessions:
+        return sessions[-1]
+    return None
+
+
+def track(document):
+    """Add a document to the active session if there is one."""
+    sessions = get_sessions()
+    if sessions:
+        sessions[-1].add(document)
+
+
+class Session(object):
+    """
+    A unit of work. Documents which are created or have fields assigned while the session is
+    active are tracked by the session. Loaded documents are not tracked until a field is assigned
+    so documents whose values are only modified in place must be added with add(). When the
+    session is flushed new documents are inserted and the dirty fields of existing documents are
+    updated using one bulk write per collection rather than a round trip per document.
+    """
+
+    def __init__(self, connection=None, ordered=True, batch_size=None):
+        """
+        Create a session. The connection, if provided, is used for all writes instead of each
+        document's own connection. The ordered and batch_size options are passed to the bulk
+        writes made when flushing.
+        """
+        self.connection = connection
+        self.ordered = ordered
+        self.batch_size = batch_size
+        self.documents = OrderedDict()
+
+    def __enter__(self):
+        """Activate the session for the current context."""
+        set_sessions(get_sessions() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Deactivate the session. Flush tracked documents unless an exception was raised."""
+        set_sessions(tuple(other for other in get_sessions() if other is not self))
+        if exc_type is None:
+            self.flush()
+        else:
+            self.clear()
+
+    def add(self, document):
+        """Track a document. Subdocuments are ignored as they are written with their parent."""
+        if not document._meta.subdocument:
+            self.documents.setdefault(id(document), document)
+
+    def clear(self):
+        """Stop tracking all documents."""
+        self.documents.clear()
+
+    def flush(self):
+        """
+        Write all pending changes to the database. Documents without an _id are inserted while
+        other documents have their dirty fields updated. Documents stored in the same collection
+        are written together. Raise BulkError if any document fails to be written. Documents that
+        failed, or were not reached, remain tracked by the session.
+        """
+        errors = []
+        unreached = []
+        for key, documents in self.group().items():
+            if isinstance(key, DocumentError):
+                errors.extend((document, key) for document in documents)
+                continue
+            try:
+                self.write(documents)
+            except BulkError as e:
+                errors.extend(e.errors)
+                unreached.extend(e.unreached)
+                kept = {id(document) for document, _ in e.errors}
+                kept.update(id(document) for document in e.unreached)
+            except DocumentError as e:
+                errors.extend((document, e) for document in documents)
+                continue
+            else:
+                kept = ()
+            for document in documents:
+                if id(document) not in kept:
+                    self.documents.pop(id(document), None)
+        if errors:
+            raise BulkError(errors, unreached=unreached)
+
+    def group(self):
+        """
+        Return an ordered mapping of collection keys to the tracked documents stored in that
+        collection. Documents stored with different write concerns are kept apart. Documents whose
+        collection cannot be found are keyed by the error raised when looking it up.
+        """
+        groups = OrderedDict()
+        keys = {}
+        for document in self.documents.values():
+            cls = document.__class__
+            if cls not in keys:
+                try:
+                    collection = cls._meta.get_collection(self.connection)
+                except DocumentError as e:
+                    keys[cls] = e
+                else:
+                    concern = sorted(collection.write_concern.document.items())
+                    keys[cls] = (collection, tuple(concern))
+            groups.setdefault(keys[cls], []).append(document)
+        return groups
+
+    def write(self, documents):
+        """Write a group of documents stored in the same collection with one bulk write."""
+        classes = OrderedDict((document.__class__, None) for document in documents)
+        cls = next(iter(classes))
+        try:
+            cls._bulk_write(documents, self.prepare, self.connection, self.ordered,
+                            self.batch_size)
+        finally:
+            for other in classes:
+                if other is not cls:
+                    other._invalidate()
+
+    def prepare(self, document):
+        """Return the bulk request used to flush a document."""
+        meta = document._meta
+        if document._raw.get('_id') is None:
+            if meta.disable_insert:
+                msg = "inserts to {} are disabled".format(document.__class__.__name__)
+                raise OperationError(msg)
+            return document._insert_request()
+        prepared = document._update_request()
+        if prepared and meta.disable_update:
+            msg = "updates to {} are disabled".format(document.__class__.__name__)
+            raise OperationError(msg)
+        return prepared
+
+
+def session(connection=None, ordered=True, batch_size=None):
+    """
+    Return a new unit of work session for use as a context manager. Documents created or modified
+    inside the block are written in bulk when the block exits without an exception.
+    """
+    return Session(connection, ordered, batch_size)
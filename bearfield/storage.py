@@ -0,0 +1,166 @@
+"""Compact field storage for documents."""
+from __future__ import absolute_import
+
+
+class SlotAttrs(object):
+    """
+    Mapping view over the field slots of a compact document. Decoded field values are stored in
+    per-class slots rather than an attribute dictionary. The view is created on access and holds
+    no values itself. Field properties read and write the slots directly so the view is only
+    created by code which handles every document's fields, such as encoding.
+    """
+    __slots__ = ('document', 'slots')
+
+    def __init__(self, document):
+        """Create a view over the slots of the given document."""
+        self.document = document
+        self.slots = document._meta.slots
+
+    def __contains__(self, name):
+        slot = self.slots.get(name)
+        return slot is not None and hasattr(self.document, slot)
+
+    def __getitem__(self, name):
+        slot = self.slots.get(name)
+        if slot is not None:
+            try:
+                return getattr(self.document, slot)
+            except AttributeError:
+                pass
+        raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        slot = self.slots.get(name)
+        if slot is None:
+            raise KeyError(name)
+        setattr(self.document, slot, value)
+
+    def __delitem__(self, name):
+        slot = self.slots.get(name)
+        try:
+            delattr(self.document, slot)
+        except (AttributeError, TypeError):
+            raise KeyError(name)
+
+    def __iter__(self):
+        for name, slot in self.slots.items():
+            if hasattr(self.document, slot):
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def get(self, name, default=None):
+        """Return the decoded value of a field or default if it has not been decoded."""
+        slot = self.slots.get(name)
+        if slot is None:
+            return default
+        return getattr(self.document, slot, default)
+
+    def keys(self):
+        """Return the names of all decoded fields."""
+        return list(self)
+
+    def items(self):
+        """Return (name, value) pairs for all decoded fields."""
+        return [(name, self[name]) for name in self]
+
+    def clear(self):
+        """Remove all decoded values."""
+        for slot in self.slots.values():
+            try:
+                delattr(self.document, slot)
+            except AttributeError:
+                pass
+
+    def update(self, values):
+        """Store the decoded values from a dictionary."""
+        for name, value in dict(values).items():
+            self[name] = value
+
+    @classmethod
+    def replace(cls, document, values):
+        """Replace the decoded values of a document. Used as the property setter."""
+        attrs = cls(document)
+        attrs.clear()
+        attrs.update(values)
+
+
+class DirtyBits(object):
+    """
+    Set view over the dirty bitmap of a compact document. Bits are indexed by field position and
+    the bitmap is only allocated once a field is marked dirty.
+    """
+    __slots__ = ('document', 'positions')
+
+    def __init__(self, document):
+        """Create a view over the dirty bitmap of the given document."""
+        self.document = document
+        self.positions = document._meta.positions
+
+    @property
+    def bits(self):
+        """Return the dirty bitmap."""
+        return getattr(self.document, '_dirty_bits', 0)
+
+    def __contains__(self, name):
+        position = self.positions.get(name)
+        return position is not None and bool(self.bits >> position & 1)
+
+    def __iter__(self):
+        bits = self.bits
+        for name, position in self.positions.items():
+            if bits >> position & 1:
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def add(self, name):
+        """Mark a field as dirty."""
+        self.document._dirty_bits = self.bits | 1 << self.positions[name]
+
+    def discard(self, name):
+        """Mark a field as clean."""
+        position = self.positions.get(name)
+        if position is not None and name in self:
+            self.document._dirty_bits = self.bits ^ 1 << position
+
+    def clear(self):
+        """Mark all fields as clean and release the bitmap."""
+        try:
+            del self.document._dirty_bits
+        except AttributeError:
+            pass
+
+    def update(self, names):
+        """Mark the named fields as dirty."""
+        for name in names:
+            self.add(name)
+
+    @classmethod
+    def replace(cls, document, names):
+        """Replace the dirty fields of a document. Used as the property setter."""
+        dirty = cls(document)
+        dirty.clear()
+        dirty.update(names)
+
+
+def compact_attrs(cls, attrs, names):
+    """
+    Return class attributes for a compact document layout. The cls is the compact base class if
+    one exists and the names are the fields which require storage.
+    """
+    attrs = dict(attrs)
+    slots = [slot_name(name) for name in names]
+    if cls is None:
+        slots.append('_dirty_bits')
+        attrs['_attrs'] = property(SlotAttrs, SlotAttrs.replace)
+        attrs['_dirty'] = property(DirtyBits, DirtyBits.replace)
+    attrs['__slots__'] = tuple(slots)
+    return attrs
+
+
+def slot_name(name):
+    """Return the name of the slot which stores the named field."""
+    return '_field_' + name
@@ -0,0 +1,137 @@
+"""Change tracking for mutable field values."""
+from __future__ import absolute_import
+from collections import OrderedDict
+import six
+
+
+def is_same(old, new):
+    """
+    Return True if an encoded value is the same as the stored value. Values of different types
+    which compare equal are considered the same unless either is a bool or a float since those
+    would change the stored BSON type.
+    """
+    if type(old) is type(new):
+        return old == new
+    if isinstance(old, (bool, float)) or isinstance(new, (bool, float)):
+        return False
+    return old == new
+
+
+def is_modified(value):
+    """Return True if a decoded value has been modified in place since it was decoded."""
+    check = getattr(value, '_is_modified', None)
+    return check is not None and check()
+
+
+def join_path(path, name):
+    """Return the dotted path of a child element."""
+    return '{}.{}'.format(path, name)
+
+
+def is_path_key(key):
+    """Return True if a dictionary key may be used as part of a dotted update path."""
+    return isinstance(key, six.string_types) and key and '.' not in key and key[0] != '$'
+
+
+def set_op(update, op, path, value):
+    """Add an operation on path to an update document."""
+    update.setdefault(op, {})[path] = value
+
+
+def diff_value(path, old, new, update):
+    """
+    Add the operations needed to replace the stored value at path with the encoded value to an
+    update document. Nothing is added if the values are the same.
+    """
+    if new is None:
+        if old is not None:
+            set_op(update, '$unset', path, "")
+    elif not is_same(old, new):
+        set_op(update, '$set', path, new)
+
+
+def mutators(*names):
+    """
+    Return a class decorator which wraps the named methods of the class's first base so that they
+    mark the container as changed before modifying it.
+    """
+    def decorate(cls):
+        base = cls.__bases__[0]
+        for name in names:
+            if hasattr(base, name):
+                setattr(cls, name, mutator(base, name))
+        return cls
+    return decorate
+
+
+def mutator(base, name):
+    """Return a method which marks the container as changed before calling the base method."""
+    method = getattr(base, name)
+
+    def wrapper(self, *args, **kwargs):
+        self.changed = True
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = name
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+class Tracked(object):
+    """
+    Mixin for containers that record whether they have been modified. The deep attribute is True
+    if the container holds documents or other tracked containers which must also be checked.
+    """
+    __slots__ = ()
+
+    def _is_modified(self):
+        """Return True if the container or any of its items has been modified."""
+        if self.changed:
+            return True
+        if self.deep:
+            for item in self._tracked_items():
+                if is_modified(item):
+                    return True
+        return False
+
+    def _tracked_items(self):
+        """Return the items which may themselves be modified."""
+        return self
+
+
+@mutators('__setitem__', '__delitem__', '__iadd__', '__imul__', '__setslice__', '__delslice__',
+          'append', 'extend', 'insert', 'pop', 'remove', 'reverse', 'sort', 'clear')
+class TrackedList(list, Tracked):
+    """A list which records modification."""
+    __slots__ = ('changed', 'deep')
+
+    def __init__(self, iterable=(), deep=False):
+        super(TrackedList, self).__init__(iterable)
+        self.changed = False
+        self.deep = deep
+
+
+@mutators('__ior__', '__iand__', '__isub__', '__ixor__', 'add', 'discard', 'remove', 'pop',
+          'clear', 'update', 'intersection_update', 'difference_update',
+          'symmetric_difference_update')
+class TrackedSet(set, Tracked):
+    """A set which records modification."""
+    __slots__ = ('changed', 'deep')
+
+    def __init__(self, iterable=(), deep=False):
+        super(TrackedSet, self).__init__(iterable)
+        self.changed = False
+        self.deep = deep
+
+
+@mutators('__setitem__', '__delitem__', 'pop', 'popitem', 'clear', 'update', 'setdefault')
+class TrackedDict(OrderedDict, Tracked):
+    """An ordered dictionary which records modification."""
+
+    def __init__(self, iterable=(), deep=False):
+        super(TrackedDict, self).__init__(iterable)
+        self.changed = False
+        self.deep = deep
+
+    def _tracked_items(self):
+        """Return the dictionary values."""
+        return self.values()
@@ -3,6 +3,9 @@ from __future__ import absolute_import
 from collections import OrderedDict
 from datetime import date, datetime, time
 from .errors import EncodingError
+from .tracking import (TrackedDict, TrackedList, TrackedSet, diff_value, is_path_key, is_same,
+                       join_path, set_op)
+from .utils import is_overridden
 import six
 
 epoch = date(1970, 1, 1)
@@ -92,6 +95,16 @@ def is_dict_obj(obj):
     return isinstance(obj, dict)
 
 
+def identity(value):
+    """Return the value unchanged."""
+    return value
+
+
+def is_deep(typ):
+    """Return True if values of the field type may be modified in place."""
+    return isinstance(typ, (DocumentType, ListType, SetType, DictType))
+
+
 def register_field_type(check, field_type):
     """
     Register a field type. The check is called on typ and should return True if the field type
@@ -126,6 +139,35 @@ class FieldType(object):
     def validate(self, cls, name, value):
         """Raise ValidationError if the field fails to validate."""
 
+    def diff(self, cls, name, path, old, new, update):
+        """
+        Add the operations needed to change the stored value old at path into the encoded value
+        new to the update document. The default replaces the value if it differs.
+        """
+        diff_value(path, old, new, update)
+
+    def compile_encoder(self, cls, name):
+        """
+        Return a function which encodes a single value for the named field of the document class.
+        Subclasses override this to provide a faster path than calling encode directly.
+        """
+        encode = self.encode
+
+        def encoder(value):
+            return encode(cls, name, value)
+        return encoder
+
+    def compile_decoder(self, cls, name):
+        """
+        Return a function which decodes a single value for the named field of the document class.
+        Subclasses override this to provide a faster path than calling decode directly.
+        """
+        decode = self.decode
+
+        def decoder(value):
+            return decode(cls, name, value)
+        return decoder
+
 
 class BuiltinType(FieldType):
     """Used for built-in Python types which can be called with a single argument."""
@@ -146,6 +188,27 @@ class BuiltinType(FieldType):
             msg = "failed to encode value as {}".format(self.builtin.__class__.__name__)
             raise EncodingError(msg, cls, name, value, True)
 
+    def compile_encoder(self, cls, name):
+        """Return an encoder which skips conversion of values which have the builtin type."""
+        if is_overridden(self, BuiltinType, 'encode'):
+            return super(BuiltinType, self).compile_encoder(cls, name)
+        builtin = self.builtin
+        encode = self.encode
+
+        def encoder(value):
+            # exact type match so that subclasses (e.g. bool for int) are still converted
+            if type(value) is builtin:
+                return value
+            return encode(cls, name, value)
+        encoder.builtin = builtin
+        return encoder
+
+    def compile_decoder(self, cls, name):
+        """Return a decoder which passes values through unchanged."""
+        if is_overridden(self, BuiltinType, 'decode'):
+            return super(BuiltinType, self).compile_decoder(cls, name)
+        return identity
+
 
 class DateType(FieldType):
     """Support date values."""
@@ -166,6 +229,30 @@ class DateType(FieldType):
             raise EncodingError(None, cls, name, value, False)
         return value.date()
 
+    def compile_encoder(self, cls, name):
+        """Return an encoder with a fast path for plain date values."""
+        if is_overridden(self, DateType, 'encode'):
+            return super(DateType, self).compile_encoder(cls, name)
+        encode = self.encode
+
+        def encoder(value):
+            if type(value) is date:
+                return datetime(value.year, value.month, value.day)
+            return encode(cls, name, value)
+        return encoder
+
+    def compile_decoder(self, cls, name):
+        """Return a decoder with a fast path for stored datetime values."""
+        if is_overridden(self, DateType, 'decode'):
+            return super(DateType, self).compile_decoder(cls, name)
+        decode = self.decode
+
+        def decoder(value):
+            if type(value) is datetime:
+                return value.date()
+            return decode(cls, name, value)
+        return decoder
+
 
 class DateTimeType(FieldType):
     """Support datetime values."""
@@ -221,15 +308,49 @@ class DocumentType(FieldType):
         raise EncodingError(None, cls, name, value, True)
 
     def decode(self, cls, name, value):
-        """Return the value decoded as a subdocument object."""
+        """
+        Return the value decoded as a subdocument object. The subdocument shares the raw value
+        of its parent document unless defaults must be added to it, in which case it is copied.
+        """
         if hasattr(value, 'get'):
-            return self.document._decode(value)
+            return self.document._decode(value, copy=None)
         raise EncodingError(None, cls, name, value, False)
 
     def validate(self, cls, name, value):
         """Raise ValidationError if the field fails to validate."""
         self.document._validate(value)
 
+    def diff(self, cls, name, path, old, new, update):
+        """Update only the changed fields of the subdocument."""
+        if isinstance(old, dict) and isinstance(new, dict):
+            self.document._diff(path, old, new, update)
+        else:
+            diff_value(path, old, new, update)
+
+    def compile_encoder(self, cls, name):
+        """Return an encoder which calls the subdocument's encoder directly."""
+        if is_overridden(self, DocumentType, 'encode'):
+            return super(DocumentType, self).compile_encoder(cls, name)
+        from .document import Document
+
+        def encoder(value):
+            if isinstance(value, Document):
+                return value._encode()
+            raise EncodingError(None, cls, name, value, True)
+        return encoder
+
+    def compile_decoder(self, cls, name):
+        """Return a decoder which calls the subdocument's decoder directly."""
+        if is_overridden(self, DocumentType, 'decode'):
+            return super(DocumentType, self).compile_decoder(cls, name)
+        decode = self.document._decode
+
+        def decoder(value):
+            if hasattr(value, 'get'):
+                return decode(value, copy=None)
+            raise EncodingError(None, cls, name, value, False)
+        return decoder
+
 
 class ListType(FieldType):
     """Support a list of typed values."""
@@ -257,13 +378,72 @@ class ListType(FieldType):
         return list(value)
 
     def decode(self, cls, name, value):
-        """Return the value decoded as a list of decoded values."""
+        """Return the value decoded as a tracked list of decoded values."""
         if self.typ is not None:
             decoded = []
             for item in value:
                 decoded.append(self.typ.decode(cls, name, item))
-            return decoded
-        return list(value)
+            return TrackedList(decoded, is_deep(self.typ))
+        return TrackedList(value)
+
+    def diff_element(self, cls, name, path, old, new, update):
+        """Add the operations needed to change a single stored element to the update document."""
+        if self.typ:
+            return self.typ.diff(cls, name, path, old, new, update)
+        diff_value(path, old, new, update)
+
+    def diff(self, cls, name, path, old, new, update):
+        """
+        Push items appended to the end of the list and update changed items in place when at most
+        half of the items have changed. Otherwise replace the list.
+        """
+        if not isinstance(old, list) or not isinstance(new, list) or len(new) < len(old):
+            return diff_value(path, old, new, update)
+        changes = []
+        for index, item in enumerate(old):
+            if not is_same(item, new[index]):
+                element = {}
+                self.diff_element(cls, name, join_path(path, index), item, new[index], element)
+                if element:
+                    changes.append(element)
+        if len(new) > len(old):
+            if changes:
+                return diff_value(path, old, new, update)
+            set_op(update, '$push', path, {'$each': new[len(old):]})
+        elif len(changes) * 2 > len(old):
+            diff_value(path, old, new, update)
+        else:
+            for element in changes:
+                for op, values in six.iteritems(element):
+                    update.setdefault(op, {}).update(values)
+
+    def compile_encoder(self, cls, name):
+        """Return an encoder which applies the compiled element encoder to each item."""
+        if is_overridden(self, ListType, 'encode') or \
+                is_overridden(self, ListType, 'encode_element'):
+            return super(ListType, self).compile_encoder(cls, name)
+        if self.typ is None:
+            return list
+        element = self.typ.compile_encoder(cls, name)
+
+        def encoder(value):
+            return [element(item) for item in value]
+        return encoder
+
+    def compile_decoder(self, cls, name):
+        """Return a decoder which applies the compiled element decoder to each item."""
+        if is_overridden(self, ListType, 'decode'):
+            return super(ListType, self).compile_decoder(cls, name)
+        if self.typ is None:
+            return TrackedList
+        element = self.typ.compile_decoder(cls, name)
+        if element is identity:
+            return TrackedList
+        deep = is_deep(self.typ)
+
+        def decoder(value):
+            return TrackedList([element(item) for item in value], deep)
+        return decoder
 
 
 class SetType(FieldType):
@@ -292,13 +472,61 @@ class SetType(FieldType):
         return list(value)
 
     def decode(self, cls, name, value):
-        """Return the value decoded as a list of decoded values."""
+        """Return the value decoded as a tracked set of decoded values."""
         if self.typ is not None:
             decoded = set()
             for item in value:
                 decoded.add(self.typ.decode(cls, name, item))
-            return decoded
-        return set(value)
+            return TrackedSet(decoded)
+        return TrackedSet(value)
+
+    def diff(self, cls, name, path, old, new, update):
+        """
+        Add new items with $addToSet or remove items with $pull. The set is replaced if items were
+        both added and removed since both operators may not be used on the same path.
+        """
+        if not isinstance(old, list) or not isinstance(new, list):
+            return diff_value(path, old, new, update)
+        try:
+            old_items = set(old)
+            new_items = set(new)
+        except TypeError:
+            return diff_value(path, old, new, update)
+        added = [item for item in new if item not in old_items]
+        removed = [item for item in old if item not in new_items]
+        if added and removed:
+            diff_value(path, old, new, update)
+        elif added:
+            set_op(update, '$addToSet', path, {'$each': added})
+        elif removed:
+            set_op(update, '$pull', path, {'$in': removed})
+
+    def compile_encoder(self, cls, name):
+        """Return an encoder which applies the compiled element encoder to each item."""
+        if is_overridden(self, SetType, 'encode') or \
+                is_overridden(self, SetType, 'encode_element'):
+            return super(SetType, self).compile_encoder(cls, name)
+        if self.typ is None:
+            return list
+        element = self.typ.compile_encoder(cls, name)
+
+        def encoder(value):
+            return [element(item) for item in value]
+        return encoder
+
+    def compile_decoder(self, cls, name):
+        """Return a decoder which applies the compiled element decoder to each item."""
+        if is_overridden(self, SetType, 'decode'):
+            return super(SetType, self).compile_decoder(cls, name)
+        if self.typ is None:
+            return TrackedSet
+        element = self.typ.compile_decoder(cls, name)
+        if element is identity:
+            return TrackedSet
+
+        def decoder(value):
+            return TrackedSet([element(item) for item in value])
+        return decoder
 
 
 class DictType(FieldType):
@@ -321,13 +549,58 @@ class DictType(FieldType):
         return OrderedDict(value)
 
     def decode(self, cls, name, value):
-        """Return the value decoded as a list of decoded values."""
+        """Return the value decoded as a tracked dict of decoded values."""
         if self.typ is not None:
             decoded = OrderedDict()
             for key, item in six.iteritems(value):
                 decoded[key] = self.typ.decode(cls, name, item)
-            return decoded
-        return OrderedDict(value)
+            return TrackedDict(decoded, is_deep(self.typ))
+        return TrackedDict(value)
+
+    def diff_element(self, cls, name, path, old, new, update):
+        """Add the operations needed to change a single stored element to the update document."""
+        if self.typ:
+            return self.typ.diff(cls, name, path, old, new, update)
+        diff_value(path, old, new, update)
+
+    def diff(self, cls, name, path, old, new, update):
+        """Update only the changed keys of the dict."""
+        if not isinstance(old, dict) or not isinstance(new, dict) or \
+                not all(is_path_key(key) for key in new) or \
+                not all(is_path_key(key) for key in old):
+            return diff_value(path, old, new, update)
+        for key, item in six.iteritems(new):
+            self.diff_element(cls, name, join_path(path, key), old.get(key), item, update)
+        for key in old:
+            if key not in new:
+                diff_value(join_path(path, key), old[key], None, update)
+
+    def compile_encoder(self, cls, name):
+        """Return an encoder which applies the compiled item encoder to each value."""
+        if is_overridden(self, DictType, 'encode'):
+            return super(DictType, self).compile_encoder(cls, name)
+        if self.typ is None:
+            return OrderedDict
+        element = self.typ.compile_encoder(cls, name)
+
+        def encoder(value):
+            return OrderedDict((str(key), element(item)) for key, item in six.iteritems(value))
+        return encoder
+
+    def compile_decoder(self, cls, name):
+        """Return a decoder which applies the compiled item decoder to each value."""
+        if is_overridden(self, DictType, 'decode'):
+            return super(DictType, self).compile_decoder(cls, name)
+        if self.typ is None:
+            return TrackedDict
+        element = self.typ.compile_decoder(cls, name)
+        if element is identity:
+            return TrackedDict
+        deep = is_deep(self.typ)
+
+        def decoder(value):
+            return TrackedDict(((key, element(item)) for key, item in six.iteritems(value)), deep)
+        return decoder
 
 
 register_field_type(is_date_type, DateType)
@@ -1,6 +1,8 @@
 """A few useful utilities."""
 from __future__ import absolute_import
+from itertools import islice
 import re
+import six
 
 
 def to_snake_case(name):
@@ -13,3 +15,136 @@ def get_projection(fields):
     if fields:
         return list(fields)
     return None
+
+
+def is_overridden(obj, base, name):
+    """Return True if the class of obj overrides the named method of base."""
+    method = six.get_unbound_function(getattr(type(obj), name))
+    return method is not six.get_unbound_function(getattr(base, name))
+
+
+def chunks(iterable, size):
+    """Yield lists of up to size items from iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def copy_child(container, name):
+    """
+    Replace the named child dictionary or list of a container with a copy and return the copy.
+    Lists are indexed using numeric names. Return None if the child is not a container.
+    """
+    if isinstance(container, list):
+        if not name.isdigit() or int(name) >= len(container):
+            return None
+        name = int(name)
+        child = container[name]
+    else:
+        child = container.get(name)
+    if isinstance(child, dict):
+        child = dict(child)
+    elif isinstance(child, list):
+        child = list(child)
+    else:
+        return None
+    container[name] = child
+    return child
+
+
+def set_path(raw, path, value):
+    """
+    Set a value in a raw document using a dotted path. Intermediate dictionaries and lists are
+    copied rather than modified in place since they may be shared with other documents.
+    """
+    names = path.split('.')
+    for name in names[:-1]:
+        child = copy_child(raw, name)
+        if child is None:
+            if isinstance(raw, list):
+                return
+            child = raw[name] = {}
+        raw = child
+    name = names[-1]
+    if isinstance(raw, list):
+        if name.isdigit() and int(name) < len(raw):
+            raw[int(name)] = value
+    else:
+        raw[name] = value
+
+
+def unset_path(raw, path):
+    """Remove a value from a raw document using a dotted path."""
+    names = path.split('.')
+    for name in names[:-1]:
+        raw = copy_child(raw, name)
+        if raw is None:
+            return
+    name = names[-1]
+    if isinstance(raw, list):
+        if name.isdigit() and int(name) < len(raw):
+            raw[int(name)] = None
+    else:
+        raw.pop(name, None)
+
+
+def get_path(raw, path):
+    """Return the list at a dotted path in a raw document or an empty list if there isn't one."""
+    for name in path.split('.'):
+        if isinstance(raw, dict):
+            raw = raw.get(name)
+        elif isinstance(raw, list) and name.isdigit() and int(name) < len(raw):
+            raw = raw[int(name)]
+        else:
+            return []
+    return list(raw) if isinstance(raw, list) else []
+
+
+def get_each(value, modifier):
+    """
+    Return the values of an array operation which may use the given modifier. Return None if the
+    operation uses any other modifier or, for $pull, any condition other than $in.
+    """
+    if isinstance(value, dict) and (modifier == '$in' or any(key[:1] == '$' for key in value)):
+        if list(value) != [modifier]:
+            return None
+        return list(value[modifier])
+    return [value]
+
+
+def apply_update(raw, update):
+    """
+    Apply an encoded update document to a raw document. The $set, $unset, $push, $addToSet, and
+    $pull operators are supported. Array operators may only use the $each modifier or $in
+    condition respectively. Return False without modifying the raw document if the update contains
+    any other operators.
+    """
+    arrays = []
+    for op, modifier in (('$push', '$each'), ('$addToSet', '$each'), ('$pull', '$in')):
+        for path, value in six.iteritems(update.get(op, {})):
+            values = get_each(value, modifier)
+            if values is None:
+                return False
+            arrays.append((op, path, values))
+    if any(op not in ('$set', '$unset', '$push', '$addToSet', '$pull') for op in update):
+        return False
+
+    for path, value in six.iteritems(update.get('$set', {})):
+        set_path(raw, path, value)
+    for path in update.get('$unset', {}):
+        unset_path(raw, path)
+    for op, path, values in arrays:
+        items = get_path(raw, path)
+        if op == '$push':
+            items.extend(values)
+        elif op == '$addToSet':
+            for value in values:
+                if value not in items:
+                    items.append(value)
+        else:
+            items = [item for item in items if item not in values]
+        set_path(raw, path, items)
+    return True
@@ -10,7 +10,12 @@ except IOError:
 
 install_requires = [
     'pymongo>=2.7.0',
+    'futures; python_version < "3.2"',
 ]
+extras_require = {
+    'columns': ['numpy'],
+    'asyncio': ['motor>=2.0,<3'],
+}
 setup_requires = [
     'coverage>=3.7.0',
     'nose>=1.3.0',
@@ -38,6 +43,7 @@ setup(
     packages=find_packages(exclude=['tests']),
     include_package_data=True,
     install_requires=install_requires,
+    extras_require=extras_require,
     setup_requires=setup_requires,
     test_suite = 'nose.collector',
     entry_points='',
@@ -0,0 +1,289 @@
+"""Tests for the aio module."""
+from __future__ import absolute_import
+import unittest
+from bearfield import Document, Field, Query, Reference, aio, connection, errors, identity_map
+from bson import ObjectId
+from bson.codec_options import DEFAULT_CODEC_OPTIONS
+from pymongo.errors import AutoReconnect
+from pymongo.write_concern import WriteConcern
+import asyncio
+
+uri = 'mongodb://localhost/test'
+
+
+class Result(object):
+    """Result of a write operation."""
+
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class AsyncCursor(object):
+    """Asyncio cursor which returns stored documents."""
+
+    def __init__(self, docs):
+        self.docs = list(docs)
+
+    async def to_list(self, length):
+        batch, self.docs = self.docs[:length], self.docs[length:]
+        return batch
+
+
+class AsyncCollection(object):
+    """Asyncio collection which stores documents in a dictionary."""
+
+    codec_options = DEFAULT_CODEC_OPTIONS
+    write_concern = WriteConcern()
+
+    def __init__(self):
+        self.docs = {}
+        self.calls = []
+
+    def with_options(self, **options):
+        return self
+
+    def find(self, criteria, projection=None, sort=None, **options):
+        self.calls.append(('find', criteria))
+        docs = [doc for doc in self.docs.values() if self.match(doc, criteria)]
+        for name, direction in reversed(sort or []):
+            docs.sort(key=lambda doc: doc.get(name), reverse=direction < 0)
+        return AsyncCursor(docs)
+
+    def match(self, doc, criteria):
+        for name, value in (criteria or {}).items():
+            if isinstance(value, dict) and '$in' in value:
+                if doc.get(name) not in value['$in']:
+                    return False
+            elif doc.get(name) != value:
+                return False
+        return True
+
+    async def find_one(self, criteria, projection=None, **options):
+        self.calls.append(('find_one', criteria))
+        for doc in self.docs.values():
+            if self.match(doc, criteria):
+                return dict(doc)
+        return None
+
+    async def insert_one(self, doc, **options):
+        self.calls.append(('insert_one', doc))
+        _id = doc.get('_id') or ObjectId()
+        self.docs[_id] = dict(doc, _id=_id)
+        return Result(inserted_id=_id)
+
+    async def replace_one(self, criteria, doc, upsert=False, **options):
+        self.calls.append(('replace_one', doc))
+        self.docs[criteria['_id']] = dict(doc)
+
+    async def update_one(self, criteria, update, **options):
+        self.calls.append(('update_one', update))
+        self.docs[criteria['_id']].update(update.get('$set', {}))
+
+    async def delete_one(self, criteria, **options):
+        self.calls.append(('delete_one', criteria))
+        doc = self.docs.pop(criteria['_id'], None)
+        return Result(deleted_count=0 if doc is None else 1)
+
+    async def count_documents(self, criteria):
+        return len(self.docs)
+
+
+class AsyncDatabase(object):
+    """Asyncio database which returns the same collection for every name."""
+
+    def __init__(self):
+        self.collection = AsyncCollection()
+
+    def __getitem__(self, name):
+        return self.collection
+
+
+class AsyncClient(object):
+    """Asyncio client which records when it has been closed."""
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ForAsync(Document):
+    class Meta:
+        connection = 'test'
+        update_fetch = False
+    index = Field(int)
+    name = Field(str)
+
+
+class CachedAsync(Document):
+    class Meta:
+        connection = 'test'
+        collection = 'for_async'
+        cache = {'ttl': 30}
+    index = Field(int)
+
+
+class ChunkedAsync(Document):
+    class Meta:
+        connection = 'test'
+        collection = 'for_async'
+        in_chunk_size = 2
+    index = Field(int)
+
+
+class ForAsyncReference(Document):
+    class Meta:
+        connection = 'test'
+    ref = Reference(ForAsync)
+
+
+class Flaky(object):
+    """Coroutine function which raises AutoReconnect a number of times before returning."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    async def __call__(self, value):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise AutoReconnect("flaky")
+        return value
+
+
+class TestAutoreconnect(unittest.TestCase):
+    """Test the autoreconnect coroutine."""
+
+    def test_retry(self):
+        """aio.autoreconnect"""
+        con = connection.Connection(uri, retries=2, backoff=0)
+        func = Flaky(2)
+        self.assertEqual(asyncio.run(aio.autoreconnect(con, func, 'value')), 'value')
+        self.assertEqual(func.calls, 3, "function not retried")
+
+        func = Flaky(3)
+        with self.assertRaises(AutoReconnect):
+            asyncio.run(aio.autoreconnect(con, func, 'value'))
+        self.assertEqual(func.calls, 3, "function retried too many times")
+
+
+class TestClose(unittest.TestCase):
+    """Test closing asyncio clients."""
+
+    def test_close(self):
+        """Connection.close (asyncio)"""
+        con = connection.Connection(uri)
+        client = con._async_client = AsyncClient()
+        con._async_database = AsyncDatabase()
+        self.assertIsNone(con.close())
+        self.assertTrue(client.closed, "client was not closed")
+        self.assertIsNone(con._async_client, "client was not reset")
+        self.assertIsNone(con._async_database, "database was not reset")
+
+
+class TestAsync(unittest.TestCase):
+    """Test the asyncio document, cursor, and reference methods."""
+
+    def setUp(self):
+        con = connection.Connection(uri, retries=0, backoff=0)
+        con._async_database = AsyncDatabase()
+        connection.add('test', con)
+        self.collection = con._async_database.collection
+
+    def tearDown(self):
+        connection.get('test').close()
+        connection.connections.pop('test', None)
+
+    def test_document(self):
+        """AsyncDocument"""
+        async def run():
+            doc = await ForAsync(index=1, name="first").asave()
+            self.assertIsNotNone(doc._id, "_id not set on save")
+            self.assertEqual(await ForAsync.acount(), 1)
+
+            found = await ForAsync.afind_one({'index': 1})
+            self.assertEqual(found.name, "first", "document not found")
+            self.assertIsNone(await ForAsync.afind_one({'index': 2}))
+
+            found.name = "changed"
+            self.assertTrue(await found.aupdate())
+            update = {'$set': {'name': "changed"}}
+            self.assertEqual(self.collection.calls[-1], ('update_one', update))
+            self.assertEqual(found.name, "changed", "update not applied locally")
+            self.assertFalse(await found.aupdate(), "unchanged document updated")
+
+            self.assertTrue(await found.aremove())
+            self.assertFalse(await found.aremove(), "document removed twice")
+            self.assertEqual(await ForAsync.acount(), 0)
+        asyncio.run(run())
+
+    def test_identity_map(self):
+        """AsyncDocument.afind_one (identity map)"""
+        async def load(_id):
+            with identity_map():
+                found = await ForAsync.afind_one({'_id': _id})
+                await asyncio.sleep(0)
+                return found, await ForAsync.afind_one({'_id': _id})
+
+        async def run():
+            doc = await ForAsync(index=1, name="first").asave()
+            (first, same), (second, _) = await asyncio.gather(load(doc._id), load(doc._id))
+            self.assertIs(first, same, "document was not reused within a task")
+            self.assertIsNot(first, second, "identity map was shared between tasks")
+            finds = [call for call in self.collection.calls if call[0] == 'find_one']
+            self.assertEqual(len(finds), 2, "identity map was not used")
+        asyncio.run(run())
+
+    def test_cursor(self):
+        """AsyncCursor"""
+        async def run():
+            for index in range(5):
+                await ForAsync(index=index, name=str(index)).ainsert()
+            names = [doc.name async for doc in ForAsync.find(batch_size=2)]
+            self.assertEqual(names, ['0', '1', '2', '3', '4'])
+            docs = await ForAsync.find({'name': '3'}).ato_list()
+            self.assertEqual([doc.index for doc in docs], [3])
+            self.assertEqual(len(await ForAsync.find().ato_list(2)), 2)
+        asyncio.run(run())
+
+    def test_cursor_chunked(self):
+        """AsyncCursor (chunked $in)"""
+        async def run():
+            for index in range(5):
+                await ChunkedAsync(index=index).ainsert()
+            query = {'index': {'$in': [4, 0, 3, 1, 0]}}
+            docs = await ChunkedAsync.find(query, sort=[('index', -1)]).ato_list()
+            self.assertEqual([doc.index for doc in docs], [4, 3, 1, 0])
+            finds = [call for call in self.collection.calls if call[0] == 'find']
+            self.assertEqual(len(finds), 3, "query was not split into chunks")
+        asyncio.run(run())
+
+    def test_cursor_cache(self):
+        """AsyncCursor (cache)"""
+        async def run():
+            await CachedAsync(index=1).ainsert()
+            self.assertEqual([doc.index async for doc in CachedAsync.find()], [1])
+            self.assertEqual([doc.index async for doc in CachedAsync.find()], [1])
+            finds = [call for call in self.collection.calls if call[0] == 'find']
+            self.assertEqual(len(finds), 1, "cached results were not used")
+            await CachedAsync(index=2).ainsert()
+            self.assertEqual([doc.index async for doc in CachedAsync.find()], [1, 2])
+        asyncio.run(run())
+
+    def test_cursor_prefetch(self):
+        """AsyncCursor (prefetch)"""
+        async def run():
+            return [doc async for doc in ForAsyncReference.find().prefetch('ref')]
+        self.assertRaises(errors.OperationError, asyncio.run, run())
+
+    def test_reference(self):
+        """AsyncReferenceFinder"""
+        async def run():
+            doc = await ForAsync(index=1, name="first").asave()
+            ref = ForAsyncReference(ref=doc)
+            found = await ref.ref.afind_one()
+            self.assertEqual(found._id, doc._id, "referenced document not found")
+            ref = ForAsyncReference(ref=Query({'name': "first"}))
+            self.assertEqual((await ref.ref.afind_one()).index, 1)
+        asyncio.run(run())
@@ -0,0 +1,180 @@
+"""Tests for the cache module."""
+from __future__ import absolute_import
+import time
+import unittest
+from bearfield import Document, Field, cache, errors
+from bson.codec_options import CodecOptions
+
+codec_options = CodecOptions()
+namespace = ('mongodb://localhost/test', 'test.cached')
+other_namespace = ('mongodb://localhost/test', 'test.other')
+
+
+class Cached(Document):
+    class Meta:
+        connection = 'test'
+        cache = {'ttl': 30, 'max_entries': 100}
+
+    name = Field(str)
+
+
+class Loader(object):
+    """Return the next of a list of results each time it's called."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.results.pop(0)
+
+
+class TestMemoryBackend(unittest.TestCase):
+    """Test the MemoryBackend class."""
+
+    def test_lru(self):
+        """MemoryBackend (lru)"""
+        backend = cache.MemoryBackend(2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        self.assertEqual(backend.get('a'), 1)
+        backend.set('c', 3)
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual((backend.get('a'), backend.get('c')), (1, 3))
+        backend.clear()
+        self.assertEqual(len(backend), 0)
+
+    def test_clear(self):
+        """MemoryBackend.clear"""
+        backend = cache.MemoryBackend()
+        backend.set((namespace, 'a'), 1)
+        backend.set((other_namespace, 'a'), 2)
+        backend.clear(namespace)
+        self.assertIsNone(backend.get((namespace, 'a')))
+        self.assertEqual(backend.get((other_namespace, 'a')), 2)
+
+
+class TestQueryCache(unittest.TestCase):
+    """Test the QueryCache class."""
+
+    def setUp(self):
+        self.now = 1000.0
+        self.cache = cache.QueryCache(ttl=10, stale_ttl=5)
+        self.cache.clock = lambda: self.now
+
+    def key(self, name):
+        """Return the cache key for a named query in the test namespace."""
+        return self.cache.key(namespace, name)
+
+    def wait(self, key):
+        """Wait for the key to finish refreshing."""
+        for _ in range(100):
+            if key not in self.cache.refreshing:
+                return
+            time.sleep(0.01)
+        self.fail("refresh did not finish")
+
+    def test_key(self):
+        """QueryCache.key"""
+        key = self.cache.key
+        self.assertEqual(key(namespace, 'find', {'a': [1]}), key(namespace, 'find', {'a': [1]}))
+        self.assertNotEqual(key(namespace, 'find', {'a': 1}), key(namespace, 'find', {'a': True}))
+        self.assertNotEqual(key(namespace, 'find', {'a': 1}),
+                            key(other_namespace, 'find', {'a': 1}))
+        self.assertEqual(key(namespace, 'find')[0], namespace)
+        self.assertIsNone(key(namespace, 'find', {'a': {1, 2}}))
+
+    def test_fetch(self):
+        """QueryCache.fetch"""
+        load = Loader({'_id': 1, 'tags': ['a']}, [{'_id': 2}], None)
+        have = self.cache.fetch(self.key('one'), load, codec_options)
+        self.assertEqual(have, {'_id': 1, 'tags': ['a']})
+        have['tags'].append('b')
+        have = self.cache.fetch(self.key('one'), load, codec_options)
+        self.assertEqual(have, {'_id': 1, 'tags': ['a']})
+        self.assertEqual(self.cache.fetch(self.key('many'), load, codec_options), [{'_id': 2}])
+        self.assertIsNone(self.cache.fetch(self.key('none'), load, codec_options))
+        self.assertIsNone(self.cache.fetch(self.key('none'), load, codec_options))
+        self.assertEqual(load.calls, 3)
+
+    def test_expire(self):
+        """QueryCache.fetch (expire)"""
+        load = Loader({'_id': 1}, {'_id': 2}, {'_id': 3})
+        self.cache.fetch(self.key('one'), load, codec_options)
+
+        self.now += 12
+        self.assertEqual(self.cache.fetch(self.key('one'), load, codec_options), {'_id': 1})
+        self.wait(self.key('one'))
+        self.assertEqual(load.calls, 2)
+        self.assertEqual(self.cache.fetch(self.key('one'), load, codec_options), {'_id': 2})
+
+        self.now += 20
+        self.assertEqual(self.cache.fetch(self.key('one'), load, codec_options), {'_id': 3})
+        self.assertEqual(load.calls, 3)
+
+    def test_invalidate(self):
+        """QueryCache.invalidate"""
+        load = Loader({'_id': 1}, {'_id': 2})
+        self.cache.fetch(self.key('one'), load, codec_options)
+        self.cache.invalidate(namespace)
+        self.assertEqual(self.cache.fetch(self.key('one'), load, codec_options), {'_id': 2})
+
+        def invalidate():
+            self.cache.invalidate(namespace)
+            return {'_id': 3}
+
+        self.assertEqual(self.cache.fetch(self.key('two'), invalidate, codec_options), {'_id': 3})
+        self.assertIsNone(self.cache.backend.get(self.key('two')),
+                          "result loaded during invalidate stored")
+
+    def test_shared_backend(self):
+        """QueryCache (shared backend)"""
+        other = cache.QueryCache(ttl=10, backend=self.cache.backend)
+        other.clock = self.cache.clock
+        other.invalidate(namespace)
+        load = Loader({'_id': 1}, {'_id': 2})
+        self.cache.fetch(self.key('one'), load, codec_options)
+        self.assertEqual(other.fetch(self.key('one'), load, codec_options), {'_id': 1})
+        self.assertEqual(load.calls, 1, "entry from another cache was not used")
+        other.invalidate(namespace)
+        self.assertEqual(self.cache.fetch(self.key('one'), load, codec_options), {'_id': 2})
+
+    def test_namespaces(self):
+        """QueryCache (namespaces)"""
+        other = cache.QueryCache(ttl=10, backend=self.cache.backend)
+        other.clock = self.cache.clock
+        load = Loader({'_id': 1}, {'_id': 2}, {'_id': 3})
+        self.cache.fetch(self.key('one'), load, codec_options)
+        other_key = other.key(other_namespace, 'one')
+        self.assertEqual(other.fetch(other_key, load, codec_options), {'_id': 2},
+                         "entry for another collection was used")
+        other.invalidate(other_namespace)
+        self.assertEqual(self.cache.fetch(self.key('one'), load, codec_options), {'_id': 1},
+                         "entry for another collection was invalidated")
+        self.assertEqual(other.fetch(other_key, load, codec_options), {'_id': 3})
+
+    def test_get_cache(self):
+        """cache.get_cache"""
+        self.assertIsNone(cache.get_cache(None))
+        self.assertIs(cache.get_cache(self.cache), self.cache)
+        self.assertEqual(cache.get_cache({'ttl': 5}).ttl, 5)
+        self.assertRaises(errors.ConfigError, cache.get_cache, {'nope': 5})
+        self.assertRaises(errors.ConfigError, cache.get_cache, {'ttl': 0})
+        self.assertIsInstance(Cached._meta.cache, cache.QueryCache)
+        self.assertEqual(Cached._meta.cache.backend.max_entries, 100)
+
+
+class TestCachedCursor(unittest.TestCase):
+    """Test the CachedCursor class."""
+
+    def test_iter(self):
+        """CachedCursor"""
+        cursor = cache.CachedCursor([{'_id': 1}, {'_id': 2}])
+        self.assertIs(cursor.batch_size(10), cursor)
+        self.assertEqual(cursor[1], {'_id': 2})
+        self.assertIsNot(cursor[1], cursor[1], "indexed result was shared")
+        self.assertRaises(IndexError, cursor.__getitem__, 2)
+        self.assertEqual(next(cursor), {'_id': 1})
+        cursor.close()
+        self.assertEqual(list(cursor), [])
@@ -0,0 +1,199 @@
+"""Tests for the chunking module."""
+from __future__ import absolute_import
+import unittest
+from bearfield import chunking, columns, Document, Field
+from bearfield.cache import QueryCache
+from bearfield.connection import Connection
+from bearfield.cursor import Cursor
+from bson import ObjectId
+from datetime import datetime
+
+
+class Collection(object):
+    """Collection which matches documents on a single $in field."""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+        self.counts = []
+        self._connection = Connection('mongodb://localhost/test')
+
+    def matches(self, query):
+        for name, value in query.items():
+            values = value['$in']
+            yield [doc for doc in self.docs if doc.get(name) in values]
+            return
+
+    def find(self, query, projection=None, sort=None, limit=0, **options):
+        self.queries.append((query, sort, limit))
+        docs = next(self.matches(query))
+        if sort:
+            for name, direction in reversed(sort):
+                docs = sorted(docs, key=lambda doc: doc[name], reverse=direction < 0)
+        if limit:
+            docs = docs[:limit]
+        return FakeCursor(docs)
+
+    def count_documents(self, query):
+        self.counts.append(query)
+        return len(next(self.matches(query)))
+
+    def remove(self, query):
+        return {'n': len(next(self.matches(query)))}
+
+
+class FakeCursor(list):
+    """Cursor over a list of documents."""
+    closed = False
+    size = None
+
+    def batch_size(self, size):
+        self.size = size
+
+    def close(self):
+        self.closed = True
+
+
+class Chunked(Document):
+    class Meta:
+        in_chunk_size = 3
+
+    index = Field(int)
+
+
+class TestFunctions(unittest.TestCase):
+    """Test module functions."""
+
+    def test_find_chunked_field(self):
+        """chunking.find_chunked_field"""
+        criteria = {'a': {'$in': [1, 2, 3]}, 'b': {'$in': [1, 2, 3, 4]}, 'c': {'$nin': [1, 2, 3]}}
+        self.assertEqual(chunking.find_chunked_field(criteria, 2), 'b')
+        self.assertEqual(chunking.find_chunked_field(criteria, 4), None)
+        self.assertEqual(chunking.find_chunked_field(criteria, 0), None)
+        self.assertEqual(chunking.find_chunked_field({'$or': [criteria]}, 2), None)
+        self.assertEqual(chunking.find_chunked_field(None, 2), None)
+
+    def test_split_criteria(self):
+        """chunking.split_criteria"""
+        criteria = {'a': {'$in': [1, 2, 3, 4, 5], '$ne': 2}, 'b': 1}
+        have = chunking.split_criteria(criteria, 'a', 2)
+        self.assertEqual(have, [
+            {'a': {'$in': [1, 2], '$ne': 2}, 'b': 1},
+            {'a': {'$in': [3, 4], '$ne': 2}, 'b': 1},
+            {'a': {'$in': [5], '$ne': 2}, 'b': 1},
+        ])
+        self.assertEqual(criteria['a']['$in'], [1, 2, 3, 4, 5], "criteria were modified")
+
+    def test_sort_key(self):
+        """chunking.SortKey"""
+        values = [
+            {'a': datetime(2020, 1, 1)}, {'a': True}, {'a': ObjectId()}, {'a': 'x'}, {'a': 2.5},
+            {'a': 1}, {}, {'a': [3, 0]}, {'a': {'b': 1}},
+        ]
+        have = sorted(values, key=lambda raw: chunking.SortKey(raw, [('a', 1)]))
+        want = [{}, {'a': [3, 0]}, {'a': 1}, {'a': 2.5}, {'a': 'x'}, {'a': {'b': 1}}, values[2],
+                {'a': True}, values[0]]
+        self.assertEqual(have, want, "sort order is incorrect")
+
+        values = [{'a': 1, 'b': 1}, {'a': 1, 'b': 2}, {'a': 2, 'b': 0}]
+        have = sorted(values, key=lambda raw: chunking.SortKey(raw, [('a', -1), ('b', 1)]))
+        self.assertEqual(have, [values[2], values[0], values[1]], "sort order is incorrect")
+
+
+class TestChunkedCursor(unittest.TestCase):
+    """Test the ChunkedCursor class."""
+
+    def setUp(self):
+        self.docs = [{'_id': index, 'index': index % 5, 'rank': -index} for index in range(10)]
+        self.collection = Collection(self.docs)
+        self.criteria = {'index': {'$in': [0, 1, 2, 3, 4]}}
+
+    def test_unsorted(self):
+        """ChunkedCursor (unsorted)"""
+        cursor = chunking.ChunkedCursor(self.collection, self.criteria, 'index', 2)
+        self.assertEqual(sorted(doc['_id'] for doc in cursor), list(range(10)))
+        self.assertEqual([query['index']['$in'] for query, _, _ in self.collection.queries],
+                         [[0, 1], [2, 3], [4]])
+        self.assertEqual(cursor.count(), 10)
+
+    def test_sorted(self):
+        """ChunkedCursor (sorted)"""
+        sort = [('rank', 1)]
+        cursor = chunking.ChunkedCursor(self.collection, self.criteria, 'index', 2, sort=sort)
+        self.assertEqual([doc['_id'] for doc in cursor], list(range(9, -1, -1)))
+
+    def test_skip_limit(self):
+        """ChunkedCursor (skip and limit)"""
+        sort = [('_id', 1)]
+        cursor = chunking.ChunkedCursor(
+            self.collection, self.criteria, 'index', 2, sort=sort, skip=2, limit=3)
+        self.assertEqual([doc['_id'] for doc in cursor], [2, 3, 4])
+        self.assertTrue(all(limit == 5 for _, _, limit in self.collection.queries))
+        self.assertEqual(cursor[1]['_id'], 3)
+        self.assertRaises(IndexError, cursor.__getitem__, 3)
+
+    def test_getitem(self):
+        """ChunkedCursor.__getitem__"""
+        sort = [('_id', 1)]
+        cursor = chunking.ChunkedCursor(self.collection, self.criteria, 'index', 2, sort=sort,
+                                        skip=1)
+        self.assertEqual(next(cursor)['_id'], 1)
+        self.collection.queries = []
+        self.assertEqual(cursor[2]['_id'], 3)
+        self.assertEqual([limit for _, _, limit in self.collection.queries], [4, 4, 4],
+                         "chunk cursors were not recreated")
+        self.assertEqual(next(cursor)['_id'], 2, "cursor position was changed")
+        self.assertRaises(IndexError, cursor.__getitem__, 9)
+
+    def test_unique(self):
+        """ChunkedCursor (unique)"""
+        self.collection.docs.append({'_id': 0, 'index': 4})
+        cursor = chunking.ChunkedCursor(self.collection, self.criteria, 'index', 2)
+        self.assertEqual(sorted(doc['_id'] for doc in cursor), list(range(10)))
+
+    def test_batch_size_close(self):
+        """ChunkedCursor.batch_size and close"""
+        cursor = chunking.ChunkedCursor(self.collection, self.criteria, 'index', 2)
+        cursor.batch_size(7)
+        cursor.close()
+        self.assertTrue(all(chunk.size == 7 and chunk.closed for chunk in cursor.cursors))
+
+
+class TestCursor(unittest.TestCase):
+    """Test chunking by Cursor."""
+
+    def setUp(self):
+        self.docs = [{'_id': index, 'index': index} for index in range(10)]
+        self.collection = Collection(self.docs)
+
+    def test_find(self):
+        """Cursor (chunked find)"""
+        cursor = Cursor(Chunked, self.collection, {'index': {'$in': list(range(8))}}, None, False)
+        self.assertIsInstance(cursor.pymongo, chunking.ChunkedCursor)
+        self.assertEqual([doc.index for doc in cursor], list(range(8)))
+        self.assertEqual(len(self.collection.queries), 3)
+
+        cursor = Cursor(Chunked, self.collection, {'index': {'$in': [1, 2, 3]}}, None, False)
+        self.assertNotIsInstance(cursor.pymongo, chunking.ChunkedCursor)
+
+    def test_count(self):
+        """Cursor.count (chunked)"""
+        cursor = Cursor(Chunked, self.collection, {'index': {'$in': list(range(8))}}, None, False)
+        cursor.cache = QueryCache()
+        self.assertEqual(cursor.count(), 8)
+        self.assertEqual([len(query['index']['$in']) for query in self.collection.counts],
+                         [3, 3, 2], "count was not chunked")
+
+    @unittest.skipIf(columns.numpy is None, "numpy is not installed")
+    def test_to_columns(self):
+        """Cursor.to_columns (chunked)"""
+        cursor = Cursor(Chunked, self.collection, {'index': {'$in': list(range(8))}}, None, False)
+        have = cursor.to_columns(['index'])
+        self.assertEqual(have['index'].tolist(), list(range(8)), "index column is incorrect")
+        self.assertTrue(all(len(query['index']['$in']) <= 3
+                            for query, _, _ in self.collection.queries), "query was not chunked")
+
+    def test_remove(self):
+        """Cursor.remove (chunked)"""
+        cursor = Cursor(Chunked, self.collection, {'index': {'$in': list(range(8))}}, None, False)
+        self.assertEqual(cursor.remove(), 8)
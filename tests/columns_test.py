@@ -0,0 +1,80 @@
+"""Tests for the columns module."""
+from __future__ import absolute_import
+import unittest
+from bearfield import Document, Field, columns, errors
+from datetime import date, datetime
+
+
+class SubColumns(Document):
+    value = Field(float)
+
+
+class ForColumns(Document):
+    class Meta:
+        connection = 'test'
+    index = Field(int)
+    name = Field(str)
+    active = Field(bool)
+    created = Field(datetime)
+    tags = Field([str])
+    sub = Field(SubColumns)
+
+
+@unittest.skipIf(columns.numpy is None, "numpy is not installed")
+class TestBuildColumns(unittest.TestCase):
+    """Test the build_columns function."""
+
+    rows = [
+        {'index': 1, 'name': 'first', 'active': True, 'created': datetime(2020, 1, 2, 3, 4, 5),
+         'tags': ['a'], 'sub': {'value': 1.5}},
+        {'index': 2, 'name': 'second', 'tags': [], 'sub': {}},
+        {'index': 3, 'active': False, 'created': datetime(2021, 1, 1)},
+    ]
+
+    def test_dtypes(self):
+        """columns.build_columns (dtypes)"""
+        names = ['index', 'name', 'active', 'created', 'tags', 'sub.value']
+        have = columns.build_columns(ForColumns, self.rows, names, capacity=1)
+        self.assertEqual(list(have), names, "columns are in the wrong order")
+        self.assertEqual(have['index'].dtype, columns.numpy.dtype('int64'))
+        self.assertEqual(have['name'].dtype, columns.numpy.dtype(object))
+        self.assertEqual(have['active'].dtype, columns.numpy.dtype(bool))
+        self.assertEqual(have['created'].dtype, columns.numpy.dtype('datetime64[ms]'))
+        self.assertEqual(have['tags'].dtype, columns.numpy.dtype(object))
+        self.assertEqual(have['sub.value'].dtype, columns.numpy.dtype('float64'))
+
+    def test_values(self):
+        """columns.build_columns (values)"""
+        names = ['index', 'name', 'created', 'tags', 'sub.value']
+        have = columns.build_columns(ForColumns, self.rows, names, capacity=1)
+        self.assertEqual(have['index'].tolist(), [1, 2, 3])
+        self.assertEqual(have['name'].tolist(), ['first', 'second', None])
+        self.assertEqual(have['created'][0], columns.numpy.datetime64('2020-01-02T03:04:05'))
+        self.assertTrue(have['created'].mask[1], "missing value is not masked")
+        self.assertEqual(have['tags'].tolist(), [['a'], [], None])
+        self.assertEqual(have['sub.value'].tolist(), [1.5, None, None])
+
+    def test_override(self):
+        """columns.build_columns (override)"""
+        have = columns.build_columns(ForColumns, self.rows, ['index'], {'index': 'float32'})
+        self.assertEqual(have['index'].dtype, columns.numpy.dtype('float32'))
+
+        rows = [{'index': 'invalid'}]
+        self.assertRaises(errors.OperationError, columns.build_columns, ForColumns, rows,
+                          ['index'])
+
+    def test_lossy(self):
+        """columns.build_columns (lossy)"""
+        rows = [{'index': 1.0}, {'index': 2.5}]
+        self.assertRaises(errors.OperationError, columns.build_columns, ForColumns, rows,
+                          ['index'])
+        have = columns.build_columns(ForColumns, rows, ['index'], lossy=True)
+        self.assertEqual(have['index'].tolist(), [1, 2])
+        have = columns.build_columns(ForColumns, rows[:1], ['index'])
+        self.assertEqual(have['index'].tolist(), [1])
+
+    def test_dates(self):
+        """columns.get_dtype (date)"""
+        field = Field(date)
+        self.assertEqual(columns.get_dtype(field), columns.datetime_dtype)
+        self.assertEqual(columns.get_dtype(Field(int, strict=False)), object)
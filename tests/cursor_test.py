@@ -1,7 +1,13 @@
 """Tests for the cursor module."""
 from __future__ import absolute_import
 from . import common
-from bearfield import cursor, Document, Field, Query
+from bearfield import columns, cursor, Document, Field, Query
+from operator import add
+import unittest
+
+
+def get_index(doc):
+    return doc.index
 
 
 class TestCursor(common.TestCase):
@@ -13,6 +19,12 @@ class TestCursor(common.TestCase):
         index = Field(int)
         name = Field(str)
 
+    class Chunked(Document):
+        class Meta:
+            connection = 'test'
+            in_chunk_size = 1
+        index = Field(int)
+
     def setUp(self):
         super(TestCursor, self).setUp()
         self.collection = self.connection['cursor']
@@ -54,6 +66,41 @@ class TestCursor(common.TestCase):
         it = cur.__iter__()
         self.assertIsInstance(it, cursor.Cursor, "returned value has invalid type")
 
+    def test_iter_batches(self):
+        """Cursor.iter_batches"""
+        for index in range(3, 6):
+            self.collection.insert({'index': index, 'name': 'more'})
+        cur = cursor.Cursor(self.Document(), self.collection, None, None, False,
+                            sort=[('index', 1)])
+        batches = list(cur.iter_batches(2))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1], "batch sizes are incorrect")
+        indexes = [doc.index for batch in batches for doc in batch]
+        self.assertEqual(indexes, [1, 2, 3, 4, 5], "batched documents are incorrect")
+
+    @unittest.skipIf(columns.numpy is None, "numpy is not installed")
+    def test_to_columns(self):
+        """Cursor.to_columns"""
+        cur = cursor.Cursor(self.Document(), self.collection, None, None, False,
+                            sort=[('index', 1)])
+        have = cur.to_columns(['index', 'name'])
+        self.assertEqual(have['index'].tolist(), [1, 2], "index column is incorrect")
+        self.assertEqual(have['name'].tolist(), ['first', 'second'], "name column is incorrect")
+
+    def test_map_reduce(self):
+        """Cursor.map_reduce"""
+        cur = cursor.Cursor(self.Document, self.collection, None, None, False)
+        self.assertEqual(cur.map_reduce(get_index, add, 0, workers=2), 3, "reduced value is wrong")
+        cur = cursor.Cursor(self.Document, self.collection, None, None, False)
+        self.assertEqual(cur.map_reduce(get_index, add, workers=2), 3,
+                         "reduced value without initial is wrong")
+        cur = cursor.Cursor(self.Document, self.collection, None, None, False)
+        self.assertEqual(sorted(cur.map_reduce(get_index, workers=2)), [1, 2])
+
+        query = {'index': {'$in': [1, 2]}}
+        cur = cursor.Cursor(self.Chunked, self.collection, query, None, False)
+        self.assertEqual(cur.map_reduce(get_index, add, 0, workers=2), 3,
+                         "chunked value is wrong")
+
     def test_close(self):
         """Cursor.close"""
         cur = cursor.Cursor(self.Document(), self.collection, {'index': 1}, None, False)
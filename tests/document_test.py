@@ -1,10 +1,11 @@
 """Test document module."""
 from __future__ import absolute_import
 from . import common
-from bearfield import Field, Q, Reference, document, errors, types
+from bearfield import Field, ObjectId, Q, Reference, document, errors, identity_map, types
 from datetime import datetime
 from pymongo import IndexModel, ASCENDING, DESCENDING
 from six.moves import range
+import unittest
 
 
 def create_document(base=None, **options):
@@ -36,6 +37,14 @@ class WithFields(document.Document):
     optional = Field(str, require=False)
 
 
+class WithCache(document.Document):
+    class Meta:
+        connection = 'test'
+        cache = {'ttl': 60}
+    index = Field(int)
+    name = Field(str)
+
+
 class WithDate(document.Document):
     class Meta:
         connection = 'test'
@@ -62,6 +71,17 @@ class TopDocument(document.Document):
     sub = Field(SubDocument)
 
 
+class DefaultSub(document.Document):
+    index = Field(int)
+    name = Field(str, default='sub')
+
+
+class WithDefaultSub(document.Document):
+    class Meta:
+        connection = 'test'
+    sub = Field(DefaultSub)
+
+
 class Partial(document.Document):
     class Meta:
         connection = 'test'
@@ -70,6 +90,25 @@ class Partial(document.Document):
     type = Field(str)
 
 
+class WithContainers(document.Document):
+    class Meta:
+        connection = 'test'
+    tags = Field([str])
+    labels = Field({str})
+    attrs = Field(dict)
+    sub = Field(SubDocument)
+    subs = Field([SubDocument])
+
+
+class Unacknowledged(document.Document):
+    class Meta:
+        connection = 'test'
+        write_concern = {'w': 0}
+        update_fetch = False
+    index = Field(int)
+    name = Field(str)
+
+
 class WithReference(document.Document):
     class Meta:
         connection = 'test'
@@ -90,10 +129,31 @@ class WithIndexes(document.Document):
     name = Field(str)
 
 
+class CompactSub(document.Document):
+    class Meta:
+        compact = True
+    index = Field(int)
+
+
+class Compact(document.Document):
+    class Meta:
+        connection = 'test'
+        compact = True
+    index = Field(int)
+    name = Field(str)
+    sub = Field(CompactSub)
+
+
+class CompactChild(Compact):
+    class Meta:
+        connection = 'test'
+    type = Field(str)
+
+
 class TestDocument(common.TestCase):
     """Test Document class."""
 
-    def validate_save(self, collection, document, raw):
+    def validate_stored(self, collection, document, raw):
         collection = self.connection[collection]
         have = collection.find_one({'_id': document._id})
         self.assertIsNotNone(have, "document was not saved")
@@ -101,7 +161,10 @@ class TestDocument(common.TestCase):
         self.assertIsNotNone(_id, "stored document has no id")
         self.assertEqual(_id, document._id, "document id is incorrect")
         self.assertEqual(have, raw, "stored document is incorrect")
-        collection.remove()
+
+    def validate_save(self, collection, document, raw):
+        self.validate_stored(collection, document, raw)
+        self.connection[collection].remove()
 
     def test_save(self):
         """Document.save"""
@@ -156,6 +219,20 @@ class TestDocument(common.TestCase):
         doc = cls(index=5, name='the fourth', optional='yes')
         self.assertRaises(errors.OperationError, doc.update)
 
+    def test_update_without_fetch(self):
+        """Document.update(fetch=False)"""
+        raw = {'index': 6, 'name': 'the fifth'}
+        doc = WithFields(index=5, name='the fourth', optional='yes')
+        doc.save()
+        doc.name = 'the fifth'
+        doc.optional = None
+        self.assertTrue(doc.update(fetch=False), "operational update did not return true")
+        self.assertEqual(doc.name, 'the fifth', "update was not applied")
+        self.assertIsNone(doc.optional, "unset was not applied")
+        self.assertTrue(doc.update({'$inc': {'index': 1}}, fetch=False))
+        self.assertEqual(doc.index, 6, "unapplied field was not fetched")
+        self.validate_save('with_fields', doc, raw)
+
         cls = create_document(WithFields, disable_update=True)
         doc = cls(index=5, name='the fourth', optional='yes')
         self.assertRaises(errors.OperationError, doc.update)
@@ -180,6 +257,78 @@ class TestDocument(common.TestCase):
         doc = cls(index=3, name='the third')
         self.assertRaises(errors.OperationError, doc.remove)
 
+    def test_insert_many(self):
+        """Document.insert_many"""
+        docs = [WithFields(index=n, name='number {}'.format(n)) for n in range(5)]
+        have = WithFields.insert_many(iter(docs), batch_size=2)
+        self.assertEqual(have, docs, "inserted documents are incorrect")
+        for n, doc in enumerate(docs):
+            self.assertIsNotNone(doc._id, "document id was not set")
+            self.assertEqual(doc._encode(True), {}, "document was not reset")
+            self.validate_stored('with_fields', doc, {'index': n, 'name': 'number {}'.format(n)})
+        WithFields.find().remove()
+
+        docs = [WithFields(index=1), WithFields(index=2), WithFields(index=3)]
+        WithFields.insert_many(docs[:1])
+        docs[2]._id = docs[0]._id
+        try:
+            WithFields.insert_many(docs[1:], ordered=False)
+        except errors.BulkError as e:
+            self.assertEqual([doc for doc, _ in e.errors], [docs[2]], "errors are incorrect")
+        else:
+            self.fail("duplicate insert did not raise BulkError")
+        self.assertIsNotNone(docs[1]._id, "successful insert was not reported")
+        self.assertEqual(WithFields.count(), 2, "incorrect number of documents inserted")
+        WithFields.find().remove()
+
+        docs = [WithFields(index=1), WithFields(index='one'), WithFields(index=3)]
+        try:
+            WithFields.insert_many(docs)
+        except errors.BulkError as e:
+            self.assertEqual([doc for doc, _ in e.errors], [docs[1]], "errors are incorrect")
+            self.assertIsInstance(e.errors[0][1], errors.EncodingError, "error is incorrect")
+            self.assertEqual(e.unreached, [docs[2]], "unreached documents are incorrect")
+        else:
+            self.fail("invalid insert did not raise BulkError")
+        self.assertIsNotNone(docs[0]._id, "prepared insert was not written")
+        self.assertEqual(WithFields.count(), 1, "incorrect number of documents inserted")
+        WithFields.find().remove()
+
+        cls = create_document(WithFields, disable_insert=True)
+        self.assertRaises(errors.OperationError, cls.insert_many, [cls(index=1)])
+
+    def test_save_many(self):
+        """Document.save_many"""
+        doc1 = WithFields(index=1, name='the first')
+        doc1.save()
+        doc1.name = 'the first again'
+        doc2 = WithFields(index=2, name='the second')
+        WithFields.save_many([doc1, doc2])
+        self.assertIsNotNone(doc2._id, "document id was not set")
+        self.assertEqual(WithFields.count(), 2, "incorrect number of documents saved")
+        self.validate_save('with_fields', doc1, {'index': 1, 'name': 'the first again'})
+
+        cls = create_document(WithFields, disable_save=True)
+        self.assertRaises(errors.OperationError, cls.save_many, [cls(index=1)])
+
+    def test_update_many_docs(self):
+        """Document.update_many_docs"""
+        docs = WithFields.insert_many(
+            [WithFields(index=n, name='number {}'.format(n), optional='yes') for n in range(3)])
+        docs[0].name = 'the first'
+        docs[1].optional = None
+        have = WithFields.update_many_docs(docs)
+        self.assertEqual(have, docs, "updated documents are incorrect")
+        self.assertEqual(docs[0].name, 'the first', "update was not merged")
+        self.assertIsNone(docs[1].optional, "unset was not merged")
+
+        stored = {doc._id: doc for doc in WithFields.find()}
+        self.assertEqual(stored[docs[0]._id].name, 'the first', "update did not occur")
+        self.assertIsNone(stored[docs[1]._id].optional, "unset did not occur")
+        self.assertEqual(stored[docs[2]._id].name, 'number 2', "document was modified")
+        self.assertRaises(errors.OperationError, WithFields.update_many_docs, [WithFields()])
+        WithFields.find().remove()
+
     def test_validate(self):
         """Document._validate"""
         doc = WithDate(index=1)
@@ -240,6 +389,57 @@ class TestDocument(common.TestCase):
         self.assertEqual(doc._id, doc1._id, "returned incorrect document")
         doc._meta.get_collection().remove()
 
+    def test_get_many(self):
+        """Document.get_many"""
+        doc1 = WithFields(index=1, name='the first')
+        doc1.save()
+        doc2 = WithFields(index=2, name='the second')
+        doc2.save()
+        missing = ObjectId()
+
+        docs = WithFields.get_many([doc2._id, missing, str(doc1._id), doc2._id])
+        have = [doc and doc.index for doc in docs]
+        self.assertEqual(have, [2, None, 1, 2], "returned incorrect documents")
+        self.assertIs(docs[0], docs[3], "duplicate ids were not retrieved once")
+        self.assertEqual(WithFields.get_many([]), [])
+        doc1._meta.get_collection().remove()
+
+    def test_identity_map(self):
+        """Document.find_one (identity map)"""
+        doc = WithFields(index=1, name='the first')
+        doc.save()
+        with identity_map() as mapping:
+            first = WithFields.find_one({'_id': doc._id})
+            self.assertIs(WithFields.find_one({'_id': str(doc._id)}), first)
+            self.assertIs(WithFields.get_many([doc._id])[0], first)
+            self.assertIsNot(WithFields.find_one({'_id': doc._id}, ['name']), first)
+
+            doc.name = 'the updated'
+            doc.update()
+            self.assertIs(WithFields.find_one({'_id': doc._id}), doc)
+            doc.remove()
+            self.assertIsNone(WithFields.find_one({'_id': doc._id}))
+            self.assertEqual(len(mapping), 0)
+
+    def test_cache(self):
+        """Document.find_one (cache)"""
+        doc = WithCache(index=1, name='the first')
+        doc.save()
+        self.assertEqual(WithCache.find_one({'index': 1}).name, 'the first')
+        self.assertEqual([item.name for item in WithCache.find()], ['the first'])
+
+        collection = WithCache._meta.get_collection()
+        collection.update_one({'_id': doc._id}, {'$set': {'name': 'the hidden'}})
+        self.assertEqual(WithCache.find_one({'index': 1}).name, 'the first')
+        self.assertEqual([item.name for item in WithCache.find()], ['the first'])
+
+        doc.name = 'the updated'
+        doc.update()
+        self.assertEqual(WithCache.find_one({'index': 1}).name, 'the updated')
+        self.assertEqual([item.name for item in WithCache.find()], ['the updated'])
+        doc.remove()
+        self.assertIsNone(WithCache.find_one({'index': 1}))
+
     def test_find_and_modify(self):
         """Document.find_and_modify"""
         doc1 = WithFields(index=2, name='the fourth')
@@ -318,11 +518,29 @@ class TestDocument(common.TestCase):
         self.assertEqual(doc._encode()['sub'], raw['sub'], "returned subdocument is incorrect")
         self.validate_save('top_document', doc, raw)
 
+    def test_scan(self):
+        """Document.scan"""
+        WithFields.insert_many([WithFields(index=index, name='scanned') for index in range(50)])
+        docs = WithFields.scan({'name': 'scanned'}, workers=4)
+        self.assertEqual(sorted(doc.index for doc in docs), list(range(50)),
+                         "scan returned incorrect documents")
+        counts = WithFields.scan({'name': 'scanned'}, workers=4,
+                                 callback=lambda cur: len(list(cur)))
+        self.assertEqual(sum(counts), 50, "scan callbacks returned incorrect counts")
+        self.remove(WithFields)
+
     def test_meta_get_collection(self):
         """Document._meta.get_collection"""
         collection = WithCollection._meta.get_collection()
         self.assertEqual(collection.name, 'other', "returned incorrect collection")
 
+    def test_meta_write_concern(self):
+        """Document._meta.write_concern"""
+        collection = Unacknowledged._meta.get_collection()
+        self.assertFalse(collection.write_concern.acknowledged, "write concern was not applied")
+        collection = WithFields._meta.get_collection()
+        self.assertTrue(collection.write_concern.acknowledged, "write concern was changed")
+
     def test_meta_get_connection(self):
         """Document._meta.get_connection"""
         con = WithFields._meta.get_connection('test')
@@ -575,3 +793,166 @@ class TestInheritedDocument(common.TestCase):
         value = 'value of ' + name
         init_child = InitChild._decode(raw={'name': name})
         self.assertEqual(init_child.value, value)
+
+
+class TestCompactDocument(unittest.TestCase):
+    """Test compact Document objects."""
+
+    def test_layout(self):
+        """Compact document layout"""
+        doc = Compact(index=1)
+        self.assertFalse(hasattr(doc, '__dict__'), "compact document has a __dict__")
+        self.assertRaises(AttributeError, setattr, doc, 'nope', 1)
+        self.assertTrue(CompactChild._meta.compact, "compact option is not inherited")
+        self.assertEqual(CompactChild.__slots__, ('_field_type',))
+        self.assertFalse(hasattr(CompactChild(), '__dict__'), "compact child has a __dict__")
+        slots = [name for base in Compact.__mro__ for name in getattr(base, '__slots__', ())]
+        self.assertNotIn('_attrs', slots)
+        self.assertNotIn('_dirty', slots)
+
+    def test_fields(self):
+        """Compact document fields"""
+        doc = Compact._decode({'_id': 1, 'index': 1, 'name': 'first', 'sub': {'index': 2}})
+        self.assertEqual(doc.index, 1)
+        self.assertEqual(doc.sub.index, 2)
+        self.assertEqual(set(doc._attrs), {'index', 'sub'})
+        self.assertEqual(doc._encode(True), {})
+
+        doc.name = 'second'
+        doc.index = None
+        self.assertEqual(doc._field_name, 'second')
+        self.assertEqual(set(doc._dirty), {'name', 'index'})
+        self.assertEqual(doc._encode(True), {'$set': {'name': 'second'}, '$unset': {'index': ''}})
+
+        doc._reset({'name': 'second', 'index': None})
+        self.assertEqual(list(doc._dirty), [])
+        self.assertEqual(list(doc._attrs), [])
+        self.assertEqual(doc._encode(), {'_id': 1, 'name': 'second', 'sub': {'index': 2}})
+
+        child = CompactChild(index='3', type='child')
+        self.assertEqual(child._encode(), {'index': 3, 'type': 'child'})
+
+
+class TestMeta(unittest.TestCase):
+    """Test the DocumentMeta field indexes."""
+
+    def test_paths(self):
+        """Document._meta.paths"""
+        meta = TopDocument._meta
+        self.assertEqual(set(meta.paths), {'_id', 'sub', 'sub.index', 'sub.name'})
+        self.assertIs(meta.get_field('sub.name'), SubDocument._meta.fields['name'])
+        self.assertIsNone(meta.get_field('sub.name.nope'))
+        self.assertIsNone(meta.get_field('sub.$'), "positional path found without positional")
+        self.assertIs(meta.get_field('sub.name.$', True), SubDocument._meta.fields['name'])
+        self.assertIs(meta.get_field('sub', True), meta.fields['sub'])
+
+    def test_get_fields(self):
+        """Document._meta.get_fields"""
+        meta = TopDocument._meta
+        self.assertIs(meta.get_fields(None), meta.fields)
+        fields = meta.get_fields({'_id', 'sub', 'nope'})
+        self.assertEqual(set(fields), {'_id', 'sub'})
+        self.assertIs(meta.get_fields({'nope', 'sub', '_id'}), fields, "fields are not cached")
+
+
+class TestDecode(unittest.TestCase):
+    """Test Document._decode."""
+
+    def test_copy(self):
+        """Document._decode(copy)"""
+        raw = {'_id': 1, 'sub': {'index': 1, 'name': 'sub'}}
+        doc = TopDocument._decode(raw)
+        self.assertIsNot(doc._raw, raw, "raw document is not copied")
+        doc = TopDocument._decode(raw, copy=False)
+        self.assertIs(doc._raw, raw, "raw document is copied")
+        self.assertIs(doc.sub._raw, raw['sub'], "raw subdocument is copied")
+
+    def test_copy_defaults(self):
+        """Document._decode(copy) (defaults)"""
+        raw = {'_id': 1, 'sub': {'index': 1}}
+        doc = WithDefaultSub._decode(raw, copy=False)
+        self.assertEqual(doc.sub.name, 'sub')
+        self.assertEqual(raw['sub'], {'index': 1}, "raw subdocument was modified")
+
+
+class TestChanges(unittest.TestCase):
+    """Test change tracking of mutable field values."""
+
+    raw = {
+        '_id': 1,
+        'tags': ['a', 'b'],
+        'labels': ['x'],
+        'attrs': {'one': 1, 'two': 2},
+        'sub': {'index': 1, 'name': 'sub'},
+        'subs': [{'index': 1}, {'index': 2}, {'index': 3}],
+    }
+
+    def test_containers(self):
+        """Document._encode(update) (containers)"""
+        doc = WithContainers._decode(self.raw)
+        doc.tags.append('c')
+        doc.labels.add('y')
+        doc.attrs['one'] = 3
+        del doc.attrs['two']
+        self.assertEqual(doc._encode(True), {
+            '$push': {'tags': {'$each': ['c']}},
+            '$addToSet': {'labels': {'$each': ['y']}},
+            '$set': {'attrs.one': 3},
+            '$unset': {'attrs.two': ''},
+        })
+        self.assertEqual(self.raw['attrs'], {'one': 1, 'two': 2}, "raw value was modified")
+
+    def test_subdocuments(self):
+        """Document._encode(update) (subdocuments)"""
+        doc = WithContainers._decode(self.raw)
+        doc.sub.name = 'changed'
+        doc.subs[1].index = 5
+        self.assertEqual(doc._encode(True), {'$set': {'sub.name': 'changed', 'subs.1.index': 5}})
+
+        doc = WithContainers._decode(self.raw)
+        doc.subs.append(SubDocument(index=4))
+        self.assertEqual(doc._encode(True), {'$push': {'subs': {'$each': [{'index': 4}]}}})
+
+    def test_unchanged(self):
+        """Document._encode(update) (unchanged)"""
+        doc = WithContainers._decode(self.raw)
+        doc.tags = ['a', 'b']
+        doc.sub = SubDocument(index=1, name='sub')
+        doc.attrs = None
+        doc.attrs = {'one': 1, 'two': 2}
+        self.assertEqual(doc._encode(True), {}, "unchanged values were updated")
+
+    def test_defaults(self):
+        """Document._encode(update) (defaults)"""
+        doc = Defaults._decode({'_id': 1, 'name': 'stored'})
+        doc.index = 12
+        doc.called = ['0', '1']
+        doc.name = 'stored'
+        self.assertEqual(doc._encode(True), {'$set': {'index': 12, 'called': ['0', '1']}},
+                         "unstored defaults were not written")
+        doc._apply(doc._encode(True))
+        doc.index = 12
+        self.assertEqual(doc._encode(True), {}, "written default was updated")
+
+    def test_apply(self):
+        """Document._apply"""
+        doc = WithContainers._decode(self.raw)
+        doc.tags.append('c')
+        doc.sub.index = 2
+        doc._apply(doc._encode(True))
+        self.assertEqual(doc.tags, ['a', 'b', 'c'])
+        self.assertEqual(doc.sub.index, 2)
+        self.assertEqual(doc._encode(True), {})
+
+    def test_apply_unsupported(self):
+        """Document._apply (unsupported operator)"""
+        doc = WithContainers._decode(self.raw)
+        doc._apply({'$set': {'sub.index': 2}, '$inc': {'attrs.one': 1}})
+        self.assertIsNone(doc.sub, "field was not removed")
+        self.assertIsNone(doc.attrs, "field was not removed")
+        self.assertEqual(doc.tags, ['a', 'b'], "unchanged field was removed")
+        self.assertEqual(doc._partial, {'_id', 'tags', 'labels', 'subs'},
+                         "document was not marked partial")
+        self.assertRaises(errors.OperationError, doc.save)
+        doc.tags.append('c')
+        self.assertEqual(doc._encode(True), {'$push': {'tags': {'$each': ['c']}}})
@@ -309,6 +309,30 @@ class TestQueryEncoder(unittest.TestCase):
         self.assertIsNone(enc.encode(OrderedDict()))
         self.assertRaises(EncodingError, enc.encode, 'nope')
 
+    def test_dispatch(self):
+        """QueryEncoder.dispatch"""
+        self.assertEqual(encoders.QueryEncoder.dispatch['$in'], 'encode_field')
+        self.assertNotIn('$nope', encoders.QueryEncoder.dispatch)
+        enc = ForEncoders._meta.query_encoder
+        self.assertIsInstance(enc, encoders.QueryEncoder)
+        self.assertIs(enc.document, ForEncoders)
+        self.assertEqual(enc.get_encode_method('$or'), enc.encode_logical)
+        self.assertEqual(enc.get_encode_method('$nope'), enc.encode_default)
+
+    def test_encode_values(self):
+        """QueryEncoder.encode_values"""
+        enc = encoders.QueryEncoder(ForEncoders)
+        field = ForEncoders._meta.get_field('number')
+        values = (1, 2, 3)
+        have = enc.encode_values('number', field, values)
+        self.assertEqual(have, [1, 2, 3])
+        self.assertIsInstance(have, list)
+        have = enc.encode_values('number', field, [1, '2', True])
+        self.assertEqual([type(value) for value in have], [int, int, int])
+        self.assertIn('number', enc.field_encoders)
+        have = enc.encode({'number': {'$in': ['1', 2]}, 'sub.index': {'$in': ['3']}})
+        self.assertEqual(have, {'number': {'$in': [1, 2]}, 'sub.index': {'$in': [3]}})
+
 
 class TestUpdateEncoder(unittest.TestCase):
     """Test UpdateEncoder class."""
@@ -68,6 +68,24 @@ class TestField(unittest.TestCase):
 
         self.assertRaises(errors.EncodingError, field.decode, 'test', 'test', 'invalid')
 
+    def test_compile(self):
+        """Field.compile_encoder"""
+        field = Field(int, strict=False)
+        self.assertEqual(field.compile_encoder('test', 'test')("12"), "12")
+        self.assertEqual(field.compile_decoder('test', 'test')("12"), "12")
+
+        field = Field(int)
+        self.assertEqual(field.compile_encoder('test', 'test')("12"), 12)
+
+        class Doubled(Field):
+            def encode(self, cls, name, value):
+                return super(Doubled, self).encode(cls, name, value) * 2
+
+        field = Doubled(int)
+        self.assertEqual(field.compile_encoder('test', 'test')("12"), 24)
+        self.assertEqual(ForFields._meta.encoders['date'](date(2014, 1, 2)),
+                         datetime(2014, 1, 2))
+
     def test_validate(self):
         """Field.validate"""
         def validate(cls, name, value):
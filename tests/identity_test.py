@@ -0,0 +1,118 @@
+"""Tests for the identity module."""
+from __future__ import absolute_import
+import unittest
+from bearfield import Document, Field, ObjectId, identity
+
+
+class Mapped(Document):
+    class Meta:
+        connection = 'test'
+
+    name = Field(str)
+
+
+class Other(Document):
+    class Meta:
+        connection = 'test'
+
+    name = Field(str)
+
+
+def make(cls=Mapped, name='mapped'):
+    """Return a document with an _id."""
+    doc = cls(name=name)
+    doc._id = ObjectId()
+    return doc
+
+
+class TestFunctions(unittest.TestCase):
+    """Test module functions."""
+
+    def test_get_id(self):
+        """identity.get_id"""
+        _id = ObjectId()
+        self.assertEqual(identity.get_id({'_id': _id}), _id)
+        self.assertIsNone(identity.get_id({'_id': {'$in': [_id]}}))
+        self.assertIsNone(identity.get_id({'_id': _id, 'name': 'mapped'}))
+        self.assertIsNone(identity.get_id({}))
+        self.assertIsNone(identity.get_id(None))
+
+    def test_current(self):
+        """identity.current"""
+        doc = make()
+        self.assertIsNone(identity.current())
+        identity.add(doc)
+        with identity.identity_map() as outer:
+            with identity.identity_map() as inner:
+                self.assertIs(identity.current(), inner)
+                identity.add(doc)
+                self.assertIs(identity.get(Mapped, doc._id), doc)
+                self.assertIs(outer.get(Mapped, doc._id), doc)
+                identity.discard(Mapped, doc._id)
+                self.assertEqual((len(inner), len(outer)), (0, 0))
+            self.assertIs(identity.current(), outer)
+        self.assertIsNone(identity.current())
+        self.assertIsNone(identity.get(Mapped, doc._id))
+
+    @unittest.skipIf(identity.ContextVar is None, "contextvars is not available")
+    def test_context(self):
+        """identity.current (context)"""
+        from contextvars import copy_context
+
+        def enter():
+            mapping = identity.identity_map().__enter__()
+            return identity.current() is mapping
+
+        with identity.identity_map() as outer:
+            self.assertTrue(copy_context().run(enter), "map was not activated in context")
+            self.assertIs(identity.current(), outer, "map leaked out of its context")
+
+
+class TestIdentityMap(unittest.TestCase):
+    """Test the IdentityMap class."""
+
+    def test_add(self):
+        """IdentityMap.add"""
+        mapping = identity.IdentityMap()
+        doc = make()
+        mapping.add(doc)
+        self.assertIs(mapping.get(Mapped, doc._id), doc)
+        self.assertIsNone(mapping.get(Other, doc._id))
+
+        replaced = make()
+        replaced._id = doc._id
+        mapping.add(replaced)
+        self.assertIs(mapping.get(Mapped, doc._id), replaced)
+
+        partial = Mapped._decode({'_id': doc._id}, ['name'])
+        mapping.add(partial)
+        self.assertIsNone(mapping.get(Mapped, doc._id))
+
+        mapping.add(Mapped(name='new'))
+        self.assertEqual(len(mapping), 0)
+
+    def test_lru(self):
+        """IdentityMap (lru)"""
+        mapping = identity.IdentityMap(2)
+        docs = [make() for _ in range(3)]
+        mapping.add(docs[0])
+        mapping.add(docs[1])
+        mapping.get(Mapped, docs[0]._id)
+        mapping.add(docs[2])
+        self.assertIsNone(mapping.get(Mapped, docs[1]._id))
+        self.assertIs(mapping.get(Mapped, docs[0]._id), docs[0])
+        self.assertIs(mapping.get(Mapped, docs[2]._id), docs[2])
+
+    def test_clear(self):
+        """IdentityMap.clear"""
+        mapping = identity.IdentityMap()
+        doc = make()
+        other = make(Other)
+        mapping.add(doc)
+        mapping.add(other)
+        mapping.clear(Mapped)
+        self.assertIsNone(mapping.get(Mapped, doc._id))
+        self.assertIs(mapping.get(Other, other._id), other)
+        mapping.clear()
+        self.assertEqual(len(mapping), 0)
+        self.assertIsNone(mapping.get(Mapped, {'unhashable': []}))
@@ -0,0 +1,65 @@
+"""Tests for the mapreduce module."""
+from __future__ import absolute_import
+import unittest
+from bearfield import Document, Field, mapreduce
+from bson import BSON
+from bson.codec_options import DEFAULT_CODEC_OPTIONS
+from operator import add
+
+
+class ForMapReduce(Document):
+    class Meta:
+        connection = 'test'
+    index = Field(int)
+    name = Field(str)
+
+
+def get_index(doc):
+    return doc.index
+
+
+def encode_batch(docs):
+    """Return a batch of raw BSON bytes for the given documents."""
+    return b''.join(BSON.encode(doc) for doc in docs)
+
+
+class TestFunctions(unittest.TestCase):
+    """Test module functions."""
+
+    batches = [
+        encode_batch([{'index': 1, 'name': 'first'}, {'index': 2, 'name': 'second'}]),
+        encode_batch([{'index': 3, 'name': 'third'}]),
+    ]
+
+    def test_decode_batch(self):
+        """mapreduce.decode_batch"""
+        docs = mapreduce.decode_batch(ForMapReduce, self.batches[0], None, DEFAULT_CODEC_OPTIONS)
+        self.assertEqual([doc.name for doc in docs], ['first', 'second'])
+        self.assertIsInstance(docs[0], ForMapReduce)
+
+    def test_map_batch(self):
+        """mapreduce.map_batch"""
+        args = (ForMapReduce, self.batches[0], None, DEFAULT_CODEC_OPTIONS, get_index)
+        self.assertEqual(mapreduce.map_batch(*(args + (None, None))), [1, 2])
+        self.assertEqual(mapreduce.map_batch(*(args + (add, 10))), 13)
+        self.assertEqual(mapreduce.map_batch(*(args + (add, None))), 3)
+
+    def test_reduce_values(self):
+        """mapreduce.reduce_values"""
+        self.assertEqual(mapreduce.reduce_values(add, [1, 2], 10), 13)
+        self.assertEqual(mapreduce.reduce_values(add, [1, 2]), 3)
+        self.assertEqual(mapreduce.reduce_values(add, [], 10), 10)
+        self.assertRaises(TypeError, mapreduce.reduce_values, add, [])
+
+    def test_iter_results(self):
+        """mapreduce.iter_results"""
+        results = mapreduce.iter_results(iter(self.batches), ForMapReduce, None,
+                                         DEFAULT_CODEC_OPTIONS, get_index, None, None, 2, 1)
+        self.assertEqual(list(results), [[1, 2], [3]], "mapped results are incorrect")
+        results = mapreduce.iter_results(iter(self.batches), ForMapReduce, None,
+                                         DEFAULT_CODEC_OPTIONS, get_index, add, 0, 2)
+        self.assertEqual(list(results), [3, 3], "reduced results are incorrect")
+        batches = iter([b''] + self.batches)
+        results = mapreduce.iter_results(batches, ForMapReduce, None, DEFAULT_CODEC_OPTIONS,
+                                         get_index, add, None, 2)
+        self.assertEqual(list(results), [3, 3], "empty batch was not skipped")
@@ -0,0 +1,80 @@
+"""Tests for the optimizer module."""
+from __future__ import absolute_import
+import re
+import unittest
+from bearfield import optimizer
+from collections import OrderedDict
+
+
+class TestOptimize(unittest.TestCase):
+    """Test the optimize function."""
+
+    def check(self, criteria, want):
+        """Assert that the optimized criteria are correct."""
+        have = optimizer.optimize(criteria)
+        self.assertEqual(have, want, "optimized query is incorrect")
+
+    def test_unchanged(self):
+        """optimizer.optimize (unchanged)"""
+        criteria = {'a': 1, 'b': {'$gt': 2}}
+        self.assertIs(optimizer.optimize(criteria), criteria, "plain query was copied")
+        self.check({'$and': [{'a': 1}, {'a': 1}, {'b': 2}]}, {'a': 1, 'b': 2})
+        self.check({'$and': [{'a': {'$gt': 1}}, {'a': {'$gt': 2}}, {'a': {'$gt': 2}}]},
+                   {'a': {'$gt': 1}, '$and': [{'a': {'$gt': 2}}]})
+        self.check({'$or': [{'a': 1}]}, {'a': 1})
+
+    def test_flatten(self):
+        """optimizer.optimize (flatten)"""
+        self.check({'$and': [{'$and': [{'a': 1}, {'b': 2}]}, {'c': 3}]}, {'a': 1, 'b': 2, 'c': 3})
+        self.check({'$or': [{'$or': [{'a': 1}, {'b': 2}]}, {'c': {'$gt': 3}}]},
+                   {'$or': [{'a': 1}, {'b': 2}, {'c': {'$gt': 3}}]})
+        self.check({'$nor': [{'$nor': [{'a': 1}, {'b': 2}]}, {'c': 3}]},
+                   {'$nor': [{'$nor': [{'a': 1}, {'b': 2}]}, {'c': 3}]})
+
+    def test_merge(self):
+        """optimizer.optimize (merge)"""
+        self.check({'a': 1, '$and': [{'b': 2}, {'a': 1}]}, {'a': 1, 'b': 2})
+        self.check({'$and': [{'a': {'$gt': 1}}, {'a': {'$lt': 5}}]}, {'a': {'$gt': 1, '$lt': 5}})
+        self.check({'$and': [{'a': {'$gt': 1}}, {'a': {'$gt': 5}}]},
+                   {'a': {'$gt': 1}, '$and': [{'a': {'$gt': 5}}]})
+        self.check({'$and': [{'a': 1}, {'a': True}]}, {'a': 1, '$and': [{'a': True}]})
+        self.check({'$and': [{'$or': [{'a': 1}, {'b': 1}]}, {'$or': [{'c': 1}, {'d': 1}]}]},
+                   {'$or': [{'a': 1}, {'b': 1}], '$and': [{'$or': [{'c': 1}, {'d': 1}]}]})
+        self.check({'$and': [{}, {'a': 1}]}, {'a': 1})
+
+    def test_in(self):
+        """optimizer.optimize (in)"""
+        self.check({'$or': [{'a': 1}, {'a': 2}, {'a': {'$in': [2, 3]}}]},
+                   {'a': {'$in': [1, 2, 3]}})
+        self.check({'$or': [{'a': 1}, {'b': 2}, {'a': 3}]},
+                   {'$or': [{'a': {'$in': [1, 3]}}, {'b': 2}]})
+        self.check({'$or': [{'a': 1}, {'a': [1, 2]}]}, {'$or': [{'a': 1}, {'a': [1, 2]}]})
+        self.check({'$or': [{'a': 1}, {'a': {'$gt': 5}}]}, {'$or': [{'a': 1}, {'a': {'$gt': 5}}]})
+        self.check({'$or': [{'a': 1}, {'a': 1.0}, {'a': True}]}, {'a': {'$in': [1, 1.0, True]}})
+
+    def test_unique(self):
+        """optimizer.optimize (unique)"""
+        self.check({'$or': [{'a': 1, 'b': 2}, {'a': 1, 'b': 2}]}, {'a': 1, 'b': 2})
+        self.check({'$nor': [{'a': 1}, {'a': 1}]}, {'$nor': [{'a': 1}]})
+        self.check({'a': {'$in': [1, 1]}}, {'a': {'$in': [1, 1]}})
+
+    def test_not(self):
+        """optimizer.optimize (not)"""
+        pattern = re.compile('^a')
+        self.check({'$not': {'a': 1}}, {'a': {'$ne': 1}})
+        self.check({'$not': {'a': {'$ne': 1}}}, {'a': 1})
+        self.check({'$not': {'$not': {'a': 1}}}, {'a': 1})
+        self.check({'$not': {'a': {'$in': [1, 2]}}}, {'a': {'$nin': [1, 2]}})
+        self.check({'$not': {'a': {'$gt': 1, '$lt': 5}}}, {'a': {'$not': {'$gt': 1, '$lt': 5}}})
+        self.check({'$not': {'a': {'$not': {'$gt': 1}}}}, {'a': {'$gt': 1}})
+        self.check({'$not': {'a': pattern}}, {'a': {'$not': pattern}})
+        self.check({'$not': {'a': 1, 'b': 2}}, {'$nor': [{'a': 1, 'b': 2}]})
+        self.check({'$not': {'$or': [{'a': 1}, {'b': 2}]}}, {'$nor': [{'a': 1}, {'b': 2}]})
+        self.check({'$not': {'a': {'$near': [1, 2]}}}, {'$nor': [{'a': {'$near': [1, 2]}}]})
+
+    def test_order(self):
+        """optimizer.optimize (order)"""
+        criteria = OrderedDict([('b', 1), ('$and', [{'a': 1}]), ('c', 1)])
+        self.assertEqual(list(optimizer.optimize(criteria)), ['b', 'a', 'c'])
+        self.assertEqual(criteria, OrderedDict([('b', 1), ('$and', [{'a': 1}]), ('c', 1)]),
+                         "criteria were modified")
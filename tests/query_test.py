@@ -3,7 +3,11 @@ from __future__ import absolute_import
 import unittest
 from collections import OrderedDict
 from datetime import datetime, time
-from bearfield import query, Document, Field
+from bearfield import errors, query, Document, Field
+
+
+class SubDocument(Document):
+    index = Field(int)
 
 
 class TestQuery(unittest.TestCase):
@@ -41,12 +45,18 @@ class TestQuery(unittest.TestCase):
         # test lists
         raw = {'$or': [{'index': "12"}, {'index': 15}]}
         want = {'$or': [{'index': 12}, {'index': 15}]}
-        self.assertEqual(query.Query(raw).encode(Doc), want, "encoded query is incorrect")
+        self.assertEqual(
+            query.Query(raw).encode(Doc, optimize=False), want, "encoded query is incorrect")
+        want = {'index': {'$in': [12, 15]}}
+        self.assertEqual(query.Query(raw).encode(Doc), want, "optimized query is incorrect")
 
         # test dicts
         raw = {'$not': {'index': "12"}}
         want = {'$not': {'index': 12}}
-        self.assertEqual(query.Query(raw).encode(Doc), want, "encoded query is incorrect")
+        self.assertEqual(
+            query.Query(raw).encode(Doc, optimize=False), want, "encoded query is incorrect")
+        want = {'index': {'$ne': 12}}
+        self.assertEqual(query.Query(raw).encode(Doc), want, "optimized query is incorrect")
 
         # test raw query
         raw = {'$not': {'index': "12"}}
@@ -94,6 +104,27 @@ class TestQuery(unittest.TestCase):
         group('$or')
         group('$nor')
 
+    def test_sharing(self):
+        """Query._op (sharing)"""
+        q1 = query.Query([('a', 'aye')])
+        q2 = query.Query([('b', 'bee')])
+        q3 = q1 & q2
+        q4 = q3 & query.Query([('c', 'see')])
+        q5 = q3 | q1
+        want = OrderedDict([('$and', [q1.criteria, q2.criteria, {'c': 'see'}])])
+        self.assertEqual(q4.criteria, want, "failed to flatten queries")
+        self.assertEqual(q3.criteria, OrderedDict([('$and', [q1.criteria, q2.criteria])]))
+        self.assertEqual(q5.criteria, OrderedDict([('$or', [q3.criteria, q1.criteria])]))
+        self.assertEqual(q1.criteria, OrderedDict([('a', 'aye')]), "query was modified")
+        q6 = q4.negate().negate()
+        self.assertIsNot(q6, q4, "negated query is the original")
+        self.assertEqual(q6, q4, "negated query is incorrect")
+
+        q = query.Query(None)
+        for index in range(100):
+            q = q & query.Query({'index': index})
+        self.assertEqual(len(q.criteria['$and']), 100, "failed to flatten queries")
+
     def test_and(self):
         """Query.__and__"""
         q1 = query.Query([('a', 'aye')])
@@ -118,6 +149,21 @@ class TestQuery(unittest.TestCase):
         c2 = q1._op('$nor', q2).criteria
         self.assertEqual(c1, c2, "failed to combind queries")
 
+    def test_op_empty(self):
+        """Query._op with an empty query"""
+        q1 = query.Query([('a', 'aye')])
+        for q2 in (q1 & query.Query(None), query.Query(None) & q1, q1 | query.Query({})):
+            self.assertIsNot(q2, q1, "combined query is the operand")
+            self.assertEqual(q2, q1, "combined query is incorrect")
+            q2.criteria['b'] = 'bee'
+            self.assertEqual(q1.criteria, OrderedDict([('a', 'aye')]), "operand was modified")
+
+        q1 = query.Query({'a': 'aye'}) | query.Query({'b': 'bee'})
+        c1 = OrderedDict(q1.criteria)
+        q2 = q1 & query.Query(None)
+        q2.criteria['c'] = 'sea'
+        self.assertEqual(q1.criteria, c1, "combined operand was modified")
+
     def test_negate(self):
         """Query.negate"""
         c1 = OrderedDict([('a', 'aye')])
@@ -128,6 +174,10 @@ class TestQuery(unittest.TestCase):
         c1 = OrderedDict([])
         self.assertEqual(query.Query(c1).negate().criteria, c1, "negated query is incorrect")
 
+        q1 = query.Query(None)
+        q1.negate().criteria['a'] = 'aye'
+        self.assertEqual(q1.criteria, OrderedDict(), "negated query was modified")
+
     def test_eq(self):
         """Query.__eq__"""
         c1 = {'name': 'nope'}
@@ -142,3 +192,73 @@ class TestQuery(unittest.TestCase):
     def test_q(self):
         """Q == Query."""
         self.assertEqual(query.Q, query.Query, "shorthand query is incorrectly set")
+
+
+class TestPreparedQuery(unittest.TestCase):
+    """Test the PreparedQuery class."""
+
+    class Doc(Document):
+        index = Field(int)
+        name = Field(str)
+        tags = Field([str])
+        sub = Field(SubDocument)
+
+    def test_encode(self):
+        """PreparedQuery.encode"""
+        raw = OrderedDict([
+            ('index', {'$gt': query.Param('low'), '$lt': "20"}),
+            ('name', query.Param('name')),
+            ('tags', query.Param('tag')),
+            ('$or', [{'index': query.Param('index')}, {'name': {'$in': query.Param('names')}}]),
+        ])
+        params = {'low': "5", 'name': 12, 'tag': 3, 'index': "7", 'names': [1, "two"]}
+        prepared = self.Doc.prepare(raw)
+        self.assertIsInstance(prepared, query.PreparedQuery)
+
+        want = query.Query(query.bind_params(raw, params)).encode(self.Doc)
+        self.assertEqual(prepared.encode(**params), want, "prepared query is incorrect")
+        self.assertEqual(want, {
+            'index': {'$gt': 5, '$lt': 20},
+            'name': '12',
+            'tags': '3',
+            '$or': [{'index': 7}, {'name': {'$in': ['1', 'two']}}],
+        })
+
+        params.update(name={'$in': [1, 2]}, low=None, tag=['a', 'b'])
+        want = query.Query(query.bind_params(raw, params)).encode(self.Doc)
+        self.assertEqual(prepared.encode(**params), want, "prepared query is incorrect")
+
+        with self.assertRaises(errors.EncodingError):
+            prepared.encode(low=1)
+
+    def test_bind(self):
+        """PreparedQuery.bind"""
+        prepared = self.Doc.prepare({'index': query.Param('index')})
+        bound = prepared.bind(index="3")
+        self.assertIsInstance(bound, query.Query)
+        self.assertEqual(bound.encode(self.Doc), {'index': 3}, "bound query is incorrect")
+        self.assertIs(query.make_query(bound), bound, "bound query was copied")
+
+        prepared = self.Doc.prepare({'sub': query.Param('sub')})
+        bound = prepared.bind(sub=SubDocument(index=1))
+        self.assertEqual(bound.encode(self.Doc), {'sub': {'index': 1}})
+        combined = bound & query.Q({'index': "2"})
+        self.assertEqual(combined.encode(self.Doc), {'sub': {'index': 1}, 'index': 2},
+                         "combined query is incorrect")
+        self.assertEqual(combined.encode(self.Doc, optimize=False),
+                         {'$and': [{'sub': {'index': 1}}, {'index': 2}]},
+                         "combined query is incorrect")
+        self.assertEqual((query.Q({'index': "2"}) | bound.negate()).encode(self.Doc),
+                         {'$or': [{'index': 2}, {'sub': {'$ne': {'index': 1}}}]},
+                         "combined query is incorrect")
+        self.assertEqual(combined.copy().encode(self.Doc), combined.encode(self.Doc),
+                         "copied query is incorrect")
+        bound = prepared.bind(sub=None) | query.Q({'index': 1}) | query.Q({'index': 2})
+        want = {'$or': [{'sub': None}, {'index': {'$in': [1, 2]}}]}
+        self.assertEqual(bound.encode(self.Doc), want, "bound query was not optimized")
+
+    def test_has_params(self):
+        """query.has_params"""
+        self.assertTrue(query.has_params(query.Param('a')))
+        self.assertTrue(query.has_params({'a': [1, {'b': query.Param('b')}]}))
+        self.assertFalse(query.has_params({'a': [1, {'b': 2}]}))
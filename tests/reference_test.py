@@ -1,9 +1,11 @@
 """Tests for the reference module."""
 from __future__ import absolute_import
 from . import common
-from bearfield import Document, Field, Query, reference
+from bearfield import Document, Field, ObjectId, Query, connection, errors, reference
+from bearfield.connection import Connection
 from bearfield.cursor import Cursor
 from collections import OrderedDict
+import unittest
 
 
 class Child(Document):
@@ -150,3 +152,147 @@ class TestReference(common.TestCase):
         parent.child = None
         item = parent.child.find_one()
         self.assertIsNone(item)
+
+    def test_prefetch(self):
+        """Cursor.prefetch"""
+        children = [Child(name='child{}'.format(index)) for index in range(3)]
+        for child in children:
+            child.save()
+        Parent(name='first', child=children[0]).save()
+        Parent(name='second', child=children[1]).save()
+        Parent(name='query', child=Query({'name': 'child2'})).save()
+        Parent(name='none').save()
+
+        cursor = Parent.find(sort=[('name', 1)]).prefetch('child', ['name'])
+        parents = list(cursor)
+        found, child = parents[0].child.prefetched(['name'])
+        self.assertTrue(found, "reference was not prefetched")
+        self.assertEqual(child.name, 'child0', "prefetched document is incorrect")
+        self.assertFalse(parents[0].child.prefetched()[0], "full document was prefetched")
+        self.assertFalse(parents[2].child.prefetched()[0], "query reference was prefetched")
+        have = [parent.child.find_one(['name']) for parent in parents]
+        have = [child and child.name for child in have]
+        self.assertEqual(have, ['child0', None, 'child2', 'child1'])
+        self.assertRaises(errors.OperationError, Parent.find().prefetch, 'name')
+
+        self.remove(Child)
+        self.remove(Parent)
+
+    def test_join(self):
+        """Cursor.join"""
+        child = Child(name='child')
+        child.save()
+        Parent(name='first', child=child).save()
+        Parent(name='query', child=Query({'name': 'child'})).save()
+
+        parents = [parent for parent in Parent.find(sort=[('name', 1)]).join('child')]
+        self.assertEqual([parent.name for parent in parents], ['first', 'query'])
+        self.assertTrue(parents[0].child.prefetched()[0], "reference was not joined")
+        self.assertEqual(parents[0].child.find_one()._id, child._id)
+        self.assertFalse(parents[1].child.prefetched()[0], "query reference was joined")
+        self.assertEqual(parents[1].child.find_one()._id, child._id)
+
+        self.remove(Child)
+        self.remove(Parent)
+
+
+class TestPrefetched(unittest.TestCase):
+    """Test ReferenceFinder.prefetched."""
+
+    def test_prefetched(self):
+        """ReferenceFinder.prefetched"""
+        child = Child(name='child')
+        child._id = ObjectId()
+        parent = Parent(name='parent', child=child)
+        self.assertEqual(parent.child.prefetched(), (False, None))
+
+        parent._refs = {'child': (child._id, {'_id', 'name'}, child)}
+        self.assertEqual(parent.child.prefetched(['name']), (True, child))
+        self.assertEqual(parent.child.find_one(['name']), child)
+        self.assertEqual(parent.child.prefetched(), (False, None))
+        self.assertEqual(parent.child.prefetched(['name'], 'other'), (False, None))
+        self.assertEqual(parent.child.prefetched(['name'], options={'sort': 1}), (False, None))
+
+        parent._refs = {'child': (child._id, None, None)}
+        self.assertEqual(parent.child.find_one(), None)
+        parent.child = ObjectId()
+        self.assertEqual(parent.child.prefetched(), (False, None))
+
+
+class Aggregate(object):
+    """Collection which returns fixed aggregation results."""
+
+    def __init__(self, results):
+        self.results = results
+        self.pipelines = []
+        self._connection = Connection('mongodb://localhost/test')
+
+    def aggregate(self, pipeline, **options):
+        self.pipelines.append((pipeline, options))
+        return iter(self.results)
+
+
+class TestJoin(unittest.TestCase):
+    """Test Cursor.join."""
+
+    def setUp(self):
+        connection.add('test')
+        self.child = ObjectId()
+
+    def test_pipeline(self):
+        """Cursor.join (pipeline)"""
+        collection = Child._meta.get_collection().name
+        cursor = Cursor(Parent, Aggregate([]), {'name': 'parent'}, None, False,
+                        sort=[('name', 1)], limit=5)
+        cursor.join('child')
+        self.assertEqual(cursor._pipeline(), [
+            {'$match': {'name': 'parent'}},
+            {'$sort': {'name': 1}},
+            {'$limit': 5},
+            {'$lookup': {'from': collection, 'localField': 'child', 'foreignField': '_id',
+                         'as': '_joined_child'}},
+        ])
+
+        cursor = Cursor(Parent, Aggregate([]), None, {'_id', 'child'}, False)
+        cursor.join('child', ['name'])
+        self.assertEqual(cursor._pipeline(3, 1), [
+            {'$skip': 3},
+            {'$limit': 1},
+            {'$lookup': {
+                'from': collection,
+                'let': {'ref': '$child'},
+                'pipeline': [
+                    {'$match': {'$expr': {'$eq': ['$_id', '$$ref']}}},
+                    {'$project': {'_id': 1, 'name': 1}},
+                ],
+                'as': '_joined_child',
+            }},
+            {'$project': {'_id': 1, '_joined_child': 1, 'child': 1}},
+        ])
+        self.assertRaises(errors.OperationError, cursor.join, 'name')
+
+    def test_iter(self):
+        """Cursor.join (iter)"""
+        results = [
+            {'name': 'first', 'child': self.child,
+             '_joined_child': [{'_id': self.child, 'name': 'child'}]},
+            {'name': 'missing', 'child': ObjectId(), '_joined_child': []},
+            {'name': 'query', 'child': {'name': 'child'}, '_joined_child': []},
+        ]
+        collection = Aggregate(results)
+        cursor = Cursor(Parent, collection, None, None, False, batch_size=10).join('child')
+        parents = [parent for parent in cursor]
+        self.assertEqual(collection.pipelines[0][1], {'batchSize': 10})
+        self.assertNotIn('_joined_child', parents[0]._raw)
+
+        child = parents[0].child.find_one()
+        self.assertEqual((child._id, child.name), (self.child, 'child'))
+        self.assertEqual(parents[1].child.prefetched(), (True, None))
+        self.assertEqual(parents[2].child.prefetched(), (False, None))
+
+        collection = Aggregate(results[1:])
+        cursor = Cursor(Parent, collection, None, None, False).join('child')
+        self.assertEqual(cursor[1].name, 'missing')
+        self.assertEqual(collection.pipelines[0][0][:2], [{'$skip': 1}, {'$limit': 1}])
+        cursor = Cursor(Parent, Aggregate([]), None, None, False).join('child')
+        self.assertRaises(IndexError, cursor.__getitem__, 1)
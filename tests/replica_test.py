@@ -0,0 +1,200 @@
+"""Tests for the replica module."""
+from __future__ import absolute_import
+import re
+import time
+import unittest
+from bearfield import Document, Field, errors, replica
+from bearfield.connection import Connection
+from bson.codec_options import CodecOptions
+from bson.regex import Regex
+
+
+class Species(Document):
+    class Meta:
+        connection = 'test'
+        readonly = True
+        replica = {'indexes': ['code', 'weight']}
+
+    code = Field(str)
+    name = Field(str)
+    weight = Field(int)
+    tags = Field([str])
+
+
+class Plain(Document):
+    class Meta:
+        connection = 'test'
+        readonly = True
+
+
+class Collection(object):
+    """Collection which returns a fixed list of raw documents."""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.finds = 0
+        self.codec_options = CodecOptions()
+        self._connection = Connection('mongodb://localhost/test')
+
+    def find(self, criteria, **options):
+        self.finds += 1
+        return iter([dict(raw) for raw in self.docs])
+
+    def find_one(self, criteria, **options):
+        raise AssertionError("find_one called on collection")
+
+
+docs = [
+    {'_id': 1, 'code': 'griz', 'name': 'grizzly', 'weight': 400, 'tags': ['brown', 'big']},
+    {'_id': 2, 'code': 'pol', 'name': 'polar', 'weight': 500, 'tags': ['white', 'big']},
+    {'_id': 3, 'code': 'pan', 'name': 'panda', 'weight': 100.5, 'tags': ['black', 'white']},
+    {'_id': 4, 'code': 'sun', 'name': 'sun bear', 'tags': []},
+    {'_id': 5, 'code': 'sloth', 'weight': None, 'cubs': [{'age': 1}, {'age': 3}]},
+]
+
+
+class TestEvaluate(unittest.TestCase):
+    """Test replica.evaluate."""
+
+    def ids(self, criteria):
+        return [raw['_id'] for raw in docs if replica.evaluate(criteria, raw)]
+
+    def test_equal(self):
+        """replica.evaluate (equality)"""
+        self.assertEqual(self.ids({'code': 'pol'}), [2])
+        self.assertEqual(self.ids({'tags': 'big'}), [1, 2])
+        self.assertEqual(self.ids({'tags': ['black', 'white']}), [3])
+        self.assertEqual(self.ids({'weight': 400.0}), [1])
+        self.assertEqual(self.ids({'weight': None}), [4, 5])
+        self.assertEqual(self.ids({'cubs.age': 3}), [5])
+        self.assertEqual(self.ids({'name': re.compile('^p')}), [2, 3])
+        self.assertEqual(self.ids({'name': Regex('^P', 'i')}), [2, 3])
+        self.assertEqual(self.ids({'_id': True}), [])
+
+    def test_operators(self):
+        """replica.evaluate (operators)"""
+        self.assertEqual(self.ids({'weight': {'$gt': 100, '$lte': 400}}), [1, 3])
+        self.assertEqual(self.ids({'weight': {'$lt': 'z'}}), [])
+        self.assertEqual(self.ids({'weight': {'$ne': None}}), [1, 2, 3])
+        self.assertEqual(self.ids({'code': {'$in': ['pol', 'sun']}}), [2, 4])
+        self.assertEqual(self.ids({'code': {'$nin': ['pol', 'sun']}}), [1, 3, 5])
+        self.assertEqual(self.ids({'tags': {'$exists': False}}), [5])
+        self.assertEqual(self.ids({'tags': {'$all': ['big', 'white']}}), [2])
+        self.assertEqual(self.ids({'tags': {'$size': 0}}), [4])
+        self.assertEqual(self.ids({'name': {'$regex': 'BEAR', '$options': 'i'}}), [4])
+        self.assertEqual(self.ids({'weight': {'$not': {'$gt': 100}}}), [4, 5])
+        self.assertEqual(self.ids({'cubs': {'$elemMatch': {'age': {'$gt': 2}}}}), [5])
+        self.assertEqual(self.ids({'weight': {'$mod': [200, 100]}}), [2, 3])
+        self.assertEqual(self.ids({'$or': [{'code': 'pol'}, {'weight': 100.5}]}), [2, 3])
+        self.assertEqual(self.ids({'$nor': [{'code': 'pol'}, {'weight': None}]}), [1, 3])
+        self.assertEqual(self.ids({'$and': [{'tags': 'big'}, {'weight': {'$gt': 450}}]}), [2])
+
+    def test_unsupported(self):
+        """replica.evaluate (unsupported)"""
+        self.assertRaises(replica.UnsupportedQuery, self.ids, {'$where': 'true'})
+        self.assertRaises(replica.UnsupportedQuery, self.ids, {'name': {'$text': 'bear'}})
+
+
+class TestIndex(unittest.TestCase):
+    """Test the Index class."""
+
+    def test_lookup(self):
+        """Index.lookup"""
+        index = replica.Index('weight', docs)
+        self.assertEqual(index.lookup(400), {0})
+        self.assertEqual(index.lookup({'$eq': 500.0}), {1})
+        self.assertEqual(index.lookup({'$in': [100.5, 500]}), {1, 2})
+        self.assertEqual(index.lookup({'$gte': 100.5, '$lt': 500}), {0, 2})
+        self.assertEqual(index.lookup({'$gt': 'a'}), set())
+        self.assertIsNone(index.lookup(None))
+        self.assertIsNone(index.lookup({'$ne': 400}))
+        self.assertIsNone(index.lookup({'$gt': 1, '$lt': 'z'}))
+
+        tags = replica.Index('tags', docs)
+        self.assertEqual(tags.lookup('white'), {1, 2})
+        self.assertIsNone(tags.lookup(['black', 'white']))
+
+    def test_arrays(self):
+        """Index.lookup (arrays)"""
+        raws = [{'a': [1, 5]}, {'a': 3}, {'a': [0, 10]}, {'a': [7]}, {'a': [{'b': 3}, 4]}]
+        index = replica.Index('a', raws)
+        conditions = [
+            {'$gte': 2, '$lte': 4}, {'$gt': 0, '$lt': 2}, {'$gt': 4}, {'$lt': 1},
+            {'$gt': 6, '$lt': 8}, {'$in': [4, 7]}, 3,
+        ]
+        for condition in conditions:
+            criteria = {'a': condition}
+            scanned = [n for n, raw in enumerate(raws) if replica.evaluate(criteria, raw)]
+            indexed = sorted(n for n in index.lookup(condition)
+                             if replica.evaluate(criteria, raws[n]))
+            msg = "indexed lookup of {} is incorrect".format(condition)
+            self.assertEqual(indexed, scanned, msg)
+
+
+class TestReplica(unittest.TestCase):
+    """Test the Replica class."""
+
+    def setUp(self):
+        self.collection = Collection(docs)
+        Species._meta.get_collection = lambda connection=None: self.collection
+        self.replica = Species._meta.replica
+        self.replica.state = None
+
+    def tearDown(self):
+        del Species._meta.get_collection
+        self.replica.state = None
+        self.replica.reload = None
+
+    def test_find(self):
+        """Replica.find"""
+        found = self.replica.find({'weight': {'$gt': 100}}, ['name'], sort=[('weight', -1)],
+                                  skip=1, limit=1)
+        self.assertEqual(found, [{'_id': 1, 'name': 'grizzly'}])
+        found[0]['name'] = 'changed'
+        self.assertEqual(self.replica.find({'_id': 1}, ['name']), [{'_id': 1, 'name': 'grizzly'}])
+        self.assertEqual(self.replica.count({'tags': 'white'}), 2)
+        self.assertEqual(self.replica.count(None), 5)
+        self.assertEqual(self.collection.finds, 1)
+        self.assertRaises(replica.UnsupportedQuery, self.replica.find, {}, hint='code')
+        self.assertRaises(replica.UnsupportedQuery, self.replica.find, {}, ['cubs.age'])
+
+    def test_reload(self):
+        """Replica (reload)"""
+        now = [1000.0]
+        self.replica.clock = lambda: now[0]
+        self.replica.reload = 60
+        try:
+            self.replica.count(None)
+            self.collection.docs = docs[:2]
+            now[0] += 30
+            self.assertEqual(self.replica.count(None), 5)
+            now[0] += 31
+            self.replica.count(None)
+            for _ in range(100):
+                if not self.replica.reloading:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(self.replica.count(None), 2)
+            self.assertEqual(self.collection.finds, 2)
+        finally:
+            self.replica.clock = time.time
+
+    def test_document(self):
+        """Document (replica)"""
+        self.assertEqual([doc.name for doc in Species.find({'weight': {'$gte': 400}})],
+                         ['grizzly', 'polar'])
+        self.assertEqual(Species.find({'tags': 'big'}).count(), 2)
+        self.assertEqual(Species.find_one({'code': 'pan'}).weight, 100.5)
+        self.assertIsNone(Species.find_one({'code': 'nope'}))
+        self.assertEqual(Species.find(sort=[('name', 1)])[2].name, 'panda')
+        self.assertEqual(Species.count(), 5)
+        Species.reload_replica()
+        self.assertEqual(self.collection.finds, 2)
+
+    def test_get_replica(self):
+        """replica.get_replica"""
+        self.assertIsNone(replica.get_replica(Species, None, True))
+        self.assertEqual(replica.get_replica(Species, True, True).index_names, [])
+        self.assertRaises(errors.ConfigError, replica.get_replica, Species, True, False)
+        self.assertRaises(errors.ConfigError, replica.get_replica, Species, {'nope': 1}, True)
+        self.assertRaises(errors.OperationError, Plain.reload_replica)
@@ -0,0 +1,81 @@
+"""Tests for the scan module."""
+from __future__ import absolute_import
+import unittest
+from bearfield import scan
+
+
+class Collection(object):
+    """Collection which returns fixed aggregation results."""
+
+    def __init__(self, values):
+        self.values = values
+        self.pipeline = None
+
+    def aggregate(self, pipeline):
+        self.pipeline = pipeline
+        return [{'_id': value} for value in self.values]
+
+
+class Cursor(object):
+    """Cursor which returns fixed batches."""
+
+    def __init__(self, batches, error=None):
+        self.batches = batches
+        self.error = error
+        self.closed = False
+
+    def iter_batches(self, size):
+        for batch in self.batches:
+            yield batch
+        if self.error:
+            raise self.error
+
+    def close(self):
+        self.closed = True
+
+
+class TestFunctions(unittest.TestCase):
+    """Test module functions."""
+
+    def test_get_split_points(self):
+        """scan.get_split_points"""
+        collection = Collection([5, 3, 'other', 1, 7, 2, 8, 4, 6])
+        points = scan.get_split_points(collection, {'index': 1}, '_id', 4)
+        self.assertEqual(points, [3, 5, 7], "split points are incorrect")
+        self.assertEqual(collection.pipeline[0], {'$match': {'index': 1}})
+
+        self.assertEqual(scan.get_split_points(Collection([1, 1, 1]), None, '_id', 4), [])
+        self.assertEqual(scan.get_split_points(Collection([]), None, '_id', 4), [])
+        self.assertEqual(scan.get_split_points(Collection([1, 2]), None, '_id', 1), [])
+
+    def test_get_ranges(self):
+        """scan.get_ranges"""
+        self.assertEqual(scan.get_ranges('_id', []), [{}])
+        self.assertEqual(scan.get_ranges('_id', [3, 5]), [
+            {'_id': {'$lt': 3}},
+            {'_id': {'$gte': 3, '$lt': 5}},
+            {'_id': {'$not': {'$lt': 5}}},
+        ])
+
+    def test_run(self):
+        """scan.run"""
+        cursors = [Cursor([[1, 2]]), Cursor([[3]])]
+        have = scan.run(cursors, lambda cursor: sum(sum(batch) for batch in cursor.batches))
+        self.assertEqual(have, [3, 3], "callback results are incorrect")
+
+    def test_merge(self):
+        """scan.merge"""
+        cursors = [Cursor([[1, 2], [3]]), Cursor([[4]]), Cursor([])]
+        self.assertEqual(sorted(scan.merge(cursors, 2)), [1, 2, 3, 4], "merge is incorrect")
+        self.assertTrue(all(cursor.closed for cursor in cursors), "cursors were not closed")
+
+        cursors = [Cursor([[1]], ValueError("failed")), Cursor([[2]])]
+        self.assertRaises(ValueError, list, scan.merge(cursors, 2))
+
+    def test_merge_close(self):
+        """scan.merge (close)"""
+        cursors = [Cursor([[index] for index in range(100)]) for _ in range(2)]
+        items = scan.merge(cursors, 1)
+        next(items)
+        items.close()
+        self.assertTrue(all(cursor.closed for cursor in cursors), "cursors were not closed")
@@ -0,0 +1,115 @@
+"""Tests for the session module."""
+from __future__ import absolute_import
+from . import common
+from bearfield import Document, Field, errors, session
+from bearfield.session import ContextVar, current
+import unittest
+
+
+class ForSession(Document):
+    class Meta:
+        connection = 'test'
+    index = Field(int)
+    name = Field(str)
+
+
+class Shared(Document):
+    class Meta:
+        connection = 'test'
+        collection = 'for_session'
+    index = Field(int)
+
+
+class Disabled(Document):
+    class Meta:
+        connection = 'test'
+        disable_insert = True
+    index = Field(int)
+
+
+class TestSession(common.TestCase):
+    """Test the Session class."""
+
+    def test_flush(self):
+        """Session.flush"""
+        existing = ForSession(index=1, name='the first')
+        existing.save()
+
+        with session() as s:
+            created = ForSession(index=2, name='the second')
+            existing.name = 'the first again'
+            loaded = ForSession.find_one({'_id': existing._id})
+            self.assertEqual(len(s.documents), 2, "session did not track documents")
+            self.assertNotIn(id(loaded), s.documents, "session tracked unmodified document")
+            self.assertIsNone(created._id, "document was written before flush")
+
+        self.assertIsNotNone(created._id, "created document was not inserted")
+        self.assertEqual(existing._encode(True), {}, "updated document was not reset")
+        self.assertEqual(ForSession.count(), 2, "incorrect number of documents written")
+        doc = ForSession.find_one({'_id': existing._id})
+        self.assertEqual(doc.name, 'the first again', "dirty document was not updated")
+        self.assertEqual(loaded.name, 'the first', "loaded document was modified")
+        ForSession.find().remove()
+
+    def test_group(self):
+        """Session.group"""
+        with session() as s:
+            first = ForSession(index=1, name='the first')
+            second = Shared(index=2)
+            groups = s.group()
+            self.assertEqual(list(groups.values()), [[first, second]],
+                             "documents were not grouped by collection")
+        self.assertIsNotNone(second._id, "shared document was not inserted")
+        self.assertEqual(ForSession.count(), 2, "incorrect number of documents written")
+        ForSession.find().remove()
+
+    def test_ordered_failure(self):
+        """Session.flush (ordered failure)"""
+        with session() as s:
+            first = ForSession(index=1)
+            invalid = ForSession(index='one')
+            last = ForSession(index=3)
+            try:
+                s.flush()
+            except errors.BulkError as e:
+                self.assertEqual([doc for doc, _ in e.errors], [invalid], "errors are incorrect")
+                self.assertEqual(e.unreached, [last], "unreached documents are incorrect")
+            else:
+                self.fail("invalid document did not raise BulkError")
+            self.assertIsNotNone(first._id, "first document was not inserted")
+            self.assertIsNone(last._id, "unreached document was inserted")
+            self.assertEqual(list(s.documents.values()), [invalid, last],
+                             "failed and unreached documents were not kept")
+            s.clear()
+        self.assertEqual(ForSession.count(), 1, "incorrect number of documents written")
+        ForSession.find().remove()
+
+    @unittest.skipIf(ContextVar is None, "contextvars is not available")
+    def test_context(self):
+        """session.current (context)"""
+        from contextvars import copy_context
+
+        def enter():
+            active = session().__enter__()
+            return current() is active
+
+        with session() as outer:
+            self.assertTrue(copy_context().run(enter), "session was not activated in context")
+            self.assertIs(current(), outer, "session leaked out of its context")
+
+    def test_exception(self):
+        """Session exception handling"""
+        try:
+            with session():
+                ForSession(index=1, name='the first')
+                raise ValueError("abort")
+        except ValueError:
+            pass
+        self.assertEqual(ForSession.count(), 0, "session was flushed after exception")
+
+    def test_disabled(self):
+        """Session with disabled writes"""
+        def create():
+            with session():
+                Disabled(index=1)
+        self.assertRaises(errors.OperationError, create)
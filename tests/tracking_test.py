@@ -0,0 +1,91 @@
+"""Tests for the tracking module."""
+from __future__ import absolute_import
+import unittest
+from bearfield import tracking
+
+
+class Modified(object):
+    """Value which reports modification."""
+    def __init__(self, modified):
+        self.modified = modified
+
+    def _is_modified(self):
+        return self.modified
+
+
+class TestFunctions(unittest.TestCase):
+    """Test module functions."""
+
+    def test_is_same(self):
+        """tracking.is_same"""
+        self.assertTrue(tracking.is_same(1, 1))
+        self.assertTrue(tracking.is_same({'a': 1}, tracking.TrackedDict({'a': 1})))
+        self.assertFalse(tracking.is_same(1, True), "int and bool are the same")
+        self.assertFalse(tracking.is_same(1, 1.0), "int and float are the same")
+        self.assertFalse(tracking.is_same(None, 0))
+
+    def test_diff_value(self):
+        """tracking.diff_value"""
+        update = {}
+        tracking.diff_value('a', 1, 1, update)
+        tracking.diff_value('b', None, None, update)
+        self.assertEqual(update, {})
+        tracking.diff_value('a', 1, 2, update)
+        tracking.diff_value('b', 1, None, update)
+        self.assertEqual(update, {'$set': {'a': 2}, '$unset': {'b': ''}})
+
+
+class TestTracked(unittest.TestCase):
+    """Test the tracked containers."""
+
+    def test_list(self):
+        """tracking.TrackedList"""
+        items = tracking.TrackedList([1, 2])
+        self.assertEqual(items, [1, 2])
+        self.assertFalse(items._is_modified(), "new list is modified")
+        items.append(3)
+        self.assertTrue(items._is_modified(), "append did not modify list")
+
+        items = tracking.TrackedList([1, 2])
+        items[0] = 3
+        self.assertTrue(items._is_modified(), "item assignment did not modify list")
+
+        items = tracking.TrackedList([1, 2])
+        items += [3]
+        self.assertIsInstance(items, tracking.TrackedList)
+        self.assertTrue(items._is_modified(), "add did not modify list")
+
+    def test_set(self):
+        """tracking.TrackedSet"""
+        items = tracking.TrackedSet([1, 2])
+        self.assertFalse(items._is_modified(), "new set is modified")
+        items.add(3)
+        self.assertTrue(items._is_modified(), "add did not modify set")
+
+        items = tracking.TrackedSet([1, 2])
+        items -= {1}
+        self.assertEqual(items, {2})
+        self.assertTrue(items._is_modified(), "subtract did not modify set")
+
+    def test_dict(self):
+        """tracking.TrackedDict"""
+        items = tracking.TrackedDict({'a': 1})
+        self.assertFalse(items._is_modified(), "new dict is modified")
+        items['b'] = 2
+        self.assertTrue(items._is_modified(), "item assignment did not modify dict")
+
+        items = tracking.TrackedDict({'a': 1})
+        items.update(b=2)
+        self.assertTrue(items._is_modified(), "update did not modify dict")
+
+    def test_deep(self):
+        """tracking.Tracked(deep)"""
+        item = Modified(False)
+        items = tracking.TrackedList([item], True)
+        self.assertFalse(items._is_modified())
+        item.modified = True
+        self.assertTrue(items._is_modified(), "modified item was not detected")
+        items = tracking.TrackedDict({'a': item}, True)
+        self.assertTrue(items._is_modified(), "modified value was not detected")
+        items = tracking.TrackedList([item])
+        self.assertFalse(items._is_modified(), "shallow list checked items")
@@ -1,7 +1,7 @@
 """Tests for the types module."""
 from __future__ import absolute_import
 import unittest
-from bearfield import errors, types, Document, Field
+from bearfield import errors, tracking, types, Document, Field
 from collections import OrderedDict
 from datetime import date, datetime, time
 import six
@@ -127,6 +127,23 @@ class TestBuiltinType(unittest.TestCase):
         self.assertIsInstance(value, six.text_type, "returned value is not unicode")
         self.assertEqual(value, u'test', "returnd string value is incorrect")
 
+    def test_compile(self):
+        """BuiltinType.compile_encoder"""
+        typ = types.BuiltinType(int)
+        encode = typ.compile_encoder('test', 'test')
+        self.assertEqual(encode(12), 12, "encoded int value is incorrect")
+        self.assertEqual(encode('12'), 12, "encoded str value is incorrect")
+        self.assertIs(type(encode(True)), int, "subclass value is not converted")
+        self.assertRaises(errors.EncodingError, encode, 'nan')
+        self.assertIs(typ.compile_decoder('test', 'test'), types.identity)
+
+        class Upper(types.BuiltinType):
+            def encode(self, cls, name, value):
+                return value.upper()
+
+        encode = Upper(str).compile_encoder('test', 'test')
+        self.assertEqual(encode(u'grizzly'), u'GRIZZLY', "overridden encode is not used")
+
 
 class TestDateType(unittest.TestCase):
     """Test the DateType class."""
@@ -156,6 +173,20 @@ class TestDateType(unittest.TestCase):
         self.assertEqual(value, today.date(), "returned date value is incorrect")
         self.assertRaises(errors.EncodingError, typ.decode, 'test', 'test', 'invalid')
 
+    def test_compile(self):
+        """DateType.compile_encoder"""
+        typ = types.DateType()
+        encode = typ.compile_encoder('test', 'test')
+        decode = typ.compile_decoder('test', 'test')
+        now = datetime.now()
+        today = now.date()
+        midnight = datetime.combine(today, time(0))
+        self.assertEqual(encode(today), midnight, "encoded date value is incorrect")
+        self.assertEqual(encode(now), midnight, "encoded datetime value is incorrect")
+        self.assertRaises(errors.EncodingError, encode, 36)
+        self.assertEqual(decode(midnight), today, "decoded date value is incorrect")
+        self.assertRaises(errors.EncodingError, decode, 'invalid')
+
     def test_create(self):
         """FieldType.create(date)"""
         typ = types.FieldType.create(date)
@@ -268,6 +299,31 @@ class TestDocumentType(unittest.TestCase):
         typ = types.DocumentType(self.Doc)
         self.assertRaises(errors.ValidationError, typ.validate, 'test', 'test', value)
 
+    def test_compile(self):
+        """DocumentType.compile_encoder"""
+        typ = types.DocumentType(self.Doc)
+        encode = typ.compile_encoder('test', 'test')
+        decode = typ.compile_decoder('test', 'test')
+        raw = encode(self.Doc(index='12', name='the twelth'))
+        self.assertEqual(raw, {'index': 12, 'name': 'the twelth'}, "encoded value is incorrect")
+        self.assertRaises(errors.EncodingError, encode, 'invalid')
+        doc = decode(raw)
+        self.assertIsInstance(doc, self.Doc, "decoded value has incorrect type")
+        self.assertEqual(doc.index, 12, "decoded value is incorrect")
+        self.assertRaises(errors.EncodingError, decode, 'invalid')
+
+    def test_diff(self):
+        """DocumentType.diff"""
+        typ = types.DocumentType(self.Doc)
+        update = {}
+        old = {'index': 12, 'name': 'the twelth', 'extra': True}
+        typ.diff('test', 'test', 'sub', old, {'index': 12, 'name': 'twelve'}, update)
+        self.assertEqual(update, {'$set': {'sub.name': 'twelve'}, '$unset': {'sub.extra': ''}})
+
+        update = {}
+        typ.diff('test', 'test', 'sub', None, {'index': 12}, update)
+        self.assertEqual(update, {'$set': {'sub': {'index': 12}}})
+
 
 class TestListType(unittest.TestCase):
     """Test the ListType class."""
@@ -304,6 +360,43 @@ class TestListType(unittest.TestCase):
         have = typ.decode('test', 'test', items)
         self.assertEqual(have, items, "decoded untyped list value is incorrect")
 
+    def test_compile(self):
+        """ListType.compile_encoder"""
+        typ = types.ListType([date])
+        encode = typ.compile_encoder('test', 'test')
+        decode = typ.compile_decoder('test', 'test')
+        today = date.today()
+        midnight = datetime.combine(today, time(0))
+        self.assertEqual(encode((today,)), [midnight], "encoded typed list value is incorrect")
+        self.assertEqual(decode([midnight]), [today], "decoded typed list value is incorrect")
+
+        typ = types.ListType([int])
+        self.assertEqual(typ.compile_encoder('test', 'test')(('1', 2)), [1, 2])
+        self.assertIs(typ.compile_decoder('test', 'test'), tracking.TrackedList)
+
+    def test_diff(self):
+        """ListType.diff"""
+        typ = types.ListType([int])
+        update = {}
+        typ.diff('test', 'test', 'items', [1, 2], [1, 2, 3, 4], update)
+        self.assertEqual(update, {'$push': {'items': {'$each': [3, 4]}}})
+
+        update = {}
+        typ.diff('test', 'test', 'items', [1, 2, 3], [1, 5, 3], update)
+        self.assertEqual(update, {'$set': {'items.1': 5}})
+
+        update = {}
+        typ.diff('test', 'test', 'items', [1, 2, 3], [4, 5, 3], update)
+        self.assertEqual(update, {'$set': {'items': [4, 5, 3]}})
+
+        update = {}
+        typ.diff('test', 'test', 'items', [1, 2, 3], [1, 2], update)
+        self.assertEqual(update, {'$set': {'items': [1, 2]}})
+
+        update = {}
+        typ.diff('test', 'test', 'items', [1, 2], [1, 2], update)
+        self.assertEqual(update, {})
+
 
 class TestSetType(unittest.TestCase):
     """Test the ListType class."""
@@ -335,6 +428,25 @@ class TestSetType(unittest.TestCase):
         have = typ.decode('test', 'test', items)
         self.assertEqual(have, set(items), "decoded untyped list value is incorrect")
 
+    def test_diff(self):
+        """SetType.diff"""
+        typ = types.SetType({int})
+        update = {}
+        typ.diff('test', 'test', 'items', [1, 2], [2, 1, 3], update)
+        self.assertEqual(update, {'$addToSet': {'items': {'$each': [3]}}})
+
+        update = {}
+        typ.diff('test', 'test', 'items', [1, 2], [2], update)
+        self.assertEqual(update, {'$pull': {'items': {'$in': [1]}}})
+
+        update = {}
+        typ.diff('test', 'test', 'items', [1, 2], [2, 3], update)
+        self.assertEqual(update, {'$set': {'items': [2, 3]}})
+
+        update = {}
+        typ.diff('test', 'test', 'items', [1, 2], [2, 1], update)
+        self.assertEqual(update, {})
+
 
 class TestDictType(unittest.TestCase):
     """Test the DictType class."""
@@ -388,3 +500,15 @@ class TestDictType(unittest.TestCase):
         want = items.copy()
         typ = types.DictType(dict)
         test(typ, items, want)
+
+    def test_diff(self):
+        """DictType.diff"""
+        typ = types.DictType({'_': int})
+        update = {}
+        typ.diff('test', 'test', 'items', {'a': 1, 'b': 2}, {'a': 3, 'c': 4}, update)
+        self.assertEqual(update, {'$set': {'items.a': 3, 'items.c': 4},
+                                  '$unset': {'items.b': ''}})
+
+        update = {}
+        typ.diff('test', 'test', 'items', {'a': 1}, {'a.b': 1}, update)
+        self.assertEqual(update, {'$set': {'items': {'a.b': 1}}})
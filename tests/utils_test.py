@@ -0,0 +1,42 @@
+"""Tests for the utils module."""
+from __future__ import absolute_import
+import unittest
+from bearfield import utils
+
+
+class TestFunctions(unittest.TestCase):
+    """Test module functions."""
+
+    def test_chunks(self):
+        """utils.chunks"""
+        self.assertEqual(list(utils.chunks(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(utils.chunks([], 2)), [])
+
+    def test_apply_update(self):
+        """utils.apply_update"""
+        sub = {'name': 'sub', 'index': 1}
+        raw = {'name': 'top', 'sub': sub, 'gone': True}
+        update = {'$set': {'name': 'new', 'sub.name': 'new sub', 'other.index': 2},
+                  '$unset': {'gone': '', 'sub.index': ''}}
+        self.assertTrue(utils.apply_update(raw, update))
+        self.assertEqual(raw, {'name': 'new', 'sub': {'name': 'new sub'}, 'other': {'index': 2}})
+        self.assertEqual(sub, {'name': 'sub', 'index': 1}, "shared subdocument was modified")
+        self.assertFalse(utils.apply_update(raw, {'$inc': {'index': 1}}))
+
+    def test_apply_update_arrays(self):
+        """utils.apply_update (arrays)"""
+        items = [1, 2]
+        raw = {'items': items, 'tags': ['a'], 'subs': [{'index': 1}]}
+        update = {'$push': {'items': {'$each': [3, 4]}},
+                  '$addToSet': {'tags': {'$each': ['a', 'b', 'b']}},
+                  '$set': {'subs.0.index': 2}}
+        self.assertTrue(utils.apply_update(raw, update))
+        self.assertEqual(raw, {'items': [1, 2, 3, 4], 'tags': ['a', 'b'], 'subs': [{'index': 2}]})
+        self.assertEqual(items, [1, 2], "shared list was modified")
+
+        self.assertTrue(utils.apply_update(raw, {'$pull': {'items': {'$in': [1, 3]}}}))
+        self.assertEqual(raw['items'], [2, 4])
+        self.assertFalse(utils.apply_update(raw, {'$pull': {'items': {'$gt': 1}}}))
+        update = {'$push': {'items': {'$each': [1], '$slice': 1}}}
+        self.assertFalse(utils.apply_update(raw, update))
+        self.assertEqual(raw['items'], [2, 4])